@@ -60,8 +60,8 @@ class CERA:
 
     if self.Algorithms.startswith("TMVA:"):
       self.trainTMVAMethods()
-    # elif self.Algorithms.startswith("SKL:"):
-    #   self.trainSKLMethods()
+    elif self.Algorithms.startswith("SKL:"):
+      self.trainSKLMethods()
     elif self.Algorithms.startswith("TF:"):
       self.trainTFMethods()
     else:
@@ -70,6 +70,121 @@ class CERA:
     return
 
 
+###################################################################################################
+
+
+  def loadData(self):
+    """
+    Prepare numpy array dataset for scikit-learn models
+    """
+
+    from sklearn.model_selection import train_test_split
+
+    print("{}: retrieve from ROOT tree".format(time.time()))
+
+    # Open the file
+    DataFile = ROOT.TFile(self.Filename)
+    if DataFile.IsOpen() == False:
+      print("Error opening data file")
+      return False
+
+    # Get the data tree
+    DataTree = DataFile.Get("Quality")
+    if DataTree is None:
+      print("Error reading data tree from root file")
+      return False
+
+    Branches = DataTree.GetListOfBranches()
+
+    VariableMap = {}
+
+    # Create a map of the branches, i.e. the columns
+    for B in list(Branches):
+      if B.GetName() == "EvaluationIsReconstructable":
+        VariableMap[B.GetName()] = array.array('i', [0])
+      else:
+        VariableMap[B.GetName()] = array.array('f', [0])
+      DataTree.SetBranchAddress(B.GetName(), VariableMap[B.GetName()])
+
+    # transform data into numpy array
+
+    total_data = min(self.MaxEvents, DataTree.GetEntries())
+
+    all_features = list(VariableMap.keys())
+    all_features.remove("SequenceLength")
+    all_features.remove("SimulationID")
+    all_features.remove("EvaluationZenithAngle")
+    all_features.remove("EvaluationIsCompletelyAbsorbed")
+    all_features.remove("EvaluationIsReconstructable")
+
+    X_data = np.zeros((total_data, len(all_features)))
+    y_data = np.zeros((total_data, 1))
+
+    print("{}: start formatting array".format(time.time()))
+
+    for x in range(total_data):
+
+      if x%1000 == 0 and x > 0:
+        print("{}: Progress: {}/{}".format(time.time(), x, total_data))
+
+      DataTree.GetEntry(x)  # Get row x
+
+      X_data[x] = [VariableMap[feature][0] for feature in all_features]
+      y_data[x] = 1.0 if VariableMap["EvaluationIsReconstructable"][0] == 1 else 0.0
+
+    print("{}: finish formatting array".format(time.time()))
+
+    # Split training and testing data
+    X_train, X_test, y_train, y_test = train_test_split(X_data, y_data, test_size = 0.5, random_state = 42)
+
+    print("Data size: training: {0}, testing: {1}".format(len(y_train), len(y_test)))
+
+    return X_train, X_test, y_train, y_test
+
+
+###################################################################################################
+
+
+  def trainSKLMethods(self):
+    """
+    Main training function that runs methods through scikit-learn. Allowed: SKL:HGB
+    """
+
+    import time
+    from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score
+
+    # load training and testing data
+    X_train, X_test, y_train, y_test = self.loadData()
+
+    # Histogram-binned gradient boosting decision tree
+    if self.Algorithms == "SKL:HGB":
+      print("Running histogram-based gradient boosting ... please stand by...")
+
+      from sklearn.ensemble import HistGradientBoostingClassifier
+
+      hgb = HistGradientBoostingClassifier(max_iter=1000, learning_rate=0.1, max_bins=255, early_stopping=True, validation_fraction=0.1, n_iter_no_change=20, random_state=0)
+
+      print("{}: start training".format(time.time()))
+      hgb.fit(X_train, y_train.ravel())
+      print("Stopped after {} iterations".format(hgb.n_iter_))
+
+      print("{}: start testing".format(time.time()))
+      y_predicted = hgb.predict(X_test)
+      y_score = hgb.predict_proba(X_test)[:, 1]
+
+    else:
+      print("ERROR: Unknown algorithm: {}".format(self.Algorithms))
+      return False
+
+    print(confusion_matrix(y_test, y_predicted))
+    print(classification_report(y_test, y_predicted, target_names=["background", "signal"]))
+    print("Area under ROC curve: %.4f"%(roc_auc_score(y_test, y_score)))
+
+    return True
+
+
+###################################################################################################
+
 
   def trainTFMethods(self):
     """
@@ -59,6 +59,8 @@ class CEZA:
 
     if self.Algorithms.startswith("TMVA:"):
      self.trainTMVAMethods()
+    elif self.Algorithms.startswith("SKL:"):
+      self.trainSKLMethods()
     elif self.Algorithms.startswith("TF:"):
       self.trainTFMethods()
     else:
@@ -159,6 +161,45 @@ class CEZA:
     return X_train, X_test, y_train, y_test
 
 
+###################################################################################################
+
+
+  def trainSKLMethods(self):
+    """
+    Main training function that runs methods through scikit-learn. Allowed: SKL:HGB
+    """
+
+    import time
+    from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score
+
+    # load training and testing data
+    X_train, X_test, y_train, y_test = self.loadData()
+
+    # Histogram-binned gradient boosting decision tree
+    if self.Algorithms == "SKL:HGB":
+      print("Running histogram-based gradient boosting ... please stand by...")
+
+      from sklearn.ensemble import HistGradientBoostingClassifier
+
+      hgb = HistGradientBoostingClassifier(max_iter=1000, learning_rate=0.1, max_bins=255, early_stopping=True, validation_fraction=0.1, n_iter_no_change=20, random_state=0)
+
+      print("{}: start training".format(time.time()))
+      hgb.fit(X_train, y_train.ravel())
+      print("Stopped after {} iterations".format(hgb.n_iter_))
+
+      print("{}: start testing".format(time.time()))
+      y_predicted = hgb.predict(X_test)
+      y_score = hgb.predict_proba(X_test)[:, 1]
+
+    else:
+      print("ERROR: Unknown algorithm: {}".format(self.Algorithms))
+      return False
+
+    print(confusion_matrix(y_test, y_predicted))
+    print(classification_report(y_test, y_predicted, target_names=["background", "signal"]))
+    print("Area under ROC curve: %.4f"%(roc_auc_score(y_test, y_score)))
+
+    return True
 
 
 ###################################################################################################
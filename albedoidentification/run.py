@@ -34,7 +34,7 @@ python3 run.py --help
 parser = argparse.ArgumentParser(description='Perform training and/or testing of the event clustering machine learning tools.')
 parser.add_argument('-f', '--file', default='EC.hits4.groups3.eventclusterizer.root', help='File name used for training/testing')
 parser.add_argument('-o', '--output', default='Results', help='Prefix for the output filename and directory')
-parser.add_argument('-a', '--algorithm', default='TMVA:BDT', help='Machine learning algorithm. Allowed: TMVA:MLP, TMVA:BDT, TMVA:DNN_CPU, TMVA:DNN_GPU, SKL:SVM, SKL:MLP, SKL:RF, SKL:ADABDC')
+parser.add_argument('-a', '--algorithm', default='TMVA:BDT', help='Machine learning algorithm. Allowed: TMVA:MLP, TMVA:BDT, TMVA:DNN_CPU, TMVA:DNN_GPU, SKL:SVM, SKL:MLP, SKL:RF, SKL:ADABDC, SKL:HGB (the albedo classifiers support only SKL:HGB)')
 parser.add_argument('-m', '--maxevents', default='100000', help='Maximum number of events to use')
 parser.add_argument('-e', '--onlyevaluate', action='store_true', help='Only test the approach')
 
@@ -135,6 +135,9 @@ signal.signal(signal.SIGINT, signal_handler)
 
 # Everything ROOT related can only be loaded here otherwise it interferes with the argparse
 from EventData import EventData
+from batchprefetcher import BatchPrefetcher
+from voxelgrid import VoxelGrid, flattenEventData
+from layermetrics import LayerBuffers, LayerScore, largestValueBins, realAndPredictedLayers
 
 # Load MEGAlib into ROOT so that it is usable
 import ROOT as M
@@ -333,24 +336,12 @@ CheckPointNum = 0
 
 print("Info: Creating configuration and progress file")
 
-TestingRealLayer = np.array([])
-TestingPredictedLayer = np.array([])
-TestingUniqueZLayer = np.array([])
-TrainingRealLayer = np.array([])
-TrainingPredictedLayer = np.array([])
-TrainingUniqueZLayer = np.array([])
-
-# Helper method
-def getRealAndPredictedLayers(OutputDataSpaceSize, OutputTensor, Result, e, Event):
-    real = -1
-    predicted = -1
-    unique = Event.unique
-    predicted = np.argmax(Result[e])
-    for l in range(0, OutputDataSpaceSize):
-        if OutputTensor[e][l] > 0.5:
-            real = l
-    return real, predicted, unique
+# The input voxels: the energy of the last hit in a voxel is kept, hits outside are dropped
+Grid = VoxelGrid((XBins, YBins, ZBins), ((XMin, XMax), (YMin, YMax), (ZMin, ZMax)), Binning='width', OutOfRange='drop', Reduction='last', DType=np.float64)
 
+# Real and predicted layers of all tested and trained events, sized for one pass over the data sets
+TestingLayers = LayerBuffers(NumberOfTestingEvents)
+TrainingLayers = LayerBuffers(NumberOfTrainingEvents)
 
 BestPercentageGood = 0.0
 
@@ -359,21 +350,28 @@ def CheckPerformance():
 
   Improvement = False
 
-  TotalEvents = 0
-  BadEvents = 0
+  Score = LayerScore(OutputDataSpaceSize)
+
+  # The input and output tensor, reused for all batches
+  InputTensor = np.zeros(shape=(BatchSize, XBins, YBins, ZBins, 1))
+  OutputTensor = np.zeros(shape=(BatchSize, OutputDataSpaceSize))
 
   # Step run all the testing batches, and detrmine the percentage of correct identifications
   # Step 1: Loop over all Testing batches
   for Batch in range(0, NTestingBatches):
 
     # Step 1.1: Convert the data set into the input and output tensor
-    InputTensor = np.zeros(shape=(BatchSize, XBins, YBins, ZBins, 1))
-    OutputTensor = np.zeros(shape=(BatchSize, OutputDataSpaceSize))
+    OutputTensor.fill(0)
+    Events = TestingDataSets[Batch*BatchSize:(Batch+1)*BatchSize]
 
+    # Set all the hit locations and energies at once
+    Hits, Offsets = flattenEventData(Events)
+    InputTensor, Inside = Grid.dense(Hits, Offsets, InputTensor, ReturnInside=True)
+    HitsAdded = Grid.hitsPerEvent(Offsets, Inside)
 
     # Loop over all testing  data sets and add them to the tensor
     for e in range(0, BatchSize):
-      Event = TestingDataSets[e + Batch*BatchSize]
+      Event = Events[e]
       # Set the layer in which the event happened
 
       LayerBin = int ((Event.OriginPositionZ - ZMin) / ((ZMax- ZMin)/ ZBins) )
@@ -384,18 +382,7 @@ def CheckPerformance():
       else:
         OutputTensor[e][LayerBin] = 1
 
-      # Set all the hit locations and energies
-      SomethingAdded = False
-      for h in range(0, len(Event.X)):
-        XBin = int( (Event.X[h] - XMin) / ((XMax - XMin) / XBins) )
-        YBin = int( (Event.Y[h] - YMin) / ((YMax - YMin) / YBins) )
-        ZBin = int( (Event.Z[h] - ZMin) / ((ZMax - ZMin) / ZBins) )
-        #print("hit z bin: {} {}".format(Event.Z[h], ZBin))
-        if XBin >= 0 and YBin >= 0 and ZBin >= 0 and XBin < XBins and YBin < YBins and ZBin < ZBins:
-          InputTensor[e][XBin][YBin][ZBin][0] = Event.E[h]
-          SomethingAdded = True
-
-      if SomethingAdded == False:
+      if HitsAdded[e] == 0:
         print("Nothing added for event {}".format(Event.ID))
         Event.print()
 
@@ -407,62 +394,140 @@ def CheckPerformance():
     #print(Result[e])
     #print(OutputTensor[e])
 
-    for e in range(0, BatchSize):
-      Event = TestingDataSets[e + Batch*BatchSize]
-      TotalEvents += 1
-      IsBad = False
-      LargestValueBin = 0
-      LargestValue = OutputTensor[e][0]
-      for c in range(1, OutputDataSpaceSize) :
-        if Result[e][c] > LargestValue:
-          LargestValue = Result[e][c]
-          LargestValueBin = c
-
-      if OutputTensor[e][LargestValueBin] < 0.99:
-        BadEvents += 1
-        IsBad = True
-
-        #if math.fabs(Result[e][c] - OutputTensor[e][c]) > 0.1:
-        #  BadEvents += 1
-        #  IsBad = True
-        #  break
-
-      # Fetch real and predicted layers for testing data
-      real, predicted, uniqueZ = getRealAndPredictedLayers(OutputDataSpaceSize, OutputTensor, Result, e, Event)
-      global TestingRealLayer
-      global TestingPredictedLayer
-      global TestingUniqueZLayer
-      TestingRealLayer = np.append(TestingRealLayer, real)
-      TestingPredictedLayer = np.append(TestingPredictedLayer, predicted)
-      TestingUniqueZLayer = np.append(TestingUniqueZLayer, uniqueZ)
-
-      # Some debugging
-      if Batch == 0 and e < 500:
+    # Count the bad events and fetch the real and predicted layers for the whole batch
+    IsBad, Real, Predicted = Score.add(OutputTensor, Result)
+    UniqueZ = [ TestingDataSets[e + Batch*BatchSize].unique for e in range(0, BatchSize) ]
+    TestingLayers.append(Real, Predicted, UniqueZ)
+
+    # Some debugging
+    if Batch == 0:
+      LargestValueBins = largestValueBins(OutputTensor, Result)
+      for e in range(0, min(BatchSize, 500)):
         EventID = e + Batch*BatchSize + NTrainingBatches*BatchSize
         print("Event {}:".format(EventID))
-        if IsBad == True:
+        if IsBad[e] == True:
           print("BAD")
         else:
           print("GOOD")
         DataSets[EventID].print()
 
-        print("Results layer: {}".format(LargestValueBin))
+        print("Results layer: {}".format(LargestValueBins[e]))
         for l in range(0, OutputDataSpaceSize):
           if OutputTensor[e][l] > 0.5:
             print("Real layer: {}".format(l))
           #print(OutputTensor[e])
           #print(Result[e])
 
-  PercentageGood = 100.0 * float(TotalEvents-BadEvents) / TotalEvents
+  PercentageGood = Score.percentageGood()
 
   if PercentageGood > BestPercentageGood:
     BestPercentageGood = PercentageGood
     Improvement = True
 
   print("Percentage of good events: {:-6.2f}% (best so far: {:-6.2f}%)".format(PercentageGood, BestPercentageGood))
+  print("Percentage of events with the real layer predicted: {:-6.2f}%".format(100.0 * Score.layerAccuracy()))
 
   return Improvement
 
+# Convert the training batches in the background while the current one is trained
+
+# Number of batches prepared ahead, and threads doing it
+PrefetchDepth = 2
+PrefetchWorkers = 1
+
+def allocateTrainingBatch():
+  return np.zeros(shape=(BatchSize, XBins, YBins, ZBins, 1)), np.zeros(shape=(BatchSize, OutputDataSpaceSize))
+
+def fillTrainingBatch(Batch, Slot):
+  InputTensor, OutputTensor = Slot
+  OutputTensor.fill(0)
+
+  Events = TrainingDataSets[Batch*BatchSize:(Batch+1)*BatchSize]
+
+  # Loop over all training data sets and set the layer in which the event happened
+  for g in range(0, BatchSize):
+    Event = Events[g]
+    if Event.OriginPositionZ > ZMin and Event.OriginPositionZ < ZMax:
+      LayerBin = int ((Event.OriginPositionZ - ZMin) / ((ZMax- ZMin)/ ZBins) )
+      OutputTensor[g][LayerBin] = 1
+    else:
+      OutputTensor[g][OutputDataSpaceSize-1] = 1
+
+  # Set all the hit locations and energies at once
+  Hits, Offsets = flattenEventData(Events)
+  Grid.dense(Hits, Offsets, InputTensor)
+
+  return Batch, InputTensor, OutputTensor
+
+# The training batches in order, epoch after epoch
+TrainingBatchCounter = 0
+def selectTrainingBatch():
+  global TrainingBatchCounter
+  Batch = TrainingBatchCounter % NTrainingBatches
+  TrainingBatchCounter += 1
+  return Batch
+
+Prefetcher = BatchPrefetcher(selectTrainingBatch, fillTrainingBatch, allocateTrainingBatch, PrefetchDepth, PrefetchWorkers)
+
+
+# One fit call per iteration over all training batches, instead of one per batch
+class TrainingSequence(tf.keras.utils.Sequence):
+  """
+  The training batches of one iteration, as they come from the prefetcher. Keras has to request
+  them in order and on the main thread (shuffle=False, workers=0), since a batch is only valid
+  until the next one is requested. Requesting the current batch again (Keras peeks at the first
+  one) returns it without taking the next one from the prefetcher.
+  """
+
+  def __init__(self):
+    self.Batch = None
+    self.InputTensor = None
+    self.OutputTensor = None
+    self.TimeConverting = 0.0
+
+  def __len__(self):
+    return NTrainingBatches
+
+  def __getitem__(self, Batch):
+    if Batch != self.Batch:
+      TimerConverting = time.time()
+      self.Batch, self.InputTensor, self.OutputTensor = Prefetcher.next()
+      self.TimeConverting += time.time() - TimerConverting
+      if self.Batch != Batch:
+        raise IndexError("Training batch {} requested, but the prefetched one is {}".format(Batch, self.Batch))
+    return self.InputTensor, self.OutputTensor
+
+
+class TrainingBatchCallback(tf.keras.callbacks.Callback):
+  """
+  Record the real and predicted layers of each trained batch and take care of Ctrl-C.
+  This runs within fit, thus its time is measured to be excluded from the training time.
+  """
+
+  def __init__(self, Sequence):
+    super(TrainingBatchCallback, self).__init__()
+    self.Sequence = Sequence
+    self.TimeRecording = 0.0
+    self.Batches = 0
+
+  def on_batch_end(self, Batch, Logs=None):
+    TimerRecording = time.time()
+    Result = self.model.predict(self.Sequence.InputTensor)
+
+    # Fetch real and predicted layers for training data
+    Real, Predicted = realAndPredictedLayers(self.Sequence.OutputTensor, Result)
+    UniqueZ = [ TrainingDataSets[e + self.Sequence.Batch*BatchSize].unique for e in range(0, BatchSize) ]
+    TrainingLayers.append(Real, Predicted, UniqueZ)
+    self.TimeRecording += time.time() - TimerRecording
+    self.Batches += 1
+
+    if Interrupted == True:
+      self.model.stop_training = True
+
+
+Sequence = TrainingSequence()
+
+
 # Main training and evaluation loop
 
 TimeConverting = 0.0
@@ -477,60 +542,30 @@ while Iteration < MaxIterations:
   Iteration += 1
   print("\n\nStarting iteration {}".format(Iteration))
 
-  # Step 1: Loop over all training batches
-  for Batch in range(0, NTrainingBatches):
-
-    # Step 1.1: Convert the data set into the input and output tensor
-    TimerConverting = time.time()
-
-    InputTensor = np.zeros(shape=(BatchSize, XBins, YBins, ZBins, 1))
-    OutputTensor = np.zeros(shape=(BatchSize, OutputDataSpaceSize))
-
-    # Loop over all training data sets and add them to the tensor
-    for g in range(0, BatchSize):
-      Event = TrainingDataSets[g + Batch*BatchSize]
-      # Set the layer in which the event happened
-      if Event.OriginPositionZ > ZMin and Event.OriginPositionZ < ZMax:
-        LayerBin = int ((Event.OriginPositionZ - ZMin) / ((ZMax- ZMin)/ ZBins) )
-        OutputTensor[g][LayerBin] = 1
-      else:
-        OutputTensor[g][OutputDataSpaceSize-1] = 1
-
-      # Set all the hit locations and energies
-      for h in range(0, len(Event.X)):
-        XBin = int( (Event.X[h] - XMin) / ((XMax - XMin) / XBins) )
-        YBin = int( (Event.Y[h] - YMin) / ((YMax - YMin) / YBins) )
-        ZBin = int( (Event.Z[h] - ZMin) / ((ZMax - ZMin) / ZBins) )
-        if XBin >= 0 and YBin >= 0 and ZBin >= 0 and XBin < XBins and YBin < YBins and ZBin < ZBins:
-          InputTensor[g][XBin][YBin][ZBin][0] = Event.E[h]
-
-    TimeConverting += time.time() - TimerConverting
-
-    # Step 1.2: Perform the actual training
-    TimerTraining = time.time()
-    #print("\nStarting training for iteration {}, batch {}/{}".format(Iteration, Batch, NTrainingBatches))
-    #_, Loss = Session.run([Trainer, LossFunction], feed_dict={X: InputTensor, Y: OutputTensor})
-    History = model.fit(InputTensor, OutputTensor, validation_split=0.1)
-    Loss = History.history['loss'][-1]
-    TimeTraining += time.time() - TimerTraining
-
-    Result = model.predict(InputTensor)
-
-    for e in range(0, BatchSize):
-        Event = TrainingDataSets[e + Batch*BatchSize]
-        # Fetch real and predicted layers for training data
-        real, predicted, uniqueZ = getRealAndPredictedLayers(OutputDataSpaceSize, OutputTensor, Result, e, Event)
-        TrainingRealLayer = np.append(TrainingRealLayer, real)
-        TrainingPredictedLayer = np.append(TrainingPredictedLayer, predicted)
-        TrainingUniqueZLayer = np.append(TrainingUniqueZLayer, uniqueZ)
-
-    if Interrupted == True: break
+  # Step 1: Train on all training batches
+  # The input and output tensors are converted in the background and handed to fit by the sequence
+  # The time of fit without the batch conversion and the prediction and recording of the layers in
+  # the callback, i.e. the time which was measured around the per-batch fit calls before
+  Sequence.TimeConverting = 0.0
+  Callback = TrainingBatchCallback(Sequence)
+  TimerTraining = time.time()
+  #_, Loss = Session.run([Trainer, LossFunction], feed_dict={X: InputTensor, Y: OutputTensor})
+  History = model.fit(Sequence, epochs=1, shuffle=False, workers=0, callbacks=[Callback])
+  # The mean loss over the trained batches of this iteration - not the loss of the last batch as
+  # with one fit call per batch before
+  Loss = History.history['loss'][-1]
+  TimerTraining = time.time() - TimerTraining - Sequence.TimeConverting - Callback.TimeRecording
+
+  TimeConverting += Sequence.TimeConverting
+  TimeTraining += TimerTraining
+  # Ctrl-C stops fit early, thus only the batches which were actually trained are counted
+  print("Training steps per second: {:.2f} (recording the training layers: {:.2f} sec)".format(Callback.Batches / TimerTraining, Callback.TimeRecording))
 
   # End for all batches
 
   # Step 2: Check current performance
   TimerTesting = time.time()
-  print("\nCurrent loss: {}".format(Loss))
+  print("\nCurrent loss (mean over the iteration): {}".format(Loss))
   Improvement = CheckPerformance()
 
   if Improvement == True:
@@ -559,21 +594,15 @@ while Iteration < MaxIterations:
   print("\n\nTotal time converting per Iteration: {} sec".format(TimeConverting/Iteration))
   print("Total time training per Iteration:   {} sec".format(TimeTraining/Iteration))
   print("Total time testing per Iteration:    {} sec".format(TimeTesting/Iteration))
+  print("Batch preparation: {}".format(Prefetcher.report()))
 
 # End: for all iterations
 
+Prefetcher.close()
+
 # Store Real & Predicted Layers in FileSystem
-realPredictedLayersData = {
-    'TestingRealLayer': TestingRealLayer,
-    'TestingPredictedLayer': TestingPredictedLayer,
-    'TestingUniqueZLayer': TestingUniqueZLayer,
-    'TrainingRealLayer': TrainingRealLayer,
-    'TrainingPredictedLayer': TrainingPredictedLayer,
-    'TrainingUniqueZLayer': TrainingUniqueZLayer
-}
-
-np.save('realPredictedLayers', realPredictedLayersData)
-# loadedRealPredictedLayersData = np.load('realPredictedLayers.npy')
+np.savez('realPredictedLayers.npz', **TestingLayers.arrays('Testing'), **TrainingLayers.arrays('Training'))
+# loadedRealPredictedLayersData = np.load('realPredictedLayers.npz')
 
 #input("Press [enter] to EXIT")
 sys.exit(0)
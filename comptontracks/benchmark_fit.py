@@ -0,0 +1,142 @@
+###################################################################################################
+#
+# benchmark_fit.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import sys
+import time
+import argparse
+import numpy as np
+
+
+###################################################################################################
+
+
+"""
+Benchmarks the training steps per second of the ComptonTrackIdentification network with one
+model.fit call per batch, as originally done, against one model.fit call per iteration over a
+keras.utils.Sequence of the batches, as done now. The batches are random voxel grids of the
+default binning, thus no simulation file and no ROOT are needed, but TensorFlow is.
+For all the command line options, try:
+
+python3 benchmark_fit.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Benchmark per-batch fit calls against one fit call per iteration.')
+parser.add_argument('-b', '--batchsize', default='128', help='Batch size')
+parser.add_argument('-n', '--batches', default='20', help='Number of training batches per iteration')
+parser.add_argument('-i', '--iterations', default='2', help='Number of timed iterations')
+
+args = parser.parse_args()
+
+try:
+  import tensorflow as tf
+except ImportError:
+  print("TensorFlow is not installed - skipping the benchmark")
+  sys.exit(0)
+
+
+# Same binning as ComptonTrackIdentification
+XBins, YBins, ZBins = 32, 32, 64
+OutputDataSpaceSize = ZBins
+BatchSize = int(args.batchsize)
+NTrainingBatches = int(args.batches)
+
+Random = np.random.default_rng(0)
+
+
+def make_batch():
+  #A few hits per event and one layer per event, as the training tensors of ComptonTrackIdentification
+  InputTensor = np.zeros(shape=(BatchSize, XBins, YBins, ZBins, 1))
+  OutputTensor = np.zeros(shape=(BatchSize, OutputDataSpaceSize))
+  for g in range(0, BatchSize):
+    NHits = Random.integers(1, 10)
+    InputTensor[g, Random.integers(0, XBins, NHits), Random.integers(0, YBins, NHits), Random.integers(0, ZBins, NHits), 0] = Random.exponential(100, NHits)
+    OutputTensor[g, Random.integers(0, OutputDataSpaceSize)] = 1
+  return InputTensor, OutputTensor
+
+
+Batches = [ make_batch() for b in range(NTrainingBatches) ]
+
+
+def make_model():
+  #The network of ComptonTrackIdentification
+  input = tf.keras.layers.Input(batch_shape = (None, XBins, YBins, ZBins, 1))
+
+  conv_1 = tf.keras.layers.Conv3D(32, 5, 2, 'valid')(input)
+  batch_1 = tf.keras.layers.BatchNormalization()(conv_1)
+  max_1 = tf.keras.layers.LeakyReLU(alpha = 0.1)(batch_1)
+
+  conv_2 = tf.keras.layers.Conv3D(32, 3, 1, 'valid')(max_1)
+  batch_2 = tf.keras.layers.BatchNormalization()(conv_2)
+  max_2 = tf.keras.layers.LeakyReLU(alpha = 0.1)(batch_2)
+
+  max_pool_3d = tf.keras.layers.MaxPooling3D(pool_size = (2,2,2), strides = 2)(max_2)
+  reshape = tf.keras.layers.Flatten()(max_pool_3d)
+
+  dense_1 = tf.keras.layers.Dense(64)(reshape)
+  batch_5 = tf.keras.layers.BatchNormalization()(dense_1)
+  activation = tf.keras.layers.ReLU()(batch_5)
+
+  drop = tf.keras.layers.Dropout(0.2)(activation)
+  dense_2 = tf.keras.layers.Dense(64)(drop)
+  output = tf.keras.layers.Softmax()(dense_2)
+
+  model = tf.keras.models.Model(inputs = input, outputs = output)
+  model.compile(optimizer = 'adam', loss = 'categorical_crossentropy', metrics = ['accuracy'])
+  return model
+
+
+class TrainingSequence(tf.keras.utils.Sequence):
+  def __len__(self):
+    return NTrainingBatches
+
+  def __getitem__(self, Batch):
+    return Batches[Batch]
+
+
+def per_batch_fit(model):
+  #The original training loop: one fit call per batch
+  for InputTensor, OutputTensor in Batches:
+    History = model.fit(InputTensor, OutputTensor, validation_split=0.1, verbose=0)
+
+
+def sequence_fit(model):
+  History = model.fit(TrainingSequence(), epochs=1, shuffle=False, workers=0, verbose=0)
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+print("{} batches of {} events per iteration, {} timed iterations".format(NTrainingBatches, BatchSize, args.iterations))
+Rates = {}
+for Name, Fit in [ ("fit per batch", per_batch_fit), ("fit per iteration", sequence_fit) ]:
+  model = make_model()
+  # The first iteration builds the graph functions
+  Fit(model)
+  Start = time.perf_counter()
+  for i in range(int(args.iterations)):
+    Fit(model)
+  Rates[Name] = int(args.iterations) * NTrainingBatches / (time.perf_counter() - Start)
+  print("  {:<20} {:8.2f} steps/s".format(Name, Rates[Name]))
+
+print("Speedup: {:.2f}x".format(Rates["fit per iteration"] / Rates["fit per batch"]))
+
+
+# END
+###################################################################################################
@@ -0,0 +1,195 @@
+###################################################################################################
+#
+# benchmark_layermetrics.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from layermetrics import LayerBuffers, LayerScore, largestValueBins, realAndPredictedLayers
+
+
+###################################################################################################
+
+
+"""
+Checks that the bad event count, the percentage of good events and the real and predicted layers
+of ComptonTrackIdentification.CheckPerformance with the streaming LayerScore and the preallocated
+LayerBuffers are identical to the original per-event loops with np.append, and benchmarks both.
+For all the command line options, try:
+
+python3 benchmark_layermetrics.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the layer metrics of ComptonTrackIdentification.CheckPerformance.')
+parser.add_argument('-e', '--events', default='100000', help='Number of benchmarked testing events')
+parser.add_argument('-b', '--batchsize', default='128', help='Batch size')
+
+args = parser.parse_args()
+
+# Same output layers as ComptonTrackIdentification
+OutputDataSpaceSize = 64
+BatchSize = int(args.batchsize)
+
+Random = np.random.default_rng(0)
+
+
+class Event:
+  def __init__(self, unique):
+    self.unique = unique
+
+
+def make_testing_batches(NBatches):
+  #Softmax results and one-hot layers, some events without layer, some results with ties, some
+  #events where the real layer is 0
+  Batches = []
+  for b in range(NBatches):
+    OutputTensor = np.zeros(shape=(BatchSize, OutputDataSpaceSize))
+    Layers = Random.integers(0, OutputDataSpaceSize, BatchSize)
+    Layers[Random.random(BatchSize) < 0.05] = 0
+    HasLayer = Random.random(BatchSize) > 0.02
+    OutputTensor[np.arange(BatchSize)[HasLayer], Layers[HasLayer]] = 1
+
+    Logits = Random.normal(0, 1, (BatchSize, OutputDataSpaceSize)).astype(np.float32)
+    Logits[np.arange(BatchSize), Layers] += Random.uniform(0, 6, BatchSize).astype(np.float32)
+    Result = np.exp(Logits) / np.exp(Logits).sum(axis=1, keepdims=True)
+    Tied = Random.random(BatchSize) < 0.05
+    Result[Tied, 5] = Result[Tied].max(axis=1)
+    Events = [ Event(int(Random.integers(1, 10))) for e in range(BatchSize) ]
+    Batches.append((OutputTensor, Result, Events))
+  return Batches
+
+
+# The original helper and loop of CheckPerformance
+def getRealAndPredictedLayers(OutputDataSpaceSize, OutputTensor, Result, e, Event):
+    real = -1
+    predicted = -1
+    unique = Event.unique
+    predicted = np.argmax(Result[e])
+    for l in range(0, OutputDataSpaceSize):
+        if OutputTensor[e][l] > 0.5:
+            real = l
+    return real, predicted, unique
+
+
+def check_performance_reference(Batches):
+  TestingRealLayer = np.array([])
+  TestingPredictedLayer = np.array([])
+  TestingUniqueZLayer = np.array([])
+  TotalEvents = 0
+  BadEvents = 0
+  for OutputTensor, Result, Events in Batches:
+    for e in range(0, BatchSize):
+      TotalEvents += 1
+      IsBad = False
+      LargestValueBin = 0
+      LargestValue = OutputTensor[e][0]
+      for c in range(1, OutputDataSpaceSize) :
+        if Result[e][c] > LargestValue:
+          LargestValue = Result[e][c]
+          LargestValueBin = c
+
+      if OutputTensor[e][LargestValueBin] < 0.99:
+        BadEvents += 1
+        IsBad = True
+
+      real, predicted, uniqueZ = getRealAndPredictedLayers(OutputDataSpaceSize, OutputTensor, Result, e, Events[e])
+      TestingRealLayer = np.append(TestingRealLayer, real)
+      TestingPredictedLayer = np.append(TestingPredictedLayer, predicted)
+      TestingUniqueZLayer = np.append(TestingUniqueZLayer, uniqueZ)
+
+  PercentageGood = 100.0 * float(TotalEvents-BadEvents) / TotalEvents
+  Layers = { 'TestingRealLayer': TestingRealLayer, 'TestingPredictedLayer': TestingPredictedLayer, 'TestingUniqueZLayer': TestingUniqueZLayer }
+  return BadEvents, PercentageGood, Layers
+
+
+def check_performance(Batches, TestingLayers):
+  Score = LayerScore(OutputDataSpaceSize)
+  for OutputTensor, Result, Events in Batches:
+    IsBad, Real, Predicted = Score.add(OutputTensor, Result)
+    TestingLayers.append(Real, Predicted, [ Ev.unique for Ev in Events ])
+  return Score, TestingLayers.arrays('Testing')
+
+
+###################################################################################################
+# Equivalence check
+###################################################################################################
+
+
+Batches = make_testing_batches(40)
+ReferenceBad, ReferencePercentage, ReferenceLayers = check_performance_reference(Batches)
+# A too small capacity checks the growing of the buffers
+Score, Layers = check_performance(Batches, LayerBuffers(100))
+
+assert Score.BadEvents == ReferenceBad, "Bad events differ: {} vs {}".format(Score.BadEvents, ReferenceBad)
+assert Score.percentageGood() == ReferencePercentage, "Percentage of good events differs"
+for Name in ReferenceLayers:
+  assert np.array_equal(Layers[Name], ReferenceLayers[Name]), "{} differs".format(Name)
+
+# The confusion matrix agrees with the stored layers
+Real, Predicted = ReferenceLayers['TestingRealLayer'], ReferenceLayers['TestingPredictedLayer']
+WithLayer = Real >= 0
+assert Score.Confusion.sum() == len(Real) and Score.Confusion[-1].sum() == np.count_nonzero(~WithLayer)
+assert Score.layerAccuracy() == np.count_nonzero(Real[WithLayer] == Predicted[WithLayer]) / np.count_nonzero(WithLayer)
+for OutputTensor, Result, Events in Batches[:4]:
+  for e in range(0, BatchSize):
+    LargestValueBin = 0
+    LargestValue = OutputTensor[e][0]
+    for c in range(1, OutputDataSpaceSize) :
+      if Result[e][c] > LargestValue:
+        LargestValue = Result[e][c]
+        LargestValueBin = c
+    assert largestValueBins(OutputTensor, Result)[e] == LargestValueBin, "Results layer differs"
+
+# The stored file has the same arrays as the original pickled dictionary
+with tempfile.TemporaryDirectory() as Directory:
+  FileName = os.path.join(Directory, 'realPredictedLayers.npz')
+  np.savez(FileName, **Layers)
+  with np.load(FileName) as Loaded:
+    for Name in ReferenceLayers:
+      assert np.array_equal(Loaded[Name], ReferenceLayers[Name])
+
+print("Equivalence check passed for {} events: {} bad, {:.2f}% good, {} events without layer".format(len(Real), ReferenceBad, ReferencePercentage, np.count_nonzero(~WithLayer)))
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+NBatches = int(args.events) // BatchSize
+Batches = make_testing_batches(NBatches)
+print("\nMetrics of {} testing events in {} batches of {}".format(NBatches*BatchSize, NBatches, BatchSize))
+
+Start = time.perf_counter()
+ReferenceBad, ReferencePercentage, ReferenceLayers = check_performance_reference(Batches)
+LoopTime = time.perf_counter() - Start
+
+Start = time.perf_counter()
+Score, Layers = check_performance(Batches, LayerBuffers(NBatches*BatchSize))
+StreamingTime = time.perf_counter() - Start
+
+assert Score.BadEvents == ReferenceBad and np.array_equal(Layers['TestingRealLayer'], ReferenceLayers['TestingRealLayer'])
+
+print("  loops with np.append:     {:10.3f} s".format(LoopTime))
+print("  streaming score, buffers: {:10.3f} s   ({:.0f}x)".format(StreamingTime, LoopTime/StreamingTime))
+
+
+# END
+###################################################################################################
@@ -0,0 +1,184 @@
+###################################################################################################
+#
+# layermetrics.py
+#
+# Copyright (C) by Andreas Zoglauer, Simar Ganda, Jasper Gan, and Pranav Nagarajan.
+# All rights reserved.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import numpy as np
+
+
+###################################################################################################
+
+
+def realAndPredictedLayers(OutputTensor, Result):
+  """
+  Real and predicted layers of a batch, like getRealAndPredictedLayers for each event: the real
+  layer is the last one with an output above 0.5 (-1 if there is none), the predicted one the
+  first with the largest result
+
+  Returns
+  -------
+  numpy.ndarray
+    Real layer of each event
+  numpy.ndarray
+    Predicted layer of each event
+  """
+
+  OutputTensor = np.asarray(OutputTensor)
+  Result = np.asarray(Result)
+
+  IsReal = OutputTensor > 0.5
+  Last = OutputTensor.shape[1] - 1 - np.argmax(IsReal[:, ::-1], axis=1)
+  Real = np.where(IsReal.any(axis=1), Last, -1)
+  Predicted = np.argmax(Result, axis=1)
+
+  return Real, Predicted
+
+
+###################################################################################################
+
+
+def largestValueBins(OutputTensor, Result):
+  """
+  The results layer of CheckPerformance: the first layer c >= 1 with the largest result, if that
+  result is larger than the output of layer 0, otherwise layer 0
+  """
+
+  OutputTensor = np.asarray(OutputTensor)
+  Result = np.asarray(Result)
+
+  Largest = 1 + np.argmax(Result[:, 1:], axis=1)
+  return np.where(Result[np.arange(len(Result)), Largest] > OutputTensor[:, 0], Largest, 0)
+
+
+###################################################################################################
+
+
+class LayerScore:
+  """
+  Streaming accuracy of the layer identification: counts the good and bad events and fills the
+  confusion matrix of real against predicted layers batch by batch, without keeping the events.
+
+  Score = LayerScore(OutputDataSpaceSize)
+  for each batch:
+    IsBad, Real, Predicted = Score.add(OutputTensor, Result)
+  print(Score.percentageGood())
+
+  """
+
+  def __init__(self, NumberOfLayers):
+    self.NumberOfLayers = NumberOfLayers
+    self.TotalEvents = 0
+    self.BadEvents = 0
+    # Row NumberOfLayers counts the events without real layer
+    self.Confusion = np.zeros((NumberOfLayers + 1, NumberOfLayers), dtype=np.int64)
+
+
+  def add(self, OutputTensor, Result):
+    """
+    Add a batch. An event is bad if the output of its results layer (see largestValueBins) is
+    below 0.99.
+
+    Returns
+    -------
+    numpy.ndarray
+      Whether each event is bad
+    numpy.ndarray
+      Real layer of each event
+    numpy.ndarray
+      Predicted layer of each event
+    """
+
+    OutputTensor = np.asarray(OutputTensor)
+    Bins = largestValueBins(OutputTensor, Result)
+    IsBad = OutputTensor[np.arange(len(OutputTensor)), Bins] < 0.99
+    Real, Predicted = realAndPredictedLayers(OutputTensor, Result)
+
+    self.TotalEvents += len(IsBad)
+    self.BadEvents += int(np.count_nonzero(IsBad))
+    Rows = np.where(Real >= 0, Real, self.NumberOfLayers)
+    np.add.at(self.Confusion, (Rows, Predicted), 1)
+
+    return IsBad, Real, Predicted
+
+
+  def percentageGood(self):
+    """
+    Percentage of the events which are not bad
+    """
+
+    return 100.0 * float(self.TotalEvents - self.BadEvents) / self.TotalEvents
+
+
+  def layerAccuracy(self):
+    """
+    Fraction of the events with a real layer for which the predicted layer is the real one
+    """
+
+    WithLayer = self.Confusion[:self.NumberOfLayers].sum()
+    return np.trace(self.Confusion[:self.NumberOfLayers]) / WithLayer if WithLayer > 0 else 0.0
+
+
+###################################################################################################
+
+
+class LayerBuffers:
+  """
+  The real and predicted layers and the number of unique z positions of all evaluated events, in
+  preallocated int32 arrays. They are sized for the expected number of events, e.g. the testing
+  set, and doubled whenever they are full, instead of copying the arrays for every event.
+  """
+
+  Names = ('RealLayer', 'PredictedLayer', 'UniqueZLayer')
+
+  def __init__(self, Capacity):
+    self.Size = 0
+    self.Data = np.zeros((len(self.Names), max(1, int(Capacity))), dtype=np.int32)
+
+
+  def append(self, Real, Predicted, UniqueZ):
+    """
+    Append the values of a batch of events
+    """
+
+    N = len(Real)
+    if self.Size + N > self.Data.shape[1]:
+      Data = np.zeros((len(self.Names), max(2*self.Data.shape[1], self.Size + N)), dtype=np.int32)
+      Data[:, :self.Size] = self.Data[:, :self.Size]
+      self.Data = Data
+
+    self.Data[0, self.Size:self.Size+N] = Real
+    self.Data[1, self.Size:self.Size+N] = Predicted
+    self.Data[2, self.Size:self.Size+N] = UniqueZ
+    self.Size += N
+
+
+  def __len__(self):
+    return self.Size
+
+
+  def arrays(self, Prefix=''):
+    """
+    The filled part of the buffers as dictionary of arrays, with the names prefixed
+
+    Returns
+    -------
+    dict
+      e.g. { 'TestingRealLayer': ..., 'TestingPredictedLayer': ..., 'TestingUniqueZLayer': ... }
+    """
+
+    return { Prefix + Name: self.Data[i, :self.Size] for i, Name in enumerate(self.Names) }
+
+
+# END
+###################################################################################################
@@ -268,6 +268,22 @@ class DecayIdentification:
       # - learning rate
       # - scaling? energy value is larger but only around 1k~10k times
 
+
+    # Histogram-binned gradient boosting decision tree
+    elif self.Algorithms == "SKL:HGB":
+      print("Running histogram-based gradient boosting ... please stand by...")
+
+      from sklearn.ensemble import HistGradientBoostingClassifier
+
+      hgb = HistGradientBoostingClassifier(max_iter=1000, learning_rate=0.1, max_bins=255, early_stopping=True, validation_fraction=0.1, n_iter_no_change=20, random_state=0)
+
+      print("{}: start training".format(time.time()))
+      hgb.fit(X_train, y_train.ravel())
+      print("Stopped after {} iterations".format(hgb.n_iter_))
+
+      print("{}: start testing".format(time.time()))
+      y_predicted = hgb.predict(X_test)
+
     else:
       print("ERROR: Unknown algorithm: {}".format(self.Algorithms))
       return
@@ -26,15 +26,17 @@ import numpy as np
 import math, datetime
 from tqdm import tqdm
 
-import pickle
 from voxnet import *
 from volumetric_data import ShapeNet40Vox30
+from medianbinning import binEdges, binnedMedians, predictMedians, meanSquaredError
+from energycache import cacheFileName, readEnergyCache, writeEnergyCache
+from batchprefetcher import BatchPrefetcher
+from voxelgrid import VoxelGrid, flattenHitList
 
 import matplotlib.pyplot as plt
 from matplotlib import colors
 from matplotlib.ticker import PercentFormatter
 
-from sklearn.metrics import mean_squared_error
 
 # Fixing random state for reproducibility
 np.random.seed(19680801)
@@ -110,6 +112,13 @@ class EnergyLossEstimate:
 
     self.ZMin = 0
     self.ZMax = 48
+
+    # Voxel grid of get_batch: energies of hits in the same voxel are summed, hits outside are dropped
+    self.VoxelGrid = VoxelGrid((self.XBins, self.YBins, self.ZBins), ((self.XMin, self.XMax), (self.YMin, self.YMax), (self.ZMin, self.ZMax)), Binning='scaled', OutOfRange='drop', Reduction='sum')
+
+    # Number of training batches prepared in the background while the current one is trained, and threads doing it
+    self.PrefetchDepth = 2
+    self.PrefetchWorkers = 1
     
     #keras model development
     self.OutputDirectory = "output.txt"
@@ -255,10 +264,7 @@ class EnergyLossEstimate:
     self.EventEnergies = EventEnergies
     self.GammaEnergies = GammaEnergies
 
-    with open('EventEnergies.data', 'wb') as filehandle:
-      pickle.dump(self.EventEnergies, filehandle)
-    with open('GammaEnergies.data', 'wb') as filehandle:
-      pickle.dump(self.GammaEnergies, filehandle)
+    writeEnergyCache(cacheFileName(self.FileName), self.FileName, self.MaxEvents, self.EventEnergies, self.GammaEnergies)
      
     ceil = math.ceil(len(self.EventHits)*0.75)
     self.EventTypesTrain = self.EventTypes[:ceil]
@@ -275,14 +281,15 @@ class EnergyLossEstimate:
     return 
   
   def getEnergies(self):
-    if os.path.exists('EventEnergies.data') and os.path.exists('GammaEnergies.data'):
-      with open('EventEnergies.data', 'rb') as filehandle:
-        EventEnergies = pickle.load(filehandle)
-      with open('GammaEnergies.data', 'rb') as filehandle:
-        GammaEnergies = pickle.load(filehandle)
-      print(len(EventEnergies), len(GammaEnergies))
-      if len(EventEnergies) == len(GammaEnergies) >= self.MaxEvents:
-        return EventEnergies[:self.MaxEvents], GammaEnergies[:self.MaxEvents]
+    """
+    Measured and true gamma energies of the first MaxEvents events: from the cache of the sim file
+    if it is valid, otherwise from the sim file
+    """
+    if not self.DataLoaded:
+      Energies = readEnergyCache(cacheFileName(self.FileName), self.FileName, self.MaxEvents)
+      if Energies is not None:
+        print("Loaded {} events from {}".format(len(Energies[0]), cacheFileName(self.FileName)))
+        return Energies
 
     if not self.DataLoaded:
       self.loadData()
@@ -303,41 +310,25 @@ class medianModel:
   
     x, y = self.dataLoader.getEnergies()
     print(len(x), len(y))
-    h, xbins, ybins, _ = plt.hist2d(x, y, bins=self.numBins, norm=colors.LogNorm())
-    plt.clf()
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    xbins = binEdges(x, self.numBins)
     
     ("Loading Median Model... {} bins".format(self.numBins))
 
-    x_medians = []
-    y_medians = []
-    y_errors = []
-    for i in tqdm(range(len(xbins) - 1)):
-      data = []
-      binStart, binEnd = xbins[i], xbins[i+1]
-      for j in range(len(x)):
-        xVal, yVal = x[j], y[j]
-        if binStart <= xVal <= binEnd:
-          data.append(yVal)
-      if len(data) > 0:
-        x_medians.append(binStart)
-        y_medians.append(np.median(data))
-        y_errors.append(np.std(data))
-      
-    self.medians = x_medians, y_medians, y_errors
+    self.medians = binnedMedians(x, y, xbins)
     self.binWidth = xbins[1] - xbins[0]
     self.x, self.y = x, y
 
   def predict(self, detectedEnergy):
-    y_medians = self.medians[1]
-    whichBin = int(detectedEnergy // self.binWidth)
-    if whichBin >= len(y_medians):
-      whichBin = len(y_medians) - 1
-    return y_medians[whichBin]
+    """
+    Median gamma energy of the bin of the detected energy, which can be a number or an array
+    """
+    return predictMedians(self.medians[1], self.binWidth, detectedEnergy)
     
   def loss(self):
     x, y = self.x, self.y
-    predictions = [self.predict(detected) for detected in x]
-    ret = mean_squared_error(predictions, y)
+    predictions = self.predict(x)
+    ret = meanSquaredError(predictions, y)
     print("MSE: {}".format(ret))
     return ret
 
@@ -449,7 +440,8 @@ class tfModel:
     with open(self.dataLoader.Output + '/accuracies_labels.txt', 'w') as f:
       f.write('')
 
-    with tf.Session() as session:
+    # The next batches are voxelized in the background while the current one is trained
+    with tf.Session() as session, self.get_batch_prefetcher(self.dataLoader.BatchSize, True) as Prefetcher:
       print("Initializing global TF variables")
       session.run(tf.global_variables_initializer())
       
@@ -462,7 +454,7 @@ class tfModel:
         if batch_index > weights_decay_after and batch_index % 256 == 0:
           session.run(p['weights_decay'], feed_dict=feed_dict)
 
-        voxs, labels = self.dataLoader.get_batch(self.dataLoader.BatchSize, True)
+        voxs, labels = Prefetcher.next()
 
         tf.logging.set_verbosity(tf.logging.DEBUG)
         
@@ -475,6 +467,7 @@ class tfModel:
         if batch_index and batch_index % 8 == 0:
           print("{} batch: {}".format(datetime.datetime.now(), batch_index))
           print('learning rate: {}'.format(learning_rate))
+          print('batch preparation: {}'.format(Prefetcher.report()))
 
           feed_dict[voxnet.training] = False
           loss = session.run(p['loss'], feed_dict=feed_dict)
@@ -494,7 +487,7 @@ class tfModel:
           for x in range(num_accuracy_batches):
             #TODO://
             #replace with actual data
-            voxs, labels = self.dataLoader.get_batch(self.dataLoader.BatchSize, True)
+            voxs, labels = Prefetcher.next()
             feed_dict = {voxnet[0]: voxs, p['labels']: labels, voxnet.training: False}
             total_accuracy += session.run(p['accuracy'], feed_dict=feed_dict)
           training_accuracy = total_accuracy / num_accuracy_batches
@@ -503,7 +496,7 @@ class tfModel:
           num_accuracy_batches = 90
           total_accuracy = 0
           for x in range(num_accuracy_batches):
-            voxs, labels = self.dataLoader.get_batch(self.dataLoader.BatchSize, True)
+            voxs, labels = Prefetcher.next()
             feed_dict = {voxnet[0]: voxs, p['labels']: labels, voxnet.training: False}
             total_accuracy += session.run(p['accuracy'], feed_dict=feed_dict)
           test_accuracy = total_accuracy / num_accuracy_batches
@@ -513,7 +506,7 @@ class tfModel:
           total_correct = []
           total_wrong = []
           for x in range(num_accuracy_batches):
-            voxs, labels = self.dataLoader.get_batch(self.dataLoader.BatchSize, True)
+            voxs, labels = Prefetcher.next()
             feed_dict = {voxnet[0]: voxs, p['labels']: labels, voxnet.training: False}
             correct_prediction = session.run(p['correct_prediction'], feed_dict=feed_dict)
             for i in range(len(correct_prediction)):
@@ -718,14 +711,28 @@ class tfModel:
 
     """
 
-    rn = random.randint
     bs = batch_size
-    #xmin = -55
-    #ymin = -55
-    #zmin = 0
-    #xmax = 55
-    #ymax = 55
-    #zmax = 48
+
+    voxs = np.zeros([bs, self.dataLoader.XBins, self.dataLoader.YBins, self.dataLoader.ZBins, 1], dtype=np.float32)
+
+    return self.fill_batch(self.next_events(bs, train), voxs)
+
+
+###################################################################################################
+
+
+  def next_events(self, batch_size, train):
+    """
+    Select the next non-empty events of the training or testing set
+
+    Returns
+    -------
+    list
+      The hits of the selected events
+    list
+      The event types of the selected events
+
+    """
 
     if train:
       EventHits = self.dataLoader.EventHitsTrain
@@ -734,10 +741,9 @@ class tfModel:
       EventHits = self.dataLoader.EventHitsTest
       EventTypes = self.dataLoader.EventTypesTest
 
-    voxs = np.zeros([bs, self.dataLoader.XBins, self.dataLoader.YBins, self.dataLoader.ZBins, 1], dtype=np.float32)
-    one_hots = np.zeros([bs, self.dataLoader.MaxLabel], dtype=np.float32)
-    #fill event hits
-    for bi in range(bs):
+    Hits = []
+    Types = []
+    for bi in range(batch_size):
       self.dataLoader.LastEventIndex += 1
       if self.dataLoader.LastEventIndex == len(EventHits):
         self.dataLoader.LastEventIndex = 0
@@ -745,18 +751,61 @@ class tfModel:
         self.dataLoader.LastEventIndex += 1
         if self.dataLoader.LastEventIndex == len(EventHits):
           self.dataLoader.LastEventIndex = 0
-      for i in EventHits[self.dataLoader.LastEventIndex]:
-          xbin = (int) (((i[0] - self.dataLoader.XMin) / (self.dataLoader.XMax - self.dataLoader.XMin)) * self.dataLoader.XBins)
-          ybin = (int) (((i[1] - self.dataLoader.YMin) / (self.dataLoader.YMax - self.dataLoader.YMin)) * self.dataLoader.YBins)
-          zbin = (int) (((i[2] - self.dataLoader.ZMin) / (self.dataLoader.ZMax - self.dataLoader.ZMin)) * self.dataLoader.ZBins)
-          #print(bi, xbin, ybin, zbin)
-          voxs[bi, xbin, ybin, zbin] += i[3]
-      #fills event types
-      one_hots[bi][EventTypes[self.dataLoader.LastEventIndex]] = 1
+      Hits.append(EventHits[self.dataLoader.LastEventIndex])
+      Types.append(EventTypes[self.dataLoader.LastEventIndex])
+
+    return Hits, Types
+
+
+###################################################################################################
+
+
+  def fill_batch(self, Events, voxs):
+    """
+    Voxelize the events selected by next_events into the given, reused voxel buffer
+
+    Returns
+    -------
+    numpy.ndarray
+      The voxels (voxs)
+    numpy.ndarray
+      The one-hot event types
+
+    """
+
+    Hits, Types = Events
+
+    # Fill the event hits in one scatter over the flattened hits of the batch
+    Flat, Offsets = flattenHitList(Hits)
+    self.dataLoader.VoxelGrid.dense(Flat, Offsets, voxs)
+
+    #fills event types
+    one_hots = np.zeros([len(Types), self.dataLoader.MaxLabel], dtype=np.float32)
+    one_hots[np.arange(len(Types)), Types] = 1
       
     return voxs, one_hots
 
 
+###################################################################################################
+
+
+  def get_batch_prefetcher(self, batch_size, train):
+    """
+    Prefetcher which prepares the next batches of get_batch in background threads while the
+    current training step runs, each in its own preallocated voxel buffer
+
+    Returns
+    -------
+    BatchPrefetcher
+      Its next() returns the voxels and the one-hot event types, valid until the following call
+    """
+
+    def Allocate():
+      return np.zeros([batch_size, self.dataLoader.XBins, self.dataLoader.YBins, self.dataLoader.ZBins, 1], dtype=np.float32)
+
+    return BatchPrefetcher(lambda: self.next_events(batch_size, train), self.fill_batch, Allocate, self.dataLoader.PrefetchDepth, self.dataLoader.PrefetchWorkers)
+
+
 ###################################################################################################
 def getRealAndPredictedLayers(OutputDataSpaceSize, OutputTensor, Result, e, Event):
     real = 0
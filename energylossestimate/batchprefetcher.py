@@ -0,0 +1,229 @@
+###################################################################################################
+#
+# batchprefetcher.py
+#
+# Copyright (C) by Andreas Zoglauer, Rithwik Sudharsan, Anna Shang, Amal Metha & Caitlyn Chen.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import time
+import threading
+import collections
+
+
+###################################################################################################
+
+
+class BatchPrefetcher:
+  """
+  Prepares the next batches in background threads while the current training step runs.
+
+  A batch is made in two steps: Select() picks the content of the next batch (e.g. the event
+  indices), always called in order and one at a time, thus a stateful selection gives the same
+  batches as without prefetching. Fill(Job, Slot) then builds the batch from the selected job into
+  one of Depth + 1 preallocated slots made by Allocate(), several of these can run at once.
+  The batches are returned in the order they were selected. A returned batch is only valid until
+  the next call of next(), then its slot is refilled.
+
+  Since numpy and the TensorFlow session release the GIL in their heavy parts, threads are enough
+  to overlap the voxelization with the training step. A typical usage would look like this:
+
+  with BatchPrefetcher(Select, Fill, Allocate, Depth=2) as Prefetcher:
+    for b in range(NBatches):
+      voxs, labels = Prefetcher.next()
+      session.run(...)
+    print(Prefetcher.report())
+
+  """
+
+  def __init__(self, Select, Fill, Allocate, Depth=2, Workers=1):
+    """
+    Attributes
+    ----------
+    Select : callable
+      Select() returns the job of the next batch, called in batch order
+    Fill : callable
+      Fill(Job, Slot) builds the batch of the job in the slot and returns it
+    Allocate : callable
+      Allocate() returns one slot, i.e. the preallocated buffers of one batch
+    Depth : integer
+      Number of batches prepared ahead
+    Workers : integer
+      Number of worker threads
+    """
+
+    self.Select = Select
+    self.Fill = Fill
+    self.Depth = max(1, int(Depth))
+
+    # Depth slots are in preparation or ready, one more is held by the caller
+    self.Free = collections.deque(Allocate() for s in range(self.Depth + 1))
+    self.Ready = {}
+    self.Held = None
+    self.NextJob = 0
+    self.NextBatch = 0
+    self.Error = None
+    self.Stopped = False
+    self.Condition = threading.Condition()
+
+    # Statistics
+    self.Batches = 0
+    self.Prepared = 0
+    self.Steps = 0
+    self.StepTime = 0.0
+    self.WaitTime = 0.0
+    self.PrepareTime = 0.0
+    self.LastReturn = None
+
+    self.Threads = [ threading.Thread(target=self.work, daemon=True) for w in range(max(1, int(Workers))) ]
+    for Thread in self.Threads:
+      Thread.start()
+
+
+  def work(self):
+    """
+    Worker thread: take a free slot, select and fill the next batch
+    """
+
+    while True:
+      with self.Condition:
+        while not self.Stopped and self.Error is None and len(self.Free) == 0:
+          self.Condition.wait()
+        if self.Stopped or self.Error is not None:
+          return
+        Slot = self.Free.popleft()
+        Number = self.NextJob
+        self.NextJob += 1
+        Start = time.perf_counter()
+        try:
+          Job = self.Select()
+        except BaseException as e:
+          self.Error = e
+          self.Condition.notify_all()
+          return
+
+      try:
+        Batch = self.Fill(Job, Slot)
+      except BaseException as e:
+        with self.Condition:
+          self.Error = e
+          self.Condition.notify_all()
+        return
+
+      with self.Condition:
+        self.Ready[Number] = (Slot, Batch)
+        self.PrepareTime += time.perf_counter() - Start
+        self.Prepared += 1
+        self.Condition.notify_all()
+
+
+  def next(self):
+    """
+    Return the next batch, waiting for it if it is not ready yet. The slot of the previously
+    returned batch is released.
+    """
+
+    with self.Condition:
+      Now = time.perf_counter()
+      if self.LastReturn is not None:
+        self.StepTime += Now - self.LastReturn
+        self.Steps += 1
+      if self.Held is not None:
+        self.Free.append(self.Held)
+        self.Held = None
+        self.Condition.notify_all()
+
+      while self.NextBatch not in self.Ready:
+        if self.Error is not None:
+          raise self.Error
+        if self.Stopped:
+          raise RuntimeError("The batch prefetcher has been closed")
+        self.Condition.wait()
+
+      self.Held, Batch = self.Ready.pop(self.NextBatch)
+      self.NextBatch += 1
+      self.LastReturn = time.perf_counter()
+      # The first batch cannot be prepared ahead, its wait is not counted
+      if self.NextBatch > 1:
+        self.WaitTime += self.LastReturn - Now
+        self.Batches += 1
+
+    return Batch
+
+
+  def close(self):
+    """
+    Stop the worker threads after their current batch
+    """
+
+    with self.Condition:
+      self.Stopped = True
+      self.Condition.notify_all()
+    for Thread in self.Threads:
+      Thread.join()
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, Type, Value, Traceback):
+    self.close()
+
+
+  def statistics(self):
+    """
+    Timing statistics in seconds per batch
+
+    Returns
+    -------
+    dict
+      batches: number of counted batches, step: time of the caller between two batches, prepare: time to select and fill a batch,
+      wait: time the caller waited for a batch after the first one, overlap: fraction of the
+      preparation time hidden behind the steps
+    """
+
+    with self.Condition:
+      Step = self.StepTime / self.Steps if self.Steps > 0 else 0.0
+      Prepare = self.PrepareTime / self.Prepared if self.Prepared > 0 else 0.0
+      Wait = self.WaitTime / self.Batches if self.Batches > 0 else 0.0
+
+    Overlap = min(1.0, max(0.0, 1.0 - Wait / Prepare)) if Prepare > 0 else 0.0
+    return { 'batches': self.Batches, 'step': Step, 'prepare': Prepare, 'wait': Wait, 'overlap': Overlap }
+
+
+  def resetStatistics(self):
+    """
+    Restart the statistics, e.g. after the first batches which allocate the buffers
+    """
+
+    with self.Condition:
+      self.Batches = 0
+      self.Prepared = 0
+      self.Steps = 0
+      self.StepTime = 0.0
+      self.WaitTime = 0.0
+      self.PrepareTime = 0.0
+      if self.LastReturn is not None:
+        self.LastReturn = time.perf_counter()
+
+
+  def report(self):
+    """
+    One line summary of the statistics
+    """
+
+    S = self.statistics()
+    return "Batches: {}   step: {:.1f} ms   preparation: {:.1f} ms   waiting: {:.1f} ms   overlap: {:.0f}%".format(S['batches'], 1000*S['step'], 1000*S['prepare'], 1000*S['wait'], 100*S['overlap'])
+
+
+# END
+###################################################################################################
@@ -0,0 +1,157 @@
+###################################################################################################
+#
+# benchmark_medianmodel.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import time
+import pickle
+import argparse
+import numpy as np
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib import colors
+
+from medianbinning import binEdges, binnedMedians, predictMedians, meanSquaredError
+
+
+###################################################################################################
+
+
+"""
+Checks that the vectorized medians, predictions and loss of medianModel are bit-identical to the
+original loops, on the stored EventEnergies.data/GammaEnergies.data and on synthetic events with
+values on the bin edges, and benchmarks both.
+For all the command line options, try:
+
+python3 benchmark_medianmodel.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the median model of EnergyLossEstimate.')
+parser.add_argument('-e', '--events', default='1000000', help='Number of synthetic events')
+parser.add_argument('-b', '--bins', default='100', help='Number of bins')
+
+args = parser.parse_args()
+
+Random = np.random.default_rng(0)
+
+
+def median_model_reference(x, y, numBins):
+  #The original medianModel.__init__, predict and loss (mean_squared_error written out as in sklearn)
+  h, xbins, ybins, _ = plt.hist2d(x, y, bins=numBins, norm=colors.LogNorm())
+  plt.clf()
+
+  x_medians = []
+  y_medians = []
+  y_errors = []
+  for i in range(len(xbins) - 1):
+    data = []
+    binStart, binEnd = xbins[i], xbins[i+1]
+    for j in range(len(x)):
+      xVal, yVal = x[j], y[j]
+      if binStart <= xVal <= binEnd:
+        data.append(yVal)
+    if len(data) > 0:
+      x_medians.append(binStart)
+      y_medians.append(np.median(data))
+      y_errors.append(np.std(data))
+  binWidth = xbins[1] - xbins[0]
+
+  def predict(detectedEnergy):
+    whichBin = int(detectedEnergy // binWidth)
+    if whichBin >= len(y_medians):
+      whichBin = len(y_medians) - 1
+    return y_medians[whichBin]
+
+  predictions = [predict(detected) for detected in x]
+  loss = np.average(np.average((np.array(predictions).reshape(-1, 1) - np.array(y).reshape(-1, 1)) ** 2, axis=0))
+  return (x_medians, y_medians, y_errors), predictions, loss
+
+
+def median_model(x, y, numBins):
+  x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+  xbins = binEdges(x, numBins)
+  medians = binnedMedians(x, y, xbins)
+  predictions = predictMedians(medians[1], xbins[1] - xbins[0], x)
+  return medians, predictions, meanSquaredError(predictions, y)
+
+
+def synthetic_events(n, numBins):
+  #Flat gamma energies, a fraction of it measured, some events without hits, some on the bin edges
+  y = Random.uniform(2000, 5000000, n)
+  x = np.minimum(y * Random.beta(2, 5, n), 3999999)
+  x[Random.random(n) < 0.1] = 0
+  # The histogram range is thus exactly 0 to 4000000
+  x[0] = 4000000
+  Edges = np.linspace(0, 4000000, numBins + 1)
+  OnEdge = Random.random(n) < 0.01
+  x[OnEdge] = Edges[Random.integers(0, numBins + 1, np.sum(OnEdge))]
+  return list(x), list(y)
+
+
+def check(x, y, numBins, name):
+  Reference = median_model_reference(x, y, numBins)
+  Vectorized = median_model(x, y, numBins)
+  assert len(Reference[0][0]) > 0
+  for a, b, what in [ (Reference[0][0], Vectorized[0][0], "bin starts"), (Reference[0][1], Vectorized[0][1], "medians"), (Reference[0][2], Vectorized[0][2], "errors") ]:
+    assert np.array_equal(np.array(a), np.array(b)), "{} differ for {} with {} bins".format(what, name, numBins)
+  assert np.array_equal(np.array(Reference[1]), Vectorized[1]), "Predictions differ for {} with {} bins".format(name, numBins)
+  assert Reference[2] == Vectorized[2], "Loss differs for {} with {} bins: {} vs {}".format(name, numBins, Reference[2], Vectorized[2])
+  assert predictMedians(Vectorized[0][1], binEdges(x, numBins)[1] - binEdges(x, numBins)[0], x[1]) == Reference[1][1], "Scalar prediction differs"
+
+
+###################################################################################################
+# Equivalence checks
+###################################################################################################
+
+
+with open('EventEnergies.data', 'rb') as filehandle:
+  EventEnergies = pickle.load(filehandle)
+with open('GammaEnergies.data', 'rb') as filehandle:
+  GammaEnergies = pickle.load(filehandle)
+
+for numBins in [ 100, 500, 1000 ]:
+  check(EventEnergies, GammaEnergies, numBins, "EventEnergies.data")
+  check(*synthetic_events(20000, numBins), numBins, "synthetic events")
+print("Medians, errors, predictions and loss are bit-identical for EventEnergies.data and synthetic events")
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+NumBins = int(args.bins)
+x, y = synthetic_events(int(args.events), NumBins)
+
+Start = time.perf_counter()
+Reference = median_model_reference(x, y, NumBins)
+LoopTime = time.perf_counter() - Start
+
+Start = time.perf_counter()
+Vectorized = median_model(x, y, NumBins)
+VectorTime = time.perf_counter() - Start
+
+assert Reference[2] == Vectorized[2], "Loss differs"
+
+print("\nMedian model with {} events and {} bins: fit, predict and loss".format(len(x), NumBins))
+print("  loops:      {:10.2f} s".format(LoopTime))
+print("  vectorized: {:10.2f} s   ({:.0f}x)".format(VectorTime, LoopTime/VectorTime))
+
+
+# END
+###################################################################################################
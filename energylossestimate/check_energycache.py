@@ -0,0 +1,139 @@
+###################################################################################################
+#
+# check_energycache.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import os
+import time
+import pickle
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+from energycache import cacheFileName, readEnergyCache, writeEnergyCache
+import energycache
+
+
+###################################################################################################
+
+
+"""
+Checks the invalidation of the energy cache of EnergyLossEstimate.getEnergies (changed sim file,
+changed schema, too few events, truncated file), the partial loading of the first events, and
+compares the load time with the former pickled lists.
+For all the command line options, try:
+
+python3 check_energycache.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check the energy cache of EnergyLossEstimate.')
+parser.add_argument('-e', '--events', default='1000000', help='Number of cached events')
+parser.add_argument('-k', '--partial', default='10000', help='Number of events of the partial load')
+
+args = parser.parse_args()
+
+NEvents = int(args.events)
+Random = np.random.default_rng(0)
+Directory = tempfile.mkdtemp()
+os.chdir(Directory)
+
+# A fake sim file and its energies, as lists like in loadData
+SimFile = os.path.join(Directory, "Test.inc1.id1.sim.gz")
+with open(SimFile, 'wb') as f:
+  f.write(Random.bytes(3 << 20))
+EventEnergies = Random.uniform(0, 5e6, NEvents).tolist()
+GammaEnergies = Random.uniform(2e3, 5e6, NEvents).tolist()
+Cache = cacheFileName(SimFile)
+
+
+###################################################################################################
+# Checks
+###################################################################################################
+
+
+writeEnergyCache(Cache, SimFile, NEvents, EventEnergies, GammaEnergies)
+assert [ f for f in os.listdir(Directory) if f.endswith('.tmp') ] == [], "Temporary file left behind"
+
+Energies = readEnergyCache(Cache, SimFile, NEvents)
+assert np.array_equal(Energies[0], EventEnergies) and np.array_equal(Energies[1], GammaEnergies), "Full load differs"
+K = int(args.partial)
+Energies = readEnergyCache(Cache, SimFile, K)
+assert np.array_equal(Energies[0], EventEnergies[:K]) and np.array_equal(Energies[1], GammaEnergies[:K]), "Partial load differs"
+
+# More events requested than cached: invalid, unless the sim file had no more events
+assert readEnergyCache(Cache, SimFile, NEvents + 1) is None, "Too small cache accepted"
+writeEnergyCache(Cache, SimFile, 2*NEvents, EventEnergies, GammaEnergies)
+assert len(readEnergyCache(Cache, SimFile, 2*NEvents)[0]) == NEvents, "Cache of the complete sim file rejected"
+
+# A changed sim file (same size, changed end), a different schema version, a truncated cache
+with open(SimFile, 'r+b') as f:
+  f.seek(-10, os.SEEK_END)
+  f.write(b'0123456789')
+assert readEnergyCache(Cache, SimFile, K) is None, "Cache of a changed sim file accepted"
+
+writeEnergyCache(Cache, SimFile, NEvents, EventEnergies, GammaEnergies)
+energycache.SchemaVersion += 1
+assert readEnergyCache(Cache, SimFile, K) is None, "Cache with an old schema accepted"
+energycache.SchemaVersion -= 1
+
+with open(Cache, 'r+b') as f:
+  f.truncate(os.path.getsize(Cache) // 2)
+assert readEnergyCache(Cache, SimFile, K) is None, "Truncated cache accepted"
+
+print("All cache checks passed")
+
+
+###################################################################################################
+# Load times
+###################################################################################################
+
+
+writeEnergyCache(Cache, SimFile, NEvents, EventEnergies, GammaEnergies)
+with open('EventEnergies.data', 'wb') as filehandle:
+  pickle.dump(EventEnergies, filehandle)
+with open('GammaEnergies.data', 'wb') as filehandle:
+  pickle.dump(GammaEnergies, filehandle)
+
+
+def load_pickle():
+  #The former getEnergies
+  with open('EventEnergies.data', 'rb') as filehandle:
+    x = pickle.load(filehandle)
+  with open('GammaEnergies.data', 'rb') as filehandle:
+    y = pickle.load(filehandle)
+  return x[:K], y[:K]
+
+
+def timeit(function, repeats=5):
+  Start = time.perf_counter()
+  for r in range(repeats):
+    function()
+  return (time.perf_counter() - Start) / repeats
+
+
+print("\nLoad {} events ({} for the partial load):".format(NEvents, K))
+print("  pickled lists:         {:8.1f} ms".format(1000*timeit(load_pickle)))
+print("  cache, all events:     {:8.1f} ms".format(1000*timeit(lambda: readEnergyCache(Cache, SimFile, NEvents))))
+print("  cache, first {:<8}  {:8.1f} ms".format(K, 1000*timeit(lambda: readEnergyCache(Cache, SimFile, K))))
+print("  thereof the fingerprint of the {:.0f} MB sim file: {:.1f} ms".format(os.path.getsize(SimFile)/1e6, 1000*timeit(lambda: energycache.sourceFingerprint(SimFile))))
+
+os.chdir('/')
+shutil.rmtree(Directory)
+
+
+# END
+###################################################################################################
@@ -0,0 +1,158 @@
+###################################################################################################
+#
+# energycache.py
+#
+# Copyright (C) by Andreas Zoglauer, Rithwik Sudharsan, Anna Shang, Amal Metha & Caitlyn Chen.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import os
+import hashlib
+import zipfile
+import tempfile
+import numpy as np
+
+
+###################################################################################################
+
+
+# Increase whenever the content or the meaning of the cached arrays changes
+SchemaVersion = 1
+
+# Number of bytes hashed at the beginning and at the end of the sim file
+FingerprintBytes = 1 << 20
+
+
+###################################################################################################
+
+
+def cacheFileName(FileName):
+  """
+  Name of the cache of a sim file: one cache per sim file, in the current directory
+  """
+
+  return os.path.basename(FileName) + ".energies.npz"
+
+
+###################################################################################################
+
+
+def sourceFingerprint(FileName):
+  """
+  SHA-256 of the size and the first and last MB of the sim file. Hashing the full file (often
+  several GB) would take longer than reading the cache; this still detects any regenerated or
+  replaced file.
+  """
+
+  Hash = hashlib.sha256()
+  Size = os.path.getsize(FileName)
+  Hash.update(str(Size).encode())
+  with open(FileName, 'rb') as f:
+    Hash.update(f.read(FingerprintBytes))
+    if Size > FingerprintBytes:
+      f.seek(max(FingerprintBytes, Size - FingerprintBytes))
+      Hash.update(f.read())
+
+  return Hash.hexdigest()
+
+
+###################################################################################################
+
+
+def writeEnergyCache(CacheFile, FileName, MaxEvents, EventEnergies, GammaEnergies):
+  """
+  Store the measured and the true gamma energies with a header (schema version, fingerprint of the
+  sim file, maximum and actual number of events) in an uncompressed .npz file. The file is written
+  under a temporary name and then renamed, thus it is either complete or not there.
+  """
+
+  Directory = os.path.dirname(os.path.abspath(CacheFile))
+  Handle, Temporary = tempfile.mkstemp(dir=Directory, suffix='.tmp')
+  try:
+    with os.fdopen(Handle, 'wb') as f:
+      np.savez(f, schema=np.int64(SchemaVersion), source=np.array(sourceFingerprint(FileName)),
+               max_events=np.int64(MaxEvents), events=np.int64(len(EventEnergies)),
+               EventEnergies=np.asarray(EventEnergies, dtype=np.float64),
+               GammaEnergies=np.asarray(GammaEnergies, dtype=np.float64))
+    os.replace(Temporary, CacheFile)
+  except BaseException:
+    os.remove(Temporary)
+    raise
+
+
+###################################################################################################
+
+
+def readArrayPrefix(Archive, Name, Count):
+  """
+  Read only the first Count entries of a 1D array stored uncompressed in an .npz archive
+  """
+
+  with Archive.open(Name + '.npy') as f:
+    Version = np.lib.format.read_magic(f)
+    if Version == (1, 0):
+      Shape, FortranOrder, DType = np.lib.format.read_array_header_1_0(f)
+    else:
+      Shape, FortranOrder, DType = np.lib.format.read_array_header_2_0(f)
+    Count = min(Count, Shape[0])
+    return np.frombuffer(f.read(Count * DType.itemsize), dtype=DType, count=Count).copy()
+
+
+###################################################################################################
+
+
+def readEnergyCache(CacheFile, FileName, MaxEvents):
+  """
+  Read the first MaxEvents measured and true gamma energies from the cache, reading only these
+  from disk. The cache is used only if it has the current schema, was made from the same sim file,
+  and contains at least MaxEvents events or all events of the sim file.
+
+  Returns
+  -------
+  tuple
+    The energy arrays, or None if there is no valid cache
+  """
+
+  if not os.path.exists(CacheFile):
+    return None
+  if not os.path.exists(FileName):
+    print("Cache {}: sim file {} not found, the cache cannot be validated".format(CacheFile, FileName))
+    return None
+
+  try:
+    with zipfile.ZipFile(CacheFile) as Archive:
+      with Archive.open('schema.npy') as f:
+        Schema = int(np.lib.format.read_array(f))
+      if Schema != SchemaVersion:
+        print("Cache {}: schema version {} instead of {}, ignoring it".format(CacheFile, Schema, SchemaVersion))
+        return None
+      with Archive.open('source.npy') as f:
+        Source = str(np.lib.format.read_array(f))
+      with Archive.open('max_events.npy') as f:
+        CachedMaxEvents = int(np.lib.format.read_array(f))
+      with Archive.open('events.npy') as f:
+        Events = int(np.lib.format.read_array(f))
+
+      if Source != sourceFingerprint(FileName):
+        print("Cache {}: made from a different version of {}, ignoring it".format(CacheFile, FileName))
+        return None
+      if Events < MaxEvents and Events >= CachedMaxEvents:
+        print("Cache {}: only {} of {} requested events, ignoring it".format(CacheFile, Events, MaxEvents))
+        return None
+
+      return readArrayPrefix(Archive, 'EventEnergies', MaxEvents), readArrayPrefix(Archive, 'GammaEnergies', MaxEvents)
+  except (zipfile.BadZipFile, KeyError, ValueError) as e:
+    print("Cache {}: unreadable ({}), ignoring it".format(CacheFile, e))
+    return None
+
+
+# END
+###################################################################################################
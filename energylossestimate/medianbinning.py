@@ -0,0 +1,111 @@
+###################################################################################################
+#
+# medianbinning.py
+#
+# Copyright (C) by Andreas Zoglauer, Rithwik Sudharsan, Anna Shang, Amal Metha & Caitlyn Chen.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import numpy as np
+
+
+###################################################################################################
+
+
+def binEdges(x, numBins):
+  """
+  The x bin edges of plt.hist2d(x, y, bins=numBins): numBins equal bins from min(x) to max(x)
+  """
+
+  return np.histogram_bin_edges(np.asarray(x, dtype=np.float64), bins=numBins)
+
+
+###################################################################################################
+
+
+def binnedMedians(x, y, xbins):
+  """
+  Median and standard deviation of the y values in each x bin, in O(N log N) instead of one
+  scan over all events per bin. As in the original loop a bin contains all values with
+  binStart <= x <= binEnd, i.e. values on an inner edge are part of both neighboring bins, and
+  the values of a bin are kept in event order, thus the results are bit-identical.
+
+  Returns
+  -------
+  list
+    Start of each non-empty bin
+  list
+    Median y of each non-empty bin
+  list
+    Standard deviation of y of each non-empty bin
+  """
+
+  x = np.asarray(x, dtype=np.float64)
+  y = np.asarray(y, dtype=np.float64)
+  numBins = len(xbins) - 1
+  Events = np.arange(len(x))
+
+  # Bin with xbins[k] <= x < xbins[k+1], and the lower bin for values on an edge
+  k = np.searchsorted(xbins, x, side='right') - 1
+  Inside = (x >= xbins[0]) & (x <= xbins[-1])
+  Lower = Inside & (k >= 1) & (x == xbins[np.clip(k, 0, numBins)])
+  Upper = Inside & (k < numBins)
+  Bin = np.concatenate((k[Upper], k[Lower] - 1))
+  Event = np.concatenate((Events[Upper], Events[Lower]))
+
+  Order = np.lexsort((Event, Bin))
+  Bin = Bin[Order]
+  Values = y[Event[Order]]
+  Counts = np.bincount(Bin, minlength=numBins)
+  NonEmpty = np.flatnonzero(Counts)
+  Groups = np.split(Values, np.cumsum(Counts)[:-1])
+
+  # Medians from the sorted values of each bin: the middle one, or the mean of the middle two
+  Sorted = Values[np.lexsort((Values, Bin))]
+  Starts = (np.cumsum(Counts) - Counts)[NonEmpty]
+  Medians = (Sorted[Starts + (Counts[NonEmpty] - 1) // 2] + Sorted[Starts + Counts[NonEmpty] // 2]) / 2
+
+  x_medians = [ xbins[i] for i in NonEmpty ]
+  y_medians = list(Medians)
+  y_errors = [ np.std(Groups[i]) for i in NonEmpty ]
+
+  return x_medians, y_medians, y_errors
+
+
+###################################################################################################
+
+
+def predictMedians(y_medians, binWidth, detectedEnergy):
+  """
+  The median of bin int(detectedEnergy // binWidth), the last one for larger energies.
+  detectedEnergy can be a number or an array.
+  """
+
+  y_medians = np.asarray(y_medians)
+  whichBin = np.floor_divide(detectedEnergy, binWidth).astype(np.int64)
+  whichBin = np.minimum(whichBin, len(y_medians) - 1)
+  return y_medians[whichBin]
+
+
+###################################################################################################
+
+
+def meanSquaredError(predictions, y):
+  """
+  Mean squared error, computed like sklearn.metrics.mean_squared_error
+  """
+
+  Errors = (np.asarray(predictions, dtype=np.float64) - np.asarray(y, dtype=np.float64)) ** 2
+  return np.average(np.average(Errors.reshape(-1, 1), axis=0))
+
+
+# END
+###################################################################################################
@@ -0,0 +1,70 @@
+###################################################################################################
+#
+# BenchmarkBoosting.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import time
+import argparse
+import numpy as np
+
+from sklearn.datasets import make_classification
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import roc_auc_score
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import AdaBoostClassifier, HistGradientBoostingClassifier
+
+
+###################################################################################################
+
+
+"""
+Compare the training time and the ROC AUC of the AdaBoost'ed decision tree (SKL:ADABDC) and the
+histogram-based gradient boosting (SKL:HGB) on a synthetic data set with the shape of the
+40-feature quality data set used in EnergyLoss.py. For all the command line options, try:
+
+python3 BenchmarkBoosting.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Benchmark the boosted decision tree backends on a synthetic data set.')
+parser.add_argument('-m', '--maxevents', default='100000', help='Number of synthetic events (half for training, half for testing)')
+parser.add_argument('-s', '--skipadaboost', action='store_true', help='Only run the histogram-based gradient boosting')
+
+args = parser.parse_args()
+
+# Same shape as X_data in EnergyLoss.loadData: 40 features, binary target, 50/50 split
+X_data, y_data = make_classification(n_samples=int(args.maxevents), n_features=40, n_informative=20, n_redundant=10, random_state=0)
+X_train, X_test, y_train, y_test = train_test_split(X_data, y_data, test_size = 0.5, random_state = 0)
+
+Classifiers = {}
+if args.skipadaboost == False:
+  Classifiers["ADABDC"] = AdaBoostClassifier(DecisionTreeClassifier(max_depth=8, min_samples_leaf=0.01), algorithm='SAMME', n_estimators=800, learning_rate=0.1)
+Classifiers["HGB"] = HistGradientBoostingClassifier(max_iter=1000, learning_rate=0.1, max_bins=255, early_stopping=True, validation_fraction=0.1, n_iter_no_change=20, random_state=0)
+
+print("{:<8} {:>14} {:>14} {:>10}".format("Method", "Training [s]", "Testing [s]", "ROC AUC"))
+for Name, Classifier in Classifiers.items():
+  Timer = time.time()
+  Classifier.fit(X_train, y_train)
+  TrainingTime = time.time() - Timer
+
+  Timer = time.time()
+  y_score = Classifier.predict_proba(X_test)[:, 1]
+  TestingTime = time.time() - Timer
+
+  print("{:<8} {:>14.1f} {:>14.1f} {:>10.4f}".format(Name, TrainingTime, TestingTime, roc_auc_score(y_test, y_score)))
+
+
+# END
+###################################################################################################
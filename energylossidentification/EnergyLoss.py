@@ -219,111 +219,251 @@ class EnergyLossIdentification:
     return X_train, X_test, y_train, y_test
 
 
+###################################################################################################
+
+
+  def loadDataMemoryMapped(self):
+    """
+    Prepare the numpy array dataset for the tensorflow models as memory-mapped files 
+    (OutputPrefix + ".X.npy" and OutputPrefix + ".y.npy"), thus data sets larger than the memory 
+    can be used. The events are stored in the order of the split of loadData, i.e. of
+    train_test_split(test_size=0.5, random_state=0), training events first.
+    Existing files are only reused if their header (OutputPrefix + ".data.json") matches the
+    ROOT file (name, size, modification time) and MaxEvents.
+    
+    Returns
+    -------
+    (numpy.memmap, numpy.memmap, integer)
+      The features, the targets, and the number of training events. The first events are
+      used for training, the remaining ones for testing.
+    """
+    import time
+    import json
+    import numpy as np
+
+    # Open the file
+    DataFile = ROOT.TFile(self.FileName)
+    if DataFile.IsOpen() == False:
+      print("Error opening data file")
+      return False
+
+    # Get the data tree
+    DataTree = DataFile.Get("Quality")
+    if DataTree == 0:
+      print("Error reading data tree from root file")
+      return False
+
+    total_data = min(self.MaxEvents, DataTree.GetEntries())
+    NumberOfTrainingEvents = total_data // 2
+
+    XFileName = self.OutputPrefix + ".X.npy"
+    YFileName = self.OutputPrefix + ".y.npy"
+    HeaderFileName = self.OutputPrefix + ".data.json"
+
+    # Everything the stored data depends on - a different file or MaxEvents requires a rebuild
+    Stat = os.stat(self.FileName)
+    Header = { "Version": 1, "FileName": os.path.abspath(self.FileName), "FileSize": Stat.st_size, "FileMTime": Stat.st_mtime_ns, "MaxEvents": self.MaxEvents, "Events": total_data, "Split": "train_test_split(test_size=0.5, random_state=0)" }
+
+    if os.path.isfile(XFileName) and os.path.isfile(YFileName) and os.path.isfile(HeaderFileName):
+      try:
+        with open(HeaderFileName) as HeaderFile:
+          StoredHeader = json.load(HeaderFile)
+      except ValueError:
+        StoredHeader = None
+      if StoredHeader == Header:
+        X_data = np.load(XFileName, mmap_mode='r')
+        y_data = np.load(YFileName, mmap_mode='r')
+        if X_data.shape[0] == total_data and y_data.shape[0] == total_data:
+          print("Using the existing memory-mapped data set {}".format(XFileName))
+          return X_data, y_data, NumberOfTrainingEvents
+      print("The memory-mapped data set {} is outdated - recreating it".format(XFileName))
+
+    # The header is only written once the data is complete
+    if os.path.isfile(HeaderFileName):
+      os.remove(HeaderFileName)
+
+    # Same split as loadData: train_test_split puts the permuted events [0, test size) into the
+    # test set and the remaining ones into the training set. The events are written at their
+    # position in the split, thus both sets are contiguous and read block by block.
+    NumberOfTestEvents = total_data - NumberOfTrainingEvents
+    Permutation = np.random.RandomState(0).permutation(total_data)
+    Order = np.concatenate((Permutation[NumberOfTestEvents:], Permutation[:NumberOfTestEvents]))
+    Position = np.empty(total_data, dtype=np.int64)
+    Position[Order] = np.arange(total_data)
+
+    print("{}: retrieve from ROOT tree".format(time.time()))
+
+    Branches = DataTree.GetListOfBranches()
+
+    VariableMap = {}
+
+    # Create a map of the branches, i.e. the columns
+    for B in list(Branches):
+      if B.GetName() == "EvaluationIsCompletelyAbsorbed":
+        VariableMap[B.GetName()] = array.array('i', [0])
+      else:
+        VariableMap[B.GetName()] = array.array('f', [0])
+      DataTree.SetBranchAddress(B.GetName(), VariableMap[B.GetName()])
+
+    all_features = list(VariableMap.keys())
+    all_features.remove("SequenceLength")
+    all_features.remove("SimulationID")
+    all_features.remove("EvaluationIsReconstructable")
+    all_features.remove("EvaluationZenithAngle")
+    all_features.remove("EvaluationIsCompletelyAbsorbed") #y
+
+    X_data = np.lib.format.open_memmap(XFileName, mode='w+', dtype=np.float32, shape=(total_data, len(all_features)))
+    y_data = np.lib.format.open_memmap(YFileName, mode='w+', dtype=np.float32, shape=(total_data, 2))
+
+    print("{}: start formatting array".format(time.time()))
+
+    for x in range(0, total_data):
+
+      if x%1000 == 0 and x > 0:
+        print("{}: Progress: {}/{}".format(time.time(), x, total_data))
+
+      DataTree.GetEntry(x)  # Get row x
+
+      p = Position[x]
+      X_data[p] = [VariableMap[feature][0] for feature in all_features]
+
+      if VariableMap["EvaluationIsCompletelyAbsorbed"][0] == 1:
+        y_data[p] = [1.0, 0.0]
+      else:
+        y_data[p] = [0.0, 1.0]
+
+    X_data.flush()
+    y_data.flush()
+
+    with open(HeaderFileName, "w") as HeaderFile:
+      json.dump(Header, HeaderFile, indent=2)
+
+    print("{}: finish formatting array".format(time.time()))
+
+    del X_data, y_data
+    return np.load(XFileName, mmap_mode='r'), np.load(YFileName, mmap_mode='r'), NumberOfTrainingEvents
+
+
+###################################################################################################
+
+
+  def createTFDataSet(self, X_data, y_data, Start, Stop, BatchSize, Shuffle):
+    """
+    Create a tf.data pipeline delivering fixed-size minibatches of the events Start ... Stop-1.
+    Only blocks of consecutive events are read from the (memory-mapped) arrays, thus the memory 
+    usage is independent of the data set size.
+
+    Attributes
+    ----------
+    X_data, y_data : numpy arrays
+      The features and targets, usually memory-mapped
+    Start, Stop : integer
+      The range of events to use
+    BatchSize : integer
+      The number of events per minibatch
+    Shuffle : bool
+      If True, the order of the blocks is shuffled, and the events within a shuffle buffer
+
+    Returns
+    -------
+    tf.data.Dataset
+      The dataset, delivering (features, targets) batches
+    """
+    import tensorflow as tf
+    import numpy as np
+
+    BlockSize = 16*BatchSize
+    ShuffleBufferSize = 8*BlockSize
+
+    def readBlock(BlockStart):
+      BlockStop = min(BlockStart + BlockSize, Stop)
+      return np.asarray(X_data[BlockStart:BlockStop], dtype=np.float32), np.asarray(y_data[BlockStart:BlockStop], dtype=np.float32)
+
+    def readBlockOP(BlockStart):
+      XBlock, YBlock = tf.py_func(readBlock, [BlockStart], [tf.float32, tf.float32], stateful=False)
+      XBlock.set_shape([None, X_data.shape[1]])
+      YBlock.set_shape([None, y_data.shape[1]])
+      return XBlock, YBlock
+
+    DataSet = tf.data.Dataset.from_tensor_slices(np.arange(Start, Stop, BlockSize, dtype=np.int64))
+    if Shuffle == True:
+      DataSet = DataSet.shuffle(buffer_size=(Stop - Start) // BlockSize + 1)
+    DataSet = DataSet.map(readBlockOP, num_parallel_calls=2)
+    DataSet = DataSet.flat_map(lambda XBlock, YBlock: tf.data.Dataset.from_tensor_slices((XBlock, YBlock)))
+    if Shuffle == True:
+      DataSet = DataSet.shuffle(buffer_size=ShuffleBufferSize)
+    DataSet = DataSet.batch(BatchSize, drop_remainder=Shuffle)
+    DataSet = DataSet.prefetch(2)
+
+    return DataSet
+
+
 ###################################################################################################
 
 
   def trainSKLMethods(self):
+    """
+    Train and test the scikit-learn methods. Multiple methods can be given separated by comma 
+    (e.g. "SKL:SVM,MLP,RF,ADABDC"), they are then fitted concurrently in separate processes,
+    which share the feature matrices via read-only memory-mapped files. The CPU cores are
+    divided among them. The fit and predict times are stored in OutputPrefix + ".skl.json".
+    """
     import time
+    import json
+    import shutil
+    import tempfile
     import numpy as np
+    import multiprocessing as mp
 
-    from sklearn import datasets
-    #from sklearn.cross_validation import train_test_split
-    from sklearn.tree import DecisionTreeClassifier
-    from sklearn.ensemble import AdaBoostClassifier, RandomForestClassifier
     from sklearn.metrics import classification_report, roc_auc_score
     from sklearn.metrics import classification_report,confusion_matrix
 
+    Methods = self.Algorithms[len("SKL:"):].split(",")
+    for Method in Methods:
+      if not Method in SKLMethods:
+        print("ERROR: Unknown algorithm: SKL:{}".format(Method))
+        return
+
     # load training and testing data
     X_train, X_test, y_train, y_test = self.loadData()
+    y_train = y_train.ravel()
+    y_test = y_test.ravel()
 
+    Cores = mp.cpu_count()
+    Jobs = max(1, Cores // len(Methods))
 
-    # SVM
-    if self.Algorithms == "SKL:SVM":
-      print("Running support vector machine ... please stand by...")
-      from sklearn.svm import SVC
-
-      svclassifier = SVC(kernel='linear')
-      svclassifier.fit(X_train, y_train)
-      y_predicted = svclassifier.predict(X_test)
-      print(svclassifier)
-      # print("Training set score: %f" % mlp.score(X_train, y_train))
-      # print("Test set score: %f" % mlp.score(X_test, y_test))
-      print(confusion_matrix(y_test, y_predicted))
-
-
-    # Run the multi-layer perceptron
-    elif self.Algorithms == "SKL:MLP":
-      print("Running multi-layer perceptron ... please stand by...")
-
-      from sklearn.neural_network import MLPClassifier
-
-      mlp = MLPClassifier(solver='lbfgs', alpha=1e-5, activation='logistic', hidden_layer_sizes=(100, 50, 30), random_state=0)
-      # MLPClassifier supports only the Cross-Entropy loss function
-      # feature scaling
-      from sklearn.preprocessing import StandardScaler
-      scaler = StandardScaler()
-      # Fit only to the training data
-      scaler.fit(X_train)
-      X_train = scaler.transform(X_train)
-      X_test = scaler.transform(X_test)
-
-      mlp.fit(X_train, y_train)
-      y_predicted=mlp.predict(X_test)
-      #[coef.shape for coef in mlp.coefs_]
-      print(mlp)
-      print("Training set score: %f" % mlp.score(X_train, y_train))
-      print("Test set score: %f" % mlp.score(X_test, y_test))
-      print(confusion_matrix(y_test,y_predicted))
-      #print(classification_report(y_test,predictions))
-
-
-    # Run the random forrest
-    elif self.Algorithms == "SKL:RF":
-      print("Running random forrest ... please stand by...")
-
-      rf=RandomForestClassifier(n_estimators=1400, criterion ='entropy', random_state=0,bootstrap=False, min_samples_leaf=0.01, max_features='sqrt', min_samples_split=5, max_depth=11)
-      rf.fit(X_train, y_train)
-      y_predicted = rf.predict(X_test)
-
-
-    # ADABoosting decision tree
-    elif self.Algorithms == "SKL:ADABDC":
-      print("Running ADABoost'ed decision tree ... please stand by...")
-
-      dt = DecisionTreeClassifier(max_depth=8, min_samples_leaf=0.01)
-      bdt = AdaBoostClassifier(dt,
-                           algorithm='SAMME',
-                           n_estimators=800,
-                           learning_rate=0.1)
-      """from sklearn.model_selection import GridSearchCV
-      parameters = {"max_depth":range(3,20),"min_samples_leaf":np.arange(0.01,0.5, 0.03)}
-      clf = GridSearchCV(DecisionTreeClassifier(), parameters, n_jobs=4)
-      clf.fit(X=X_data, y=y_data)
-      tree_model = clf.best_estimator_
-      print (clf.best_score_, clf.best_params_)
-      return"""
-      #cross_val_score(clf, iris.data, iris.target, cv=10)
-      # train
-      print("{}: start training".format(time.time()))
-      bdt.fit(X_train, y_train)
-
-      # test
-      print("{}: start testing".format(time.time()))
-      y_predicted = bdt.predict(X_test)
-
-
-
-      # parameter adjustments
-      # - learning rate
-      # - scaling? energy value is larger but only around 1k~10k times
-
+    if len(Methods) == 1:
+      AllResults = [ fitSKLMethod(Methods[0], X_train, X_test, y_train, y_test, Jobs) ]
     else:
-      print("ERROR: Unknown algorithm: {}".format(self.Algorithms))
-      return
+      # Store the data once, every process maps it read-only instead of receiving its own copy.
+      # The files are only needed while the pool runs, thus they go into a temporary directory next to the output
+      DataDirectory = tempfile.mkdtemp(prefix=os.path.basename(self.OutputPrefix) + ".skl_data.", dir=os.path.dirname(os.path.abspath(self.OutputPrefix)))
+      try:
+        for Name, Data in zip(["X_train", "X_test", "y_train", "y_test"], [X_train, X_test, y_train, y_test]):
+          np.save(os.path.join(DataDirectory, Name + ".npy"), Data)
+
+        print("{}: start training {} in {} processes with {} cores each".format(time.time(), ", ".join(Methods), len(Methods), Jobs))
+        pool = mp.Pool(len(Methods))
+        try:
+          AllResults = pool.starmap(fitSKLMethodFromFiles, [ (Method, DataDirectory, Jobs) for Method in Methods ])
+        finally:
+          pool.close()
+          pool.join()
+      finally:
+        shutil.rmtree(DataDirectory, ignore_errors=True)
 
     # evaluate (roc curve)
-    print(classification_report(y_test, y_predicted, target_names=["background", "signal"]))
-    print("Area under ROC curve: %.4f"%(roc_auc_score(y_test, y_predicted)))
+    Summary = { "Cores": Cores, "TrainingEvents": len(y_train), "TestEvents": len(y_test), "Methods": {} }
+    for Method, (y_predicted, FitTime, PredictTime) in zip(Methods, AllResults):
+      print("\nSKL:{} - fit: {:.1f} sec, predict: {:.1f} sec".format(Method, FitTime, PredictTime))
+      print(confusion_matrix(y_test, y_predicted))
+      print(classification_report(y_test, y_predicted, target_names=["background", "signal"]))
+      ROC = roc_auc_score(y_test, y_predicted)
+      print("Area under ROC curve: %.4f"%(ROC))
+      Summary["Methods"][Method] = { "Jobs": Jobs, "FitTime": FitTime, "PredictTime": PredictTime, "ROCAUC": ROC }
+
+    with open(self.OutputPrefix + ".skl.json", "w") as ResultsFile:
+      json.dump(Summary, ResultsFile, indent=2)
 
 
 ###################################################################################################
@@ -336,21 +476,42 @@ class EnergyLossIdentification:
     mpl.use('TkAgg')
     import matplotlib.pyplot as plt
     import time
-    X_train, X_test, y_train, y_test = self.loadData()
+    import resource
+
+    if self.Algorithms == "TF:NN":
+      # The neural network is trained with minibatches streamed from memory-mapped files
+      X_data, y_data, NumberOfTrainingEvents = self.loadDataMemoryMapped()
+    else:
+      X_train, X_test, y_train, y_test = self.loadData()
+      X_data, y_data = X_train, y_train
     # DATA SET PARAMETERS
     # Get our dimensions for our different variables and placeholders:
-    numFeatures = X_train.shape[1]
+    numFeatures = X_data.shape[1]
     # numLabels = number of classes we are predicting (here just 2: good or bad)
-    numLabels = y_train.shape[1]
+    numLabels = y_data.shape[1]
 
     if self.Algorithms == "TF:NN":
-      MaxIterations = 500
-      # Placeholders
+      MaxIterations = 50000
+      BatchSize = 1024
+
+      print("      ... input pipelines ...")
+      TrainingDataSet = self.createTFDataSet(X_data, y_data, 0, NumberOfTrainingEvents, BatchSize, True).repeat()
+      TrainingIterator = TrainingDataSet.make_one_shot_iterator()
+      TestDataSet = self.createTFDataSet(X_data, y_data, NumberOfTrainingEvents, X_data.shape[0], BatchSize, False)
+      TestIterator = TestDataSet.make_initializable_iterator()
+
+      # The network reads its batches directly from the pipeline selected by the handle, thus the
+      # batches are not copied through Python and the prefetching overlaps with the training step.
+      # The shapes are the ones of the test pipeline, whose last batch can be smaller
+      Handle = tf.placeholder(tf.string, shape=[], name="Handle")
+      Batch = tf.data.Iterator.from_string_handle(Handle, TestDataSet.output_types, TestDataSet.output_shapes).get_next()
+
+      # Placeholders, which default to the pipeline batch, but can still be fed
       InputDataSpaceSize=numFeatures
       OutputDataSpaceSize=numLabels
       print("      ... placeholders ...")
-      X = tf.placeholder(tf.float32, [None, InputDataSpaceSize], name="X")
-      Y = tf.placeholder(tf.float32, [None, OutputDataSpaceSize], name="Y")
+      X = tf.placeholder_with_default(Batch[0], [None, InputDataSpaceSize], name="X")
+      Y = tf.placeholder_with_default(Batch[1], [None, OutputDataSpaceSize], name="Y")
 
 
       # Layers: 1st hidden layer X1, 2nd hidden layer X2, etc.
@@ -382,6 +543,7 @@ class EnergyLossIdentification:
       print("      ... session ...")
       sess = tf.Session()
       sess.run(tf.global_variables_initializer())
+      TrainingHandle, TestHandle = sess.run([TrainingIterator.string_handle(), TestIterator.string_handle()])
 
       print("      ... writer ...")
       writer = tf.summary.FileWriter("OUT_ToyModel2DGauss", sess.graph)
@@ -406,14 +568,33 @@ class EnergyLossIdentification:
       TimesNoImprovement = 0
       BestMeanSquaredError = sys.float_info.max
 
-      def CheckPerformance():
-        global TimesNoImprovement
-        global BestMeanSquaredError
+      # Per-batch sums, accumulated over all test minibatches
+      BatchSquaredError_OP = tf.nn.l2_loss(Output - Y)
+      BatchCorrect_OP = tf.reduce_sum(tf.cast(correct_predictions_OP, "float"))
+      BatchEvents_OP = tf.shape(X)[0]
 
-        MeanSquaredError = sess.run(tf.nn.l2_loss(Output - y_test),  feed_dict={X: X_test})
+      def CheckPerformance():
+        SquaredError = 0.0
+        Correct = 0.0
+        Events = 0
+
+        sess.run(TestIterator.initializer)
+        while True:
+          try:
+            BatchSquaredError, BatchCorrect, BatchEvents = sess.run([BatchSquaredError_OP, BatchCorrect_OP, BatchEvents_OP], feed_dict={Handle: TestHandle})
+          except tf.errors.OutOfRangeError:
+            break
+          SquaredError += BatchSquaredError
+          Correct += BatchCorrect
+          Events += BatchEvents
+
+        MeanSquaredError = 2*SquaredError/Events
 
         print("Iteration {} - MSE of test data: {}".format(Iteration, MeanSquaredError))
-        print("final accuracy on test set: %s" %str(sess.run(accuracy_OP, feed_dict={X: X_test, Y: y_test})))
+        print("Accuracy on test set: {}".format(Correct/Events))
+        print("Peak memory usage: {:.1f} MB".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024))
+
+        return MeanSquaredError
 
 
       # Main training and evaluation loop
@@ -422,15 +603,24 @@ class EnergyLossIdentification:
         # Take care of Ctrl-C
         #if Interrupted == True: break
 
-        # Train
-        sess.run(Trainer, feed_dict={X: X_train, Y: y_train})
+        # Train - the training pipeline repeats, thus it only ends if the data set is empty
+        try:
+          sess.run(Trainer, feed_dict={Handle: TrainingHandle})
+        except tf.errors.OutOfRangeError:
+          print("ERROR: No training data")
+          break
 
         # Check performance: Mean squared error
-        if Iteration > 0 and Iteration % 20 == 0:
-          CheckPerformance()
-
-        if TimesNoImprovement == 100:
-          print("No improvement for 30 rounds")
+        if Iteration > 0 and Iteration % 500 == 0:
+          MeanSquaredError = CheckPerformance()
+          if MeanSquaredError < BestMeanSquaredError:
+            BestMeanSquaredError = MeanSquaredError
+            TimesNoImprovement = 0
+          else:
+            TimesNoImprovement += 1
+
+        if TimesNoImprovement == 10:
+          print("No improvement for 10 checks")
           break;
 
     # logistic regression
@@ -781,6 +971,151 @@ class EnergyLossIdentification:
     return True
 
 
+###################################################################################################
+
+
+  def sweepBDTNTrees(self, NTrees):
+    """
+    Train one BDT with the largest number of trees in NTrees, and evaluate the ROC integral
+    for all other numbers of trees using only the first k trees of this ensemble.
+    Since boosting adds one tree after the other, the first k trees are identical to a BDT
+    trained with k trees, thus this replaces one training per entry in NTrees.
+    The other BDT parameters are taken from setBDTValues.
+
+    Attributes
+    ----------
+    NTrees : list of integers
+      The number of trees to evaluate
+
+    Returns
+    -------
+    dict
+      Number of trees -> ROC integral, empty in case of an error
+
+    """
+
+    if self.Algorithms.startswith("TMVA:"):
+      return self.sweepTMVABDTNTrees(NTrees)
+    elif self.Algorithms.startswith("SKL:"):
+      return self.sweepSKLBDTNTrees(NTrees)
+    else:
+      print("ERROR: No BDT sweep for algorithm: {}".format(self.Algorithms))
+
+    return {}
+
+
+###################################################################################################
+
+
+  def sweepSKLBDTNTrees(self, NTrees):
+    """
+    Sweep the number of trees of the scikit-learn AdaBoost'ed decision tree via staged_predict_proba
+    """
+    import time
+    from sklearn.tree import DecisionTreeClassifier
+    from sklearn.ensemble import AdaBoostClassifier
+    from sklearn.metrics import roc_auc_score
+
+    X_train, X_test, y_train, y_test = self.loadData()
+    y_train = y_train.ravel()
+    y_test = y_test.ravel()
+
+    dt = DecisionTreeClassifier(max_depth=self.BDT_MaxDepth, min_samples_leaf=self.BDT_MinNodeSize/100.0)
+    bdt = AdaBoostClassifier(dt, algorithm='SAMME', n_estimators=max(NTrees), learning_rate=self.BDT_AdaBoostBeta)
+
+    print("{}: start training {} trees".format(time.time(), max(NTrees)))
+    bdt.fit(X_train, y_train)
+
+    print("{}: start testing".format(time.time()))
+    Results = {}
+    LastProbability = None
+    for Trees, y_probability in enumerate(bdt.staged_predict_proba(X_test), start=1):
+      LastProbability = y_probability
+      if Trees in NTrees:
+        ROC = roc_auc_score(y_test, y_probability[:, 1])
+        Results[Trees] = ROC
+        print("{} trees: {}".format(Trees, ROC))
+
+    # AdaBoost stops early when the training data is perfectly separated - larger ensembles are
+    # identical to the last stage, which is not necessarily one of the evaluated ones
+    if LastProbability is not None and len(Results) < len(set(NTrees)):
+      ROC = roc_auc_score(y_test, LastProbability[:, 1])
+      for Trees in NTrees:
+        if Trees not in Results:
+          Results[Trees] = ROC
+          print("{} trees: {} (stopped after {} trees)".format(Trees, ROC, len(bdt.estimators_)))
+
+    return Results
+
+
+###################################################################################################
+
+
+  def sweepTMVABDTNTrees(self, NTrees):
+    """
+    Sweep the number of trees of the TMVA BDT: Train once, then evaluate the test tree of the
+    results file with the first k trees of the booked BDT
+    """
+    import numpy as np
+    from sklearn.metrics import roc_auc_score
+
+    self.BDT_NTrees = max(NTrees)
+    if self.trainTMVAMethods() == False:
+      return {}
+
+    ResultsFile = ROOT.TFile(self.OutputPrefix + ".root")
+    if ResultsFile.IsOpen() == False:
+      print("Error opening results file")
+      return {}
+
+    TestTree = ResultsFile.Get(self.OutputPrefix + "/TestTree")
+    if TestTree == 0:
+      print("Error reading test tree from results file")
+      return {}
+
+    IgnoredBranches = [ 'SimulationID', 'SequenceLength']
+    Reader = ROOT.TMVA.Reader("!Color:Silent")
+
+    # Spectators and variables have to be added in the same order as during training
+    VariableMap = {}
+    for Name in IgnoredBranches:
+      VariableMap[Name] = array.array('f', [0])
+      TestTree.SetBranchAddress(Name, VariableMap[Name])
+      Reader.AddSpectator(Name, VariableMap[Name])
+
+    DataFile = ROOT.TFile(self.FileName)
+    for B in list(DataFile.Get("Quality").GetListOfBranches()):
+      if not B.GetName() in IgnoredBranches:
+        if not B.GetName().startswith("Evaluation"):
+          VariableMap[B.GetName()] = array.array('f', [0])
+          TestTree.SetBranchAddress(B.GetName(), VariableMap[B.GetName()])
+          Reader.AddVariable(B.GetName(), VariableMap[B.GetName()])
+
+    ClassID = array.array('i', [0])
+    TestTree.SetBranchAddress("classID", ClassID)
+
+    BDT = Reader.BookMVA("BDT", ROOT.TString(self.OutputPrefix + "/weights/TMVAClassification_BDT.weights.xml"))
+
+    # TMVA assigns class ID 0 to signal
+    IsSignal = np.zeros(TestTree.GetEntries())
+    MVAValues = np.zeros((len(NTrees), TestTree.GetEntries()))
+    for e in range(0, TestTree.GetEntries()):
+      TestTree.GetEntry(e)
+      IsSignal[e] = 1.0 if ClassID[0] == 0 else 0.0
+
+      # Setting up the event for the method with the full evaluation, then evaluating only the first k trees
+      Reader.EvaluateMVA("BDT")
+      for t, Trees in enumerate(NTrees):
+        MVAValues[t, e] = BDT.GetMvaValue(ROOT.nullptr, ROOT.nullptr, Trees)
+
+    Results = {}
+    for t, Trees in enumerate(NTrees):
+      Results[Trees] = roc_auc_score(IsSignal, MVAValues[t])
+      print("{} trees: {}".format(Trees, Results[Trees]))
+
+    return Results
+
+
 ###################################################################################################
 
 
@@ -800,5 +1135,106 @@ class EnergyLossIdentification:
 
 
 
+###################################################################################################
+
+
+SKLMethods = [ "SVM", "MLP", "RF", "ADABDC", "HGB" ]
+
+
+def fitSKLMethod(Method, X_train, X_test, y_train, y_test, Jobs):
+  """
+  Fit one of the scikit-learn methods and predict the test data
+
+  Attributes
+  ----------
+  Method : string
+    One of SKLMethods
+  X_train, X_test, y_train, y_test : numpy arrays
+    The training and test data
+  Jobs : integer
+    The number of CPU cores this method is allowed to use
+
+  Returns
+  -------
+  (numpy array, float, float)
+    The predicted test labels, the fit time and the predict time in seconds
+
+  """
+  import time
+  from threadpoolctl import threadpool_limits
+  from sklearn.tree import DecisionTreeClassifier
+  from sklearn.ensemble import AdaBoostClassifier, RandomForestClassifier
+
+  # SVM
+  if Method == "SVM":
+    print("Running support vector machine ... please stand by...")
+    from sklearn.svm import SVC
+
+    Classifier = SVC(kernel='linear')
+
+  # Run the multi-layer perceptron
+  elif Method == "MLP":
+    print("Running multi-layer perceptron ... please stand by...")
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    # MLPClassifier supports only the Cross-Entropy loss function
+    # feature scaling - fit only to the training data
+    Classifier = make_pipeline(StandardScaler(), MLPClassifier(solver='lbfgs', alpha=1e-5, activation='logistic', hidden_layer_sizes=(100, 50, 30), random_state=0))
+
+  # Run the random forrest
+  elif Method == "RF":
+    print("Running random forrest ... please stand by...")
+
+    Classifier = RandomForestClassifier(n_estimators=1400, criterion ='entropy', random_state=0,bootstrap=False, min_samples_leaf=0.01, max_features='sqrt', min_samples_split=5, max_depth=11, n_jobs=Jobs)
+
+  # ADABoosting decision tree
+  elif Method == "ADABDC":
+    print("Running ADABoost'ed decision tree ... please stand by...")
+
+    dt = DecisionTreeClassifier(max_depth=8, min_samples_leaf=0.01)
+    Classifier = AdaBoostClassifier(dt, algorithm='SAMME', n_estimators=800, learning_rate=0.1)
+
+  # Histogram-binned gradient boosting - the features are binned once, which makes the split search
+  # independent of the number of events, and the boosting stops when the validation loss no longer improves
+  elif Method == "HGB":
+    print("Running histogram-based gradient boosting ... please stand by...")
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+    Classifier = HistGradientBoostingClassifier(max_iter=1000, learning_rate=0.1, max_bins=255, early_stopping=True, validation_fraction=0.1, n_iter_no_change=20, random_state=0)
+
+  # The BLAS/OpenMP thread pools have to stay within the core budget, too
+  with threadpool_limits(limits=Jobs):
+    print("{}: start training {}".format(time.time(), Method))
+    Timer = time.time()
+    Classifier.fit(X_train, y_train)
+    FitTime = time.time() - Timer
+
+    print("{}: start testing {}".format(time.time(), Method))
+    Timer = time.time()
+    y_predicted = Classifier.predict(X_test)
+    PredictTime = time.time() - Timer
+
+    if Method == "MLP":
+      print(Classifier)
+      print("Training set score: %f" % Classifier.score(X_train, y_train))
+      print("Test set score: %f" % Classifier.score(X_test, y_test))
+
+  return y_predicted, FitTime, PredictTime
+
+
+###################################################################################################
+
+
+def fitSKLMethodFromFiles(Method, DataDirectory, Jobs):
+  """
+  Same as fitSKLMethod, but with the data memory-mapped read-only from the files stored in DataDirectory
+  """
+  import numpy as np
+
+  Data = [ np.load(os.path.join(DataDirectory, Name + ".npy"), mmap_mode='r') for Name in ["X_train", "X_test", "y_train", "y_test"] ]
+  return fitSKLMethod(Method, *Data, Jobs)
+
 # END
 ###################################################################################################
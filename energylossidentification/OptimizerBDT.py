@@ -16,6 +16,7 @@
 
 import os
 import sys
+import time
 import argparse
 import ROOT
 from EnergyLoss import EnergyLossIdentification
@@ -36,6 +37,12 @@ python3 optimizerBDT.py --help
 parser = argparse.ArgumentParser(description='Optimize the BDT energy loss identifier.')
 parser.add_argument('-f', '--file', default='EC.hits4.groups3.eventclusterizer.root', help='File name used for training/testing')
 parser.add_argument('-m', '--maxevents', default='100000', help='Maximum number of events to use')
+parser.add_argument('-a', '--algorithm', default='TMVA:BDT', help='BDT implementation used in the sweep mode. Allowed: TMVA:BDT, SKL:ADABDC')
+parser.add_argument('-s', '--sweep', action='store_true', help='Train only the largest number of trees and evaluate the smaller ones from its first trees')
+parser.add_argument('--minnodesize', default='1', help='Sweep mode: Minimum node sizes in percent. Example: 1,2,5')
+parser.add_argument('--maxdepth', default='3', help='Sweep mode: Maximum tree depths. Example: 2,3,4')
+parser.add_argument('--beta', default='0.4', help='Sweep mode: AdaBoost learning rates. Example: 0.2,0.4')
+parser.add_argument('-j', '--jobs', default='0', help='Sweep mode: Number of parallel processes, 0 for one per CPU core')
 
 args = parser.parse_args()
 
@@ -43,17 +50,52 @@ NTrees = [ 100, 200, 500, 1000, 2000, 5000, 10000 ]
 BestNTrees = 0;
 BestROC = 0
 
-for Trees in NTrees:
-  AI = EnergyLossIdentification(args.file, "Result", "TMVA:BDT", int(args.maxevents))
-  AI.setBDTValues(Trees, 1, 3, 0.4)
-  AI.train()
-  Results = AI.getTMVAResults()
-  if Results["BDT"] > BestROC:
-    BestNTrees = Trees
-    BestROC = Results["BDT"]
-    
-    
-print("Best ROC {} for {} trees".format(BestROC, BestNTrees))
+TimerTraining = time.time()
+
+if args.sweep == False:
+  for Trees in NTrees:
+    AI = EnergyLossIdentification(args.file, "Result", "TMVA:BDT", int(args.maxevents))
+    AI.setBDTValues(Trees, 1, 3, 0.4)
+    AI.train()
+    Results = AI.getTMVAResults()
+    if Results["BDT"] > BestROC:
+      BestNTrees = Trees
+      BestROC = Results["BDT"]
+      
+  print("Best ROC {} for {} trees".format(BestROC, BestNTrees))
+
+else:
+  # One process per combination of the other hyper parameters, each sweeping all tree numbers
+  Combinations = [ (float(MinNodeSize), int(MaxDepth), float(Beta)) for MinNodeSize in args.minnodesize.split(",") for MaxDepth in args.maxdepth.split(",") for Beta in args.beta.split(",") ]
+
+  def sweepOneCombination(Combination):
+    (MinNodeSize, MaxDepth, Beta) = Combination
+    # Every process needs its own TMVA output
+    Prefix = "Result_MinNodeSize{}_MaxDepth{}_Beta{}".format(MinNodeSize, MaxDepth, Beta)
+    AI = EnergyLossIdentification(args.file, Prefix, args.algorithm, int(args.maxevents))
+    AI.setBDTValues(max(NTrees), MinNodeSize, MaxDepth, Beta)
+    return AI.sweepBDTNTrees(NTrees)
+
+  import multiprocessing as mp
+  Jobs = int(args.jobs) if int(args.jobs) > 0 else mp.cpu_count()
+  pool = mp.Pool(min(Jobs, len(Combinations)))
+  AllResults = pool.map(sweepOneCombination, Combinations)
+  pool.close()
+
+  BestCombination = None
+  for Combination, Results in zip(Combinations, AllResults):
+    for Trees in NTrees:
+      if Trees in Results and Results[Trees] > BestROC:
+        BestNTrees = Trees
+        BestROC = Results[Trees]
+        BestCombination = Combination
+        
+  if BestCombination == None:
+    print("ERROR: None of the BDT sweeps succeeded")
+  else:
+    print("Best ROC {} for {} trees (min node size {}%, max depth {}, AdaBoost beta {})".format(BestROC, BestNTrees, *BestCombination))
+  
+print("Info: Total training time: {:.1f} seconds".format(time.time() - TimerTraining))
 
 # prevent Canvases from closing
 
@@ -39,7 +39,7 @@ parser.add_argument('-f', '--file', default='EC.hits4.groups3.eventclusterizer.r
 parser.add_argument('-o', '--output', default='Results', help='Prefix for the output filename and directory')
 #parser.add_argument('-b', '--energy', default='0,10000', help='Energy bins. Example: 0,10000')
 #parser.add_argument('-l', '--layout', default='3*N,N', help='Layout of the hidden layer. Default: 3*N,N')
-parser.add_argument('-a', '--algorithm', default='TMVA:BDT', help='Machine learning algorithm. Allowed: TMVA:MLP, TMVA:BDT, TMVA:DNN_CPU, TMVA:DNN_GPU, TMVA:DL_CPU, SKL:SVM, SKL:MLP, SKL:RF, SKL:ADABDC')
+parser.add_argument('-a', '--algorithm', default='TMVA:BDT', help='Machine learning algorithm. Allowed: TMVA:MLP, TMVA:BDT, TMVA:DNN_CPU, TMVA:DNN_GPU, TMVA:DL_CPU, SKL:SVM, SKL:MLP, SKL:RF, SKL:ADABDC, SKL:HGB. Multiple SKL methods are trained in parallel, e.g. SKL:SVM,MLP,RF,ADABDC')
 parser.add_argument('-m', '--maxevents', default='100000', help='Maximum number of events to use')
 parser.add_argument('-e', '--onlyevaluate', action='store_true', help='Only test the approach')
 
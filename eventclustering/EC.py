@@ -18,6 +18,7 @@ import ROOT
 import array
 import os
 import sys 
+import numpy as np
   
   
 ###################################################################################################
@@ -159,25 +160,11 @@ class EventClustering:
       print("Error: Reading data tree from root file")
       return False
 
-    # Filter energy
+    # Filter energy - only the entries of this energy bin are read, up to the maximum number of events
     ROOT.gROOT.cd()
-    EnergyString = "Energy_1"
-    for i in range(1, NumberOfHits):
-      EnergyString += " + Energy_" + str(i+1)
-    
-    DataTree = FullDataTree.CopyTree("(" + EnergyString + ") >= " + str(MinimumEnergy) + " && (" + EnergyString + ") <= " + str(MaximumEnergy), "")
-    
-    # Limit the number of events:
-    if DataTree.GetEntries() > self.MaxEvents:
-      print("Reducing source tree size from " + str(DataTree.GetEntries()) + " to " + str(self.MaxEvents) + " (i.e. the maximum set)")
-      NewTree = DataTree.CloneTree(0);
-      NewTree.SetDirectory(0);
-    
-      for i in range(0, self.MaxEvents):
-        DataTree.GetEntry(i)
-        NewTree.Fill()
-    
-      DataTree = NewTree;
+    DataTree = self.getEnergyBinTree(FileName, FullDataTree, NumberOfHits, MinimumEnergy, MaximumEnergy)
+    if DataTree == None:
+      return False
 
 
     # Initialize TMVA
@@ -339,25 +326,11 @@ class EventClustering:
       print("Error: Reading data tree from root file")
       return False
     
-    # Filter energy
+    # Filter energy - only the entries of this energy bin are read, up to the maximum number of events
     ROOT.gROOT.cd()
-    EnergyString = "Energy_1"
-    for i in range(1, NumberOfHits):
-      EnergyString += " + Energy_" + str(i+1)
-    
-    DataTree = FullDataTree.CopyTree("(" + EnergyString + ") >= " + str(MinimumEnergy) + " && (" + EnergyString + ") <= " + str(MaximumEnergy), "")
-    
-    # Limit the number of events:
-    if DataTree.GetEntries() > self.MaxEvents:
-      print("Reducing source tree size from " + str(DataTree.GetEntries()) + " to " + str(self.MaxEvents) + " (i.e. the maximum set)")
-      NewTree = DataTree.CloneTree(0);
-      NewTree.SetDirectory(0);
-    
-      for i in range(0, self.MaxEvents):
-        DataTree.GetEntry(i)
-        NewTree.Fill()
-    
-      DataTree = NewTree
+    DataTree = self.getEnergyBinTree(FileName, FullDataTree, NumberOfHits, MinimumEnergy, MaximumEnergy)
+    if DataTree == None:
+      return False
       
       
 
@@ -457,6 +430,144 @@ class EventClustering:
     return True
   
   
+###################################################################################################
+
+
+  def getEnergyString(self, NumberOfHits):
+    """
+    Return the TTree formula for the total energy of an event
+    
+    Attributes
+    ----------
+    NumberOfHits : int
+      The number of hits per event in the data set
+    
+    Returns
+    -------
+    string
+      The formula, e.g. "Energy_1 + Energy_2 + Energy_3"
+        
+    """
+    
+    EnergyString = "Energy_1"
+    for i in range(1, NumberOfHits):
+      EnergyString += " + Energy_" + str(i+1)
+      
+    return EnergyString
+  
+  
+###################################################################################################
+
+
+  def getEnergyBinIndex(self, FileName, FullDataTree, NumberOfHits):
+    """
+    Return the tree entries of each energy bin. The total energy column is read in one pass over the 
+    tree and the entries are assigned to the bins via np.digitize. The result is stored next to the 
+    data file (FileName + ".energybins.npz") and reused as long as the data file and the energy bins 
+    do not change.
+    
+    Bins are [E_min, E_max), except for the last one which also includes its upper edge.
+    
+    Attributes
+    ----------
+    FileName : string
+      The file name of the data set
+    FullDataTree : ROOT.TTree
+      The full data tree of this file
+    NumberOfHits : int
+      The number of hits per event in the data set
+    
+    Returns
+    -------
+    [] of numpy arrays
+      For each energy bin the sorted tree entries falling into it
+        
+    """
+    
+    IndexFileName = FileName + ".energybins.npz"
+    Bins = np.array(self.EnergyBins, dtype=np.float64)
+    NumberOfEntries = FullDataTree.GetEntries()
+    
+    # Reuse the stored index if it is still valid
+    if os.path.isfile(IndexFileName) == True and os.path.getmtime(IndexFileName) >= os.path.getmtime(FileName):
+      with np.load(IndexFileName) as Index:
+        if np.array_equal(Index["Bins"], Bins) and int(Index["Entries"]) == NumberOfEntries:
+          return np.split(Index["EntryList"], Index["Offsets"][1:-1])
+      
+    print("Info: Creating energy bin index " + IndexFileName)
+    
+    # One pass over the tree to read the total energy of all events
+    FullDataTree.SetEstimate(NumberOfEntries + 1)
+    FullDataTree.Draw(self.getEnergyString(NumberOfHits), "", "goff")
+    Energies = np.array(np.frombuffer(FullDataTree.GetV1(), dtype=np.float64, count=NumberOfEntries))
+    
+    # Bin assignment: 0 is underflow, len(Bins) is overflow -- the upper edge belongs to the last bin
+    BinIDs = np.digitize(Energies, Bins)
+    BinIDs[Energies == Bins[-1]] = len(Bins) - 1
+    
+    # Group the entries by bin -- a stable sort keeps the entries in each bin in tree order
+    Order = np.argsort(BinIDs, kind="stable")
+    Offsets = np.searchsorted(BinIDs[Order], np.arange(1, len(Bins) + 1))
+    EntryList = Order[Offsets[0]:Offsets[-1]].astype(np.int64)
+    Offsets = Offsets - Offsets[0]
+    
+    # Write to a temporary file first, so that an interrupted run does not leave a broken index behind
+    TempFileName = IndexFileName + ".tmp.npz"
+    np.savez(TempFileName, Bins=Bins, Entries=NumberOfEntries, EntryList=EntryList, Offsets=Offsets)
+    os.replace(TempFileName, IndexFileName)
+    
+    return np.split(EntryList, Offsets[1:-1])
+  
+  
+###################################################################################################
+
+
+  def getEnergyBinTree(self, FileName, FullDataTree, NumberOfHits, MinimumEnergy, MaximumEnergy):
+    """
+    Return a memory-resident tree containing only the events of the given energy bin, 
+    limited to the maximum number of events
+    
+    Attributes
+    ----------
+    FileName : string
+      The file name of the data set
+    FullDataTree : ROOT.TTree
+      The full data tree of this file
+    NumberOfHits : int
+      The number of hits per event in the data set
+    MinimumEnergy : int
+      The lower edge of the energy bin, must be one of the energy bins 
+    MaximumEnergy : int
+      The upper edge of the energy bin, must be the next energy bin
+    
+    Returns
+    -------
+    ROOT.TTree
+      The tree, None in case of an error
+        
+    """
+    
+    if MinimumEnergy not in self.EnergyBins or self.EnergyBins.index(MinimumEnergy) + 1 >= len(self.EnergyBins) or self.EnergyBins[self.EnergyBins.index(MinimumEnergy) + 1] != MaximumEnergy:
+      print("Error: The energy range " + str(MinimumEnergy) + "-" + str(MaximumEnergy) + " is not one of the energy bins")
+      return None
+    
+    Entries = self.getEnergyBinIndex(FileName, FullDataTree, NumberOfHits)[self.EnergyBins.index(MinimumEnergy)]
+    
+    # Limit the number of events:
+    if len(Entries) > self.MaxEvents:
+      print("Reducing source tree size from " + str(len(Entries)) + " to " + str(self.MaxEvents) + " (i.e. the maximum set)")
+      Entries = Entries[:self.MaxEvents]
+    
+    DataTree = FullDataTree.CloneTree(0)
+    DataTree.SetDirectory(0)
+    
+    for i in Entries:
+      FullDataTree.GetEntry(int(i))
+      DataTree.Fill()
+    
+    return DataTree
+  
+  
 ###################################################################################################
 
 
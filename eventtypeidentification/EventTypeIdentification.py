@@ -30,6 +30,9 @@ import collections
 import numpy as np
 import math, datetime
 from voxnet import *
+from voxelization import BatchVoxelizer, voxelizeBatchCOO
+from hitstorage import RaggedHits, listMemory
+from batchprefetcher import BatchPrefetcher
 #from volumetric_data import ShapeNet40Vox30
 
 
@@ -83,6 +86,8 @@ class EventTypeIdentification:
     self.LastEventIndex = 0
     
     self.BatchSize = 20
+    # Feed the first convolution of VoxNet with the list of occupied voxels instead of the dense grid
+    self.SparseInput = False
     self.XBins = 110
     self.YBins = 110
     self.ZBins = 48
@@ -97,6 +102,13 @@ class EventTypeIdentification:
 
     self.ZMin = 0
     self.ZMax = 48
+
+    # Number of training batches prepared in the background while the current one is trained, and threads doing it
+    self.PrefetchDepth = 2
+    self.PrefetchWorkers = 1
+
+    # Voxelizer of get_batch with a reused buffer
+    self.Voxelizer = BatchVoxelizer((self.XBins, self.YBins, self.ZBins), ((self.XMin, self.XMax), (self.YMin, self.YMax), (self.ZMin, self.ZMax)))
     
     #keras model development
     self.OutputDirectory = "output.txt"
@@ -208,23 +220,21 @@ class EventTypeIdentification:
   
     print("Occurances of different event types:")
     print(collections.Counter(EventTypes))
-    
-    import math
+
+    # Store all hits in one flat array with offsets, and permute hits and types together
+    Events = RaggedHits.fromEventList(EventHits, EventTypes)
+    print("Memory of the hits: {:.1f} MB as list of arrays, {:.1f} MB as flat array with offsets".format(listMemory(EventHits, EventTypes) / 1e6, Events.nbytes() / 1e6))
+    del EventHits, EventTypes
 
     self.LastEventIndex = 0
-    self.EventHits = EventHits
-    self.EventTypes = EventTypes 
-    shuffledTypes = EventTypes.copy()
-    shuffledHits = EventHits.copy()
+    self.EventHits = Events
+    self.EventTypes = Events.Labels
 
-    random.shuffle(shuffledHits)
-    random.shuffle(shuffledTypes)
- 
-    ceil = math.ceil(len(self.EventHits)*0.75)
-    self.EventTypesTrain = shuffledTypes[:ceil]
-    self.EventTypesTest = shuffledTypes[ceil:]
-    self.EventHitsTrain = shuffledHits[:ceil]
-    self.EventHitsTest = shuffledHits[ceil:]
+    Train, Test = Events.shuffledSplit(0.75)
+    self.EventTypesTrain = Train.Labels
+    self.EventTypesTest = Test.Labels
+    self.EventHitsTrain = Train
+    self.EventHitsTest = Test
 
     return 
 
@@ -246,7 +256,7 @@ class EventTypeIdentification:
 
     print("Initializing voxnet")
 
-    voxnet = VoxNet(self.BatchSize, self.XBins, self.YBins, self.ZBins, self.MaxLabel)
+    voxnet = VoxNet(self.BatchSize, self.XBins, self.YBins, self.ZBins, self.MaxLabel, sparse_input=self.SparseInput)
     #batch_size = 1
 
     p = dict() # placeholders
@@ -292,7 +302,8 @@ class EventTypeIdentification:
     with open(self.Output + '/accuracies_labels.txt', 'w') as f:
       f.write('')
 
-    with tf.Session() as session:
+    # The next batches are voxelized in the background while the current one is trained
+    with tf.Session() as session, self.get_feed_dict_prefetcher(voxnet, self.BatchSize, True) as Prefetcher:
       print("Initializing global TF variables")
       session.run(tf.global_variables_initializer())
       
@@ -305,19 +316,20 @@ class EventTypeIdentification:
         if batch_index > weights_decay_after and batch_index % 256 == 0:
           session.run(p['weights_decay'], feed_dict=feed_dict)
 
-        voxs, labels = self.get_batch(self.BatchSize, True)
+        feed_dict, labels = Prefetcher.next()
 
         tf.logging.set_verbosity(tf.logging.DEBUG)
         
         print("Starting training run")
         start = time.time()
-        feed_dict = {voxnet[0]: voxs, p['labels']: labels, p['learning_rate']: learning_rate, voxnet.training: True}
+        feed_dict.update({p['labels']: labels, p['learning_rate']: learning_rate, voxnet.training: True})
         session.run(p['train'], feed_dict=feed_dict)
         print("Done with training run after {0} seconds".format(round(time.time() - start, 2)))
 
         if batch_index and batch_index % 8 == 0:
           print("{} batch: {}".format(datetime.datetime.now(), batch_index))
           print('learning rate: {}'.format(learning_rate))
+          print('batch preparation: {}'.format(Prefetcher.report()))
 
           feed_dict[voxnet.training] = False
           loss = session.run(p['loss'], feed_dict=feed_dict)
@@ -337,8 +349,8 @@ class EventTypeIdentification:
           for x in range(num_accuracy_batches):
             #TODO://
             #replace with actual data
-            voxs, labels = self.get_batch(self.BatchSize, True)
-            feed_dict = {voxnet[0]: voxs, p['labels']: labels, voxnet.training: False}
+            feed_dict, labels = Prefetcher.next()
+            feed_dict.update({p['labels']: labels, voxnet.training: False})
             total_accuracy += session.run(p['accuracy'], feed_dict=feed_dict)
           training_accuracy = total_accuracy / num_accuracy_batches
           print('training accuracy: {}'.format(training_accuracy))
@@ -346,8 +358,8 @@ class EventTypeIdentification:
           num_accuracy_batches = 90
           total_accuracy = 0
           for x in range(num_accuracy_batches):
-            voxs, labels = self.get_batch(self.BatchSize, True)
-            feed_dict = {voxnet[0]: voxs, p['labels']: labels, voxnet.training: False}
+            feed_dict, labels = Prefetcher.next()
+            feed_dict.update({p['labels']: labels, voxnet.training: False})
             total_accuracy += session.run(p['accuracy'], feed_dict=feed_dict)
           test_accuracy = total_accuracy / num_accuracy_batches
           print('test accuracy: {}'.format(test_accuracy))
@@ -356,8 +368,8 @@ class EventTypeIdentification:
           total_correct = []
           total_wrong = []
           for x in range(num_accuracy_batches):
-            voxs, labels = self.get_batch(self.BatchSize, True)
-            feed_dict = {voxnet[0]: voxs, p['labels']: labels, voxnet.training: False}
+            feed_dict, labels = Prefetcher.next()
+            feed_dict.update({p['labels']: labels, voxnet.training: False})
             correct_prediction = session.run(p['correct_prediction'], feed_dict=feed_dict)
             for i in range(len(correct_prediction)):
               if (correct_prediction[i] == 1):
@@ -549,26 +561,21 @@ class EventTypeIdentification:
 ###################################################################################################
 
 
-  def get_batch(self, batch_size, train):
+  def next_events(self, batch_size, train):
     """
-    Main test function
+    Select the next non-empty events of the training or testing set
 
     Returns
     -------
-    bool
-      True is everything went well, False in case of an error
+    RaggedHits
+      The hits of the set
+    numpy.ndarray
+      The event types of the set
+    list
+      The indices of the selected events
 
     """
 
-    rn = random.randint
-    bs = batch_size
-    #xmin = -55
-    #ymin = -55
-    #zmin = 0
-    #xmax = 55
-    #ymax = 55
-    #zmax = 48
-
     if train:
       EventHits = self.EventHitsTrain
       EventTypes = self.EventTypesTrain
@@ -576,25 +583,140 @@ class EventTypeIdentification:
       EventHits = self.EventHitsTest
       EventTypes = self.EventTypesTest
 
-    voxs = np.zeros([bs, self.XBins, self.YBins, self.ZBins, 1], dtype=np.float32)
-    one_hots = np.zeros([bs, self.MaxLabel], dtype=np.float32)
-    #fill event hits
-    for bi in range(bs):
+    NHits = EventHits.numberOfHits()
+    Indices = []
+    for bi in range(batch_size):
       self.LastEventIndex += 1
       if self.LastEventIndex == len(EventHits):
         self.LastEventIndex = 0
-      while len(self.EventHitsTrain[self.LastEventIndex]) == 0:
+      while NHits[self.LastEventIndex] == 0:
         self.LastEventIndex += 1
         if self.LastEventIndex == len(EventHits):
           self.LastEventIndex = 0
-      for i in EventHits[self.LastEventIndex]:
-          xbin = (int) (((i[0] - self.XMin) / (self.XMax - self.XMin)) * self.XBins)
-          ybin = (int) (((i[1] - self.YMin) / (self.YMax - self.YMin)) * self.YBins)
-          zbin = (int) (((i[2] - self.ZMin) / (self.ZMax - self.ZMin)) * self.ZBins)
-          #print(bi, xbin, ybin, zbin)
-          voxs[bi, xbin, ybin, zbin] += i[3]
-      #fills event types
-      one_hots[bi][EventTypes[self.LastEventIndex]] = 1
+      Indices.append(self.LastEventIndex)
+
+    return EventHits, EventTypes, Indices
+
+
+###################################################################################################
+
+
+  def get_sparse_batch(self, batch_size, train):
+    """
+    Like get_batch, but the voxels are returned as list of the occupied ones
+
+    Returns
+    -------
+    numpy.ndarray
+      (occupied voxels, 4) array of (event in batch, x bin, y bin, z bin)
+    numpy.ndarray
+      The energies of the occupied voxels
+    numpy.ndarray
+      The one-hot event types
+
+    """
+
+    return self.fill_sparse_batch(*self.next_events(batch_size, train))
+
+
+###################################################################################################
+
+
+  def fill_sparse_batch(self, EventHits, EventTypes, Indices):
+    """
+    The occupied voxels and one-hot event types of the selected events, see get_sparse_batch
+    """
+
+    Hits, Offsets = EventHits.gather(Indices)
+    Coordinates, Values = voxelizeBatchCOO(Hits, Offsets, (self.XBins, self.YBins, self.ZBins), ((self.XMin, self.XMax), (self.YMin, self.YMax), (self.ZMin, self.ZMax)))
+
+    one_hots = np.zeros([len(Indices), self.MaxLabel], dtype=np.float32)
+    one_hots[np.arange(len(Indices)), EventTypes[Indices]] = 1
+
+    return Coordinates, Values, one_hots
+
+
+###################################################################################################
+
+
+  def get_feed_dict(self, voxnet, batch_size, train):
+    """
+    The next batch as feed dictionary of the input of voxnet, dense or sparse, and its labels
+    """
+
+    if voxnet.sparse_input:
+      Coordinates, Values, one_hots = self.get_sparse_batch(batch_size, train)
+      return voxnet.sparse_feed_dict(Coordinates, Values, batch_size), one_hots
+
+    voxs, one_hots = self.get_batch(batch_size, train)
+    return {voxnet[0]: voxs}, one_hots
+
+
+###################################################################################################
+
+
+  def get_feed_dict_prefetcher(self, voxnet, batch_size, train):
+    """
+    Prefetcher which prepares the next feed dictionaries of get_feed_dict in background threads
+    while the current training step runs. Each prepared batch has its own voxel buffer.
+
+    Returns
+    -------
+    BatchPrefetcher
+      Its next() returns the feed dictionary and the labels, valid until the following call
+    """
+
+    def Allocate():
+      return BatchVoxelizer((self.XBins, self.YBins, self.ZBins), ((self.XMin, self.XMax), (self.YMin, self.YMax), (self.ZMin, self.ZMax)))
+
+    def Fill(Job, Voxelizer):
+      if voxnet.sparse_input:
+        Coordinates, Values, one_hots = self.fill_sparse_batch(*Job)
+        return voxnet.sparse_feed_dict(Coordinates, Values, batch_size), one_hots
+      voxs, one_hots = self.fill_batch(*Job, Voxelizer)
+      return {voxnet[0]: voxs}, one_hots
+
+    return BatchPrefetcher(lambda: self.next_events(batch_size, train), Fill, Allocate, self.PrefetchDepth, self.PrefetchWorkers)
+
+
+###################################################################################################
+
+
+  def get_batch(self, batch_size, train):
+    """
+    Main test function
+
+    Returns
+    -------
+    bool
+      True is everything went well, False in case of an error
+
+    """
+
+    bs = batch_size
+
+    # The buffer of self.Voxelizer is reused: the returned voxels are only valid until the next call
+    return self.fill_batch(*self.next_events(bs, train), self.Voxelizer)
+
+
+###################################################################################################
+
+
+  def fill_batch(self, EventHits, EventTypes, Indices, Voxelizer):
+    """
+    The voxels and one-hot event types of the selected events, voxelized into the buffer of
+    Voxelizer, see get_batch
+    """
+
+    bs = len(Indices)
+
+    # Fill the event hits in one scatter over the flattened hits of the batch
+    Hits, Offsets = EventHits.gather(Indices)
+    voxs = Voxelizer.voxelize(Hits, Offsets)
+
+    #fills event types
+    one_hots = np.zeros([bs, self.MaxLabel], dtype=np.float32)
+    one_hots[np.arange(bs), EventTypes[Indices]] = 1
       
     return voxs, one_hots
 
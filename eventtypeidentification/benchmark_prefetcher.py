@@ -0,0 +1,195 @@
+###################################################################################################
+#
+# benchmark_prefetcher.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import time
+import argparse
+import numpy as np
+
+from hitstorage import RaggedHits
+from voxelization import BatchVoxelizer
+from batchprefetcher import BatchPrefetcher
+
+
+###################################################################################################
+
+
+"""
+Checks that the batch prefetcher of EventTypeIdentification.trainTFMethods returns the same batches
+in the same order as the batches made on the main thread, and benchmarks the time per training step
+with and without prefetching. The training step is simulated by a sleep, like a session.run on the
+GPU which releases the GIL, and the batches are made with the voxelizer of get_batch as well as with
+the hit-by-hit loop which EnergyLossEstimate and ComptonTrackIdentification still use.
+For all the command line options, try:
+
+python3 benchmark_prefetcher.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the batch prefetcher of the 3D CNN trainers.')
+parser.add_argument('-b', '--batchsize', default='128', help='Batch size')
+parser.add_argument('-n', '--batches', default='40', help='Number of timed batches')
+parser.add_argument('-s', '--step', default='20', help='Simulated training step time in ms')
+parser.add_argument('-d', '--depth', default='2', help='Number of batches prepared ahead')
+parser.add_argument('-w', '--workers', default='1', help='Number of worker threads')
+parser.add_argument('-e', '--events', default='20000', help='Number of toy events')
+
+args = parser.parse_args()
+
+# Same binning as EventTypeIdentification
+XBins, YBins, ZBins = 110, 110, 48
+XMin, XMax, YMin, YMax, ZMin, ZMax = -55, 55, -55, 55, 0, 48
+Bins = (XBins, YBins, ZBins)
+Ranges = ((XMin, XMax), (YMin, YMax), (ZMin, ZMax))
+MaxLabel = 5
+
+Random = np.random.default_rng(0)
+
+
+def make_toy_event():
+  #A random walk of hits inside the detector, with a few empty events as in the sim files
+  NHits = int(Random.integers(0, 40))
+  Start = np.array([ Random.uniform(-50, 50), Random.uniform(-50, 50), Random.uniform(1, 47) ])
+  Pos = Start + np.cumsum(Random.normal(0, 1.0, (NHits, 3)), axis=0)
+  Pos = np.clip(Pos, [XMin, YMin, ZMin], [XMax - 0.01, YMax - 0.01, ZMax - 0.01])
+  return np.column_stack((Pos, Random.exponential(300, NHits)))
+
+
+EventList = [ make_toy_event() for e in range(int(args.events)) ]
+EventHits = RaggedHits.fromEventList(EventList, Random.integers(0, MaxLabel, len(EventList)))
+NHits = EventHits.numberOfHits()
+
+
+class Loader:
+  #The event selection and batch filling of EventTypeIdentification
+  def __init__(self):
+    self.LastEventIndex = 0
+
+  def next_events(self, bs):
+    Indices = []
+    for bi in range(bs):
+      self.LastEventIndex += 1
+      if self.LastEventIndex == len(EventHits):
+        self.LastEventIndex = 0
+      while NHits[self.LastEventIndex] == 0:
+        self.LastEventIndex += 1
+        if self.LastEventIndex == len(EventHits):
+          self.LastEventIndex = 0
+      Indices.append(self.LastEventIndex)
+    return Indices
+
+
+def fill_voxelizer(Indices, Voxelizer):
+  Hits, Offsets = EventHits.gather(Indices)
+  voxs = Voxelizer.voxelize(Hits, Offsets)
+  one_hots = np.zeros([len(Indices), MaxLabel], dtype=np.float32)
+  one_hots[np.arange(len(Indices)), EventHits.Labels[Indices]] = 1
+  return voxs, one_hots
+
+
+def fill_loop(Indices, voxs):
+  #The hit-by-hit loop, into a preallocated buffer
+  voxs.fill(0)
+  one_hots = np.zeros([len(Indices), MaxLabel], dtype=np.float32)
+  for bi, Index in enumerate(Indices):
+    for i in EventList[Index]:
+      xbin = (int) (((i[0] - XMin) / (XMax - XMin)) * XBins)
+      ybin = (int) (((i[1] - YMin) / (YMax - YMin)) * YBins)
+      zbin = (int) (((i[2] - ZMin) / (ZMax - ZMin)) * ZBins)
+      voxs[bi, xbin, ybin, zbin] += i[3]
+    one_hots[bi][EventHits.Labels[Index]] = 1
+  return voxs, one_hots
+
+
+Fills = {
+  'voxelizer': (fill_voxelizer, lambda: BatchVoxelizer(Bins, Ranges)),
+  'hit loop': (fill_loop, lambda: np.zeros([int(args.batchsize), XBins, YBins, ZBins, 1], dtype=np.float32)),
+}
+
+
+def make_prefetcher(L, Fill, Allocate, Depth, Workers):
+  return BatchPrefetcher(lambda: L.next_events(int(args.batchsize)), Fill, Allocate, Depth, Workers)
+
+
+###################################################################################################
+# Equivalence check
+###################################################################################################
+
+
+bs = int(args.batchsize)
+for Name, (Fill, Allocate) in Fills.items():
+  for Workers in [ 1, 3 ]:
+    Serial = Loader()
+    Buffer = Allocate()
+    with make_prefetcher(Loader(), Fill, Allocate, 2, Workers) as Prefetcher:
+      for b in range(8):
+        voxs, one_hots = Prefetcher.next()
+        ReferenceVoxs, ReferenceOneHots = Fill(Serial.next_events(bs), Buffer)
+        assert np.array_equal(voxs, ReferenceVoxs) and np.array_equal(one_hots, ReferenceOneHots), "Batch {} differs with {} and {} workers".format(b, Name, Workers)
+  print("Equivalence check passed with the {}: the prefetched batches are the serial ones, in order".format(Name))
+
+# Errors in the workers are raised in the caller
+def failing_fill(Job, Slot):
+  raise ValueError("Test error")
+with BatchPrefetcher(lambda: 0, failing_fill, lambda: None) as Prefetcher:
+  try:
+    Prefetcher.next()
+    assert False, "The error of the worker was not raised"
+  except ValueError:
+    pass
+print("Errors of the workers are raised by next()")
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+NBatches = int(args.batches)
+Step = float(args.step) / 1000
+
+print("\nBatch size {}, simulated step {:.0f} ms, {} batches prepared ahead by {} worker(s)".format(bs, 1000*Step, args.depth, args.workers))
+print("{:>10} {:>14} {:>14} {:>14} {:>10}".format("filling", "preparation", "serial", "prefetched", "overlap"))
+print("{:>10} {:>14} {:>14} {:>14}".format("", "[ms/batch]", "[ms/step]", "[ms/step]"))
+for Name, (Fill, Allocate) in Fills.items():
+  L = Loader()
+  Buffer = Allocate()
+  Fill(L.next_events(bs), Buffer)
+  Start = time.perf_counter()
+  for b in range(NBatches):
+    Fill(L.next_events(bs), Buffer)
+    time.sleep(Step)
+  SerialTime = (time.perf_counter() - Start) / NBatches
+
+  with make_prefetcher(Loader(), Fill, Allocate, int(args.depth), int(args.workers)) as Prefetcher:
+    # The first batches touch the buffers of all slots
+    for b in range(int(args.depth) + 1):
+      Prefetcher.next()
+    time.sleep(Step)
+    Prefetcher.resetStatistics()
+    Start = time.perf_counter()
+    for b in range(NBatches):
+      Prefetcher.next()
+      time.sleep(Step)
+    PrefetchedTime = (time.perf_counter() - Start) / NBatches
+    S = Prefetcher.statistics()
+
+  print("{:>10} {:>14.1f} {:>14.1f} {:>14.1f} {:>9.0f}%".format(Name, 1000*S['prepare'], 1000*SerialTime, 1000*PrefetchedTime, 100*S['overlap']))
+  print("           {}".format(Prefetcher.report()))
+
+
+# END
+###################################################################################################
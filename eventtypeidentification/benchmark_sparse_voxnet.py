@@ -0,0 +1,200 @@
+###################################################################################################
+#
+# benchmark_sparse_voxnet.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import time
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from voxelization import voxelizeBatch, voxelizeBatchCOO
+from sparseconv import build_rulebook, sparse_conv3d, conv_output_shape
+
+
+###################################################################################################
+
+
+"""
+Compares the sparse input path of VoxNet (first convolution on the occupied voxels only) with the
+dense path on synthetic sparse events:
+1. The rulebook and the gather based convolution are checked against a dense NumPy convolution,
+   and both are timed in NumPy.
+2. If TensorFlow (1.x) is available, both VoxNet variants are built with the same weights, their
+   outputs are compared, and the training step throughput is measured.
+The input memory of both paths is reported. For all the command line options, try:
+
+python3 benchmark_sparse_voxnet.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Compare the sparse and dense input path of VoxNet.')
+parser.add_argument('-b', '--batchsize', default='8', help='Batch size')
+parser.add_argument('-n', '--batches', default='3', help='Number of timed batches')
+parser.add_argument('-f', '--filters', default='64', help='Number of filters of the first convolution')
+
+args = parser.parse_args()
+
+# Same binning and first convolution as EventTypeIdentification and VoxNet 'all_conv'
+Bins = (110, 110, 48)
+Ranges = ((-55, 55), (-55, 55), (0, 48))
+FilterSize, Stride, Filters = 5, 2, int(args.filters)
+BatchSize = int(args.batchsize)
+
+Random = np.random.default_rng(0)
+
+
+def make_batch():
+  #Random walks of 1 to 40 hits as toy Compton and pair events
+  Lengths = Random.integers(1, 40, BatchSize)
+  Offsets = np.concatenate(([0], np.cumsum(Lengths)))
+  Starts = np.repeat(np.column_stack((Random.uniform(-50, 50, (BatchSize, 2)), Random.uniform(1, 47, BatchSize))), Lengths, axis=0)
+  Steps = Random.normal(0, 1.0, (Offsets[-1], 3))
+  Steps[Offsets[:-1]] = 0
+  Walk = np.cumsum(Steps, axis=0)
+  Walk -= np.repeat(Walk[Offsets[:-1]], Lengths, axis=0)
+  Hits = np.column_stack((Starts + Walk, Random.exponential(300, Offsets[-1])))
+  return Hits, Offsets
+
+
+def dense_conv3d(voxs, kernel):
+  #'VALID' strided convolution of a (batch, x, y, z, in) grid, without the bias
+  Windows = sliding_window_view(voxs, (FilterSize,)*3, axis=(1, 2, 3))[:, ::Stride, ::Stride, ::Stride]
+  return np.einsum('bxyzicde,cdeio->bxyzo', Windows, kernel, optimize=True)
+
+
+def sparse_path(Hits, Offsets, kernel):
+  Coordinates, Values = voxelizeBatchCOO(Hits, Offsets, Bins, Ranges)
+  Rulebook = build_rulebook(Coordinates, BatchSize, Bins, FilterSize, Stride)
+  return Coordinates, Values, Rulebook, sparse_conv3d(Values.reshape(-1, 1), Rulebook, kernel)
+
+
+def nbytes(Arrays):
+  return sum(a.nbytes for a in Arrays)
+
+
+Batches = [ make_batch() for b in range(int(args.batches)) ]
+Kernel = Random.normal(0, 0.1, (FilterSize, FilterSize, FilterSize, 1, Filters)).astype(np.float32)
+OutShape = conv_output_shape(Bins, FilterSize, Stride)
+
+
+###################################################################################################
+# NumPy check and timing
+###################################################################################################
+
+
+Hits, Offsets = Batches[0]
+Coordinates, Values, Rulebook, Sites = sparse_path(Hits, Offsets, Kernel)
+# The voxel list sums the energies in double precision, the dense grid in single precision
+Voxels = voxelizeBatch(Hits, Offsets, Bins, Ranges)
+assert np.count_nonzero(Voxels) == len(Values) and np.allclose(Voxels[tuple(Coordinates.T)][:, 0], Values, rtol=1e-6), "Voxel lists differ from the dense grid"
+Dense = dense_conv3d(Voxels, Kernel)
+Scattered = np.zeros((BatchSize,) + OutShape + (Filters,), dtype=np.float32)
+Scattered[tuple(Rulebook[3].T)] = Sites
+assert np.allclose(Scattered, Dense, rtol=1e-4, atol=1e-3), "Sparse convolution differs from the dense one"
+assert np.count_nonzero(np.any(Dense != 0, axis=-1)) <= len(Rulebook[3]), "Active output sites are missing"
+
+Occupancy = len(Coordinates) / (BatchSize * np.prod(Bins))
+print("Sparse first convolution agrees with the dense one: {} occupied voxels ({:.4f}% of the grid), {} active output sites ({:.3f}%), {} rules".format(len(Coordinates), 100*Occupancy, len(Rulebook[3]), 100*len(Rulebook[3])/(BatchSize*np.prod(OutShape)), len(Rulebook[0])))
+
+Start = time.perf_counter()
+for Hits, Offsets in Batches:
+  dense_conv3d(voxelizeBatch(Hits, Offsets, Bins, Ranges), Kernel)
+DenseTime = (time.perf_counter() - Start) / len(Batches)
+
+Start = time.perf_counter()
+for Hits, Offsets in Batches:
+  Coordinates, Values = voxelizeBatchCOO(Hits, Offsets, Bins, Ranges)
+  Rulebook = build_rulebook(Coordinates, BatchSize, Bins, FilterSize, Stride)
+RulebookTime = (time.perf_counter() - Start) / len(Batches)
+
+Start = time.perf_counter()
+for Hits, Offsets in Batches:
+  sparse_path(Hits, Offsets, Kernel)
+SparseTime = (time.perf_counter() - Start) / len(Batches)
+
+DenseInput = BatchSize * np.prod(Bins) * 4
+SparseInput = nbytes((Coordinates, Values) + tuple(Rulebook))
+print("\nFirst convolution, batch of {} events, {} filters (NumPy, per batch):".format(BatchSize, Filters))
+print("  dense grid:                 {:10.1f} ms".format(1000*DenseTime))
+print("  voxel list + rulebook:      {:10.1f} ms".format(1000*RulebookTime))
+print("  voxel list + rulebook+conv: {:10.1f} ms   ({:.0f}x)".format(1000*SparseTime, DenseTime/SparseTime))
+print("Input memory per batch: dense {:.1f} MB, voxel list with rulebook {:.3f} MB".format(DenseInput/1e6, SparseInput/1e6))
+print("The output of the first convolution is scattered into the dense {} grid for the later layers, {:.1f} MB in both paths".format(OutShape + (Filters,), BatchSize*np.prod(OutShape)*Filters*4/1e6))
+
+
+###################################################################################################
+# VoxNet in TensorFlow
+###################################################################################################
+
+
+try:
+  import tensorflow as tf
+  tf.placeholder
+except (ImportError, AttributeError):
+  print("\nTensorFlow 1.x is not available: skipping the comparison of the VoxNet graphs")
+  quit()
+
+from voxnet import VoxNet
+
+MaxLabel = 13
+Labels = np.eye(MaxLabel, dtype=np.float32)[Random.integers(0, MaxLabel, BatchSize)]
+
+Results = {}
+Weights = None
+for Sparse in [ False, True ]:
+  tf.reset_default_graph()
+  voxnet = VoxNet(BatchSize, Bins[0], Bins[1], Bins[2], MaxLabel, sparse_input=Sparse)
+  LabelsPlaceholder = tf.placeholder(tf.float32, [None, MaxLabel])
+  Loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(logits=voxnet[-2], labels=LabelsPlaceholder))
+  with tf.control_dependencies(tf.get_collection(tf.GraphKeys.UPDATE_OPS)):
+    Train = tf.train.AdamOptimizer(0.001, epsilon=1e-3).minimize(Loss)
+
+  with tf.Session() as Session:
+    Session.run(tf.global_variables_initializer())
+    # Both graphs have the same variable names, start both with the weights of the dense one
+    if Weights is None:
+      Weights = dict((v.name, Session.run(v)) for v in voxnet.variables)
+    else:
+      for v in voxnet.variables:
+        Session.run(v.assign(Weights[v.name]))
+
+    def feed(Hits, Offsets):
+      if Sparse:
+        Coordinates, Values = voxelizeBatchCOO(Hits, Offsets, Bins, Ranges)
+        FeedDict = voxnet.sparse_feed_dict(Coordinates, Values, BatchSize)
+      else:
+        FeedDict = { voxnet[0]: voxelizeBatch(Hits, Offsets, Bins, Ranges) }
+      FeedDict[LabelsPlaceholder] = Labels
+      return FeedDict
+
+    Output = Session.run(voxnet[-1], feed_dict=feed(*Batches[0]))
+    Session.run(Train, feed_dict=feed(*Batches[0]))
+    Start = time.perf_counter()
+    for Hits, Offsets in Batches:
+      FeedDict = feed(Hits, Offsets)
+      FeedDict[voxnet.training] = True
+      Session.run(Train, feed_dict=FeedDict)
+    Results[Sparse] = (Output, (time.perf_counter() - Start) / len(Batches))
+
+assert np.allclose(Results[False][0], Results[True][0], rtol=1e-3, atol=1e-5), "VoxNet outputs differ"
+print("\nVoxNet outputs of the dense and sparse input agree")
+print("Training step, batch of {} events:".format(BatchSize))
+print("  dense input:  {:10.1f} ms".format(1000*Results[False][1]))
+print("  sparse input: {:10.1f} ms   ({:.2f}x)".format(1000*Results[True][1], Results[False][1]/Results[True][1]))
+
+
+# END
+###################################################################################################
@@ -0,0 +1,162 @@
+###################################################################################################
+#
+# benchmark_volumetric_data.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import os
+import io
+import sys
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import tempfile
+import numpy as np
+
+
+###################################################################################################
+
+
+"""
+Creates a synthetic volumetric_data.zip with the layout of ShapeNet40Vox30, checks that the
+batches from the memory mapped cache are identical to the ones decompressed from the zip file for
+every sample, and benchmarks batches/s of both, as well as the one-time conversion.
+For all the command line options, try:
+
+python3 benchmark_volumetric_data.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the voxel cache of ShapeNet40Vox30.')
+parser.add_argument('-s', '--samples', default='400', help='Number of synthetic training samples')
+parser.add_argument('-c', '--categories', default='10', help='Number of categories')
+parser.add_argument('-b', '--batchsize', default='64', help='Batch size')
+parser.add_argument('-n', '--batches', default='10', help='Number of timed batches')
+
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from volumetric_data import ShapeNet40Vox30
+
+Random = np.random.default_rng(0)
+Directory = tempfile.mkdtemp()
+os.chdir(Directory)
+
+
+# Synthetic objects: random boxes in the 98 x 98 x 48 grid, stored as compressed .npy files in
+# volumetric_data_.zip, as category/30/train_or_test/name.npy, inside volumetric_data.zip
+Shape = ShapeNet40Vox30.grid_shape
+with zipfile.ZipFile('volumetric_data_.zip', 'w', zipfile.ZIP_DEFLATED) as zf:
+  for Mode, Samples in [ ('train', int(args.samples)), ('test', int(args.samples) // 4) ]:
+    for s in range(Samples):
+      Category = 'category{:02d}'.format(s % int(args.categories))
+      Grid = np.zeros(Shape, dtype=np.uint8)
+      Low = Random.integers(0, np.array(Shape) // 2)
+      High = Low + Random.integers(4, np.array(Shape) // 2)
+      Grid[Low[0]:High[0], Low[1]:High[1], Low[2]:High[2]] = 1
+      Buffer = io.BytesIO()
+      np.save(Buffer, Grid.reshape(-1))
+      zf.writestr('{}/30/{}/{}_{:04d}.npy'.format(Category, Mode, Category, s), Buffer.getvalue())
+with zipfile.ZipFile('volumetric_data.zip', 'w') as zf:
+  zf.write('volumetric_data_.zip')
+os.remove('volumetric_data_.zip')
+
+
+def get_batch_reference(dataset, indices):
+  #The original get_batch (ported to Python 3): each sample is decompressed from the zip file
+  rn = random.randint
+  bs = len(indices)
+  voxs = np.zeros([bs, 100,100,50, 1], dtype=np.float32)
+  one_hots = np.zeros([bs, dataset.num_categories], dtype=np.float32)
+  data = dataset.data
+  for bi in range(bs):
+    v = data[indices[bi]]
+    d = v.voxels.reshape([98,98,48, 1])
+    for axis in 0,1,2:
+      if rn(0,1):
+        d = np.flip(d, axis)
+    ox, oy, oz = rn(0,2), rn(0,2), rn(0,2)
+    voxs[bi, ox:98+ox,oy:98+oy,oz:48+oz] = d
+    one_hots[bi][v.label] = 1
+  return voxs, one_hots
+
+
+###################################################################################################
+# Conversion and checks
+###################################################################################################
+
+
+Start = time.perf_counter()
+Dataset = ShapeNet40Vox30()
+ConversionTime = time.perf_counter() - Start
+
+Start = time.perf_counter()
+Dataset = ShapeNet40Vox30()
+ReopenTime = time.perf_counter() - Start
+
+for Mode in [ 'train', 'test' ]:
+  Data = Dataset.train.data if Mode == 'train' else Dataset.test.data
+  All = list(range(len(Data)))
+  random.seed(1)
+  Reference = get_batch_reference(Dataset, All)
+  random.seed(1)
+  Cached = Dataset.get_batch_of(All)
+  assert np.array_equal(Reference[0], Cached[0]) and np.array_equal(Reference[1], Cached[1]), "Batches differ for the {} samples".format(Mode)
+print("Cached batches are identical to the zip file ones for all {} training and {} test samples".format(len(Dataset.train), len(Dataset.test)))
+
+# The cache is rebuilt when the data changes
+os.utime('volumetric_data_.zip', ns=(0, 0))
+assert Dataset._cache_is_valid() == False, "Changed data is not detected"
+Dataset = ShapeNet40Vox30()
+assert Dataset._cache_is_valid() == True, "Cache is not rebuilt"
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+BatchSize = int(args.batchsize)
+Dataset.train
+Order = [ Random.integers(0, len(Dataset), BatchSize) for b in range(int(args.batches)) ]
+
+Start = time.perf_counter()
+for Indices in Order:
+  get_batch_reference(Dataset, Indices)
+ZipTime = (time.perf_counter() - Start) / len(Order)
+
+Start = time.perf_counter()
+for Indices in Order:
+  Dataset.get_batch_of(Indices)
+CacheTime = (time.perf_counter() - Start) / len(Order)
+
+Start = time.perf_counter()
+for Indices in Order:
+  Dataset._voxels['train'][np.sort(Indices)]
+GatherTime = (time.perf_counter() - Start) / len(Order)
+
+print("\nOne-time conversion of {} samples: {:.2f} s, {:.0f} MB; opening the valid cache: {:.3f} s".format(len(Dataset.train) + len(Dataset.test), ConversionTime, sum(os.path.getsize(os.path.join('volumetric_data_cache', f)) for f in os.listdir('volumetric_data_cache')) / 1e6, ReopenTime))
+print("{:<36} {:>10} {:>12}".format("Batches of {}".format(BatchSize), "batches/s", "ms/batch"))
+print("{:<36} {:>10.1f} {:>12.1f}".format("decompress from zip", 1/ZipTime, 1000*ZipTime))
+print("{:<36} {:>10.1f} {:>12.1f}".format("memory mapped cache", 1/CacheTime, 1000*CacheTime))
+print("{:<36} {:>10.1f} {:>12.1f}".format("  thereof the gather of the grids", 1/GatherTime, 1000*GatherTime))
+
+os.chdir('/')
+shutil.rmtree(Directory)
+
+
+# END
+###################################################################################################
@@ -0,0 +1,252 @@
+###################################################################################################
+#
+# benchmark_voxelgrid.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import os
+import math
+import time
+import argparse
+import numpy as np
+
+from voxelgrid import VoxelGrid, flattenHitList, flattenEventData
+
+
+###################################################################################################
+
+
+"""
+Checks that the shared VoxelGrid engine gives the same voxels as the original per-hit loops of
+all four callers - EventTypeIdentification and EnergyLossEstimate, PairIdentification and
+ComptonTrackIdentification - checks its other options and that all copies of voxelgrid.py are
+identical, and benchmarks the loop against the dense and the sparse voxelization. The original
+loops truncate the bins with int(), which the grid reproduces with Rounding='truncate'. By
+default the grid floors the bins, which equals the loops with math.floor, i.e. without the hits
+up to one bin below the minimum in bin 0.
+For all the command line options, try:
+
+python3 benchmark_voxelgrid.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the shared voxel grid against the original loops.')
+parser.add_argument('-b', '--batchsize', default='128', help='Batch size')
+parser.add_argument('-n', '--batches', default='20', help='Number of benchmarked batches')
+
+args = parser.parse_args()
+
+BatchSize = int(args.batchsize)
+
+Random = np.random.default_rng(0)
+
+# The grids of the callers
+EventTypeBins, EventTypeRanges = (110, 110, 48), ((-55, 55), (-55, 55), (0, 48))
+PairBins, PairRanges = (32, 32, 64), ((-43, 43), (-43, 43), (13, 45))
+
+
+class Event:
+  def __init__(self, Hits):
+    self.X, self.Y, self.Z, self.E = [ np.ascontiguousarray(Hits[:, a]) for a in range(4) ]
+
+
+def make_hits(NEvents, Ranges):
+  #A few to a few dozen hits per event, some outside of the ranges, some in the same voxel
+  EventHits = []
+  for e in range(NEvents):
+    NHits = int(Random.integers(0, 40))
+    Hits = np.empty((NHits, 4))
+    for a in range(3):
+      Min, Max = Ranges[a]
+      Hits[:, a] = Random.uniform(Min - 0.05*(Max - Min), Max + 0.05*(Max - Min), NHits)
+    Hits[:, 3] = Random.exponential(100, NHits)
+    if NHits > 2:
+      Hits[1, :3] = Hits[0, :3]
+    EventHits.append(Hits)
+  return EventHits
+
+
+# The original loop of get_batch / fill_batch: scaled bins, summed energies, bounds checked
+def scaled_sum_loop(EventHits, Bins, Ranges, Round=int):
+  (XMin, XMax), (YMin, YMax), (ZMin, ZMax) = Ranges
+  XBins, YBins, ZBins = Bins
+  voxs = np.zeros([len(EventHits), XBins, YBins, ZBins, 1], dtype=np.float32)
+  for bi, Hits in enumerate(EventHits):
+    for i in Hits:
+      xbin = Round (((i[0] - XMin) / (XMax - XMin)) * XBins)
+      ybin = Round (((i[1] - YMin) / (YMax - YMin)) * YBins)
+      zbin = Round (((i[2] - ZMin) / (ZMax - ZMin)) * ZBins)
+      if xbin >= 0 and ybin >= 0 and zbin >= 0 and xbin < XBins and ybin < YBins and zbin < ZBins:
+        voxs[bi, xbin, ybin, zbin] += i[3]
+  return voxs
+
+
+# The original loops of PairIdentification and ComptonTrackIdentification: width bins, the last hit or the sum
+def width_loop(Events, Bins, Ranges, Accumulate, DType, Round=int):
+  (XMin, XMax), (YMin, YMax), (ZMin, ZMax) = Ranges
+  XBins, YBins, ZBins = Bins
+  InputTensor = np.zeros(shape=(len(Events), XBins, YBins, ZBins, 1), dtype=DType)
+  for g, Event in enumerate(Events):
+    for h in range(0, len(Event.X)):
+      XBin = Round( (Event.X[h] - XMin) / ((XMax - XMin) / XBins) )
+      YBin = Round( (Event.Y[h] - YMin) / ((YMax - YMin) / YBins) )
+      ZBin = Round( (Event.Z[h] - ZMin) / ((ZMax - ZMin) / ZBins) )
+      if XBin >= 0 and YBin >= 0 and ZBin >= 0 and XBin < XBins and YBin < YBins and ZBin < ZBins:
+        if Accumulate:
+          InputTensor[g][XBin][YBin][ZBin][0] += Event.E[h]
+        else:
+          InputTensor[g][XBin][YBin][ZBin][0] = Event.E[h]
+  return InputTensor
+
+
+def dense_from_coo(Grid, Coordinates, Values, NEvents):
+  Dense = np.zeros(Grid.shape(NEvents), dtype=Grid.DType)
+  Dense[Coordinates[:, 0], Coordinates[:, 1], Coordinates[:, 2], Coordinates[:, 3], 0] = Values
+  return Dense
+
+
+###################################################################################################
+# Equivalence checks
+###################################################################################################
+
+
+# Hits just below the minimum are outside the grid, unless truncated as in the original loops
+Hits = np.array([ [ -0.5, 0.5, 0.5, 1.0 ], [ -1.5, 0.5, 0.5, 2.0 ], [ 9.5, 0.5, 0.5, 4.0 ], [ 10.0, 0.5, 0.5, 8.0 ] ])
+Offsets = np.array([ 0, len(Hits) ])
+for Rounding, Kept in [ ('floor', [ False, False, True, False ]), ('truncate', [ True, False, True, False ]) ]:
+  Grid = VoxelGrid((10, 1, 1), ((0, 10), (0, 1), (0, 1)), Binning='width', Rounding=Rounding)
+  assert np.array_equal(Grid.indices(Hits, Offsets)[1], Kept), "Kept hits differ for {}".format(Rounding)
+
+# EventTypeIdentification and EnergyLossEstimate
+EventHits = make_hits(64, EventTypeRanges)
+Hits, Offsets = flattenHitList(EventHits)
+for Rounding, Round in [ ('truncate', int), ('floor', math.floor) ]:
+  Grid = VoxelGrid(EventTypeBins, EventTypeRanges, Binning='scaled', OutOfRange='drop', Reduction='sum', Rounding=Rounding)
+  Reference = scaled_sum_loop(EventHits, EventTypeBins, EventTypeRanges, Round)
+  assert np.allclose(Grid.dense(Hits, Offsets), Reference, rtol=1e-6), "EventTypeIdentification grid differs for {}".format(Rounding)
+  assert np.allclose(dense_from_coo(Grid, *Grid.coo(Hits, Offsets), len(EventHits)), Reference, rtol=1e-6), "Sparse EventTypeIdentification grid differs for {}".format(Rounding)
+
+# Selected events and the reused output buffer
+Selected = [3, 1, 4, 1, 5]
+Hits, Offsets = flattenHitList(EventHits, Selected)
+Out = np.full(Grid.shape(len(Selected)), 7, dtype=np.float32)
+assert Grid.dense(Hits, Offsets, Out) is Out
+assert np.allclose(Out, scaled_sum_loop([ EventHits[i] for i in Selected ], EventTypeBins, EventTypeRanges, math.floor), rtol=1e-6)
+
+# PairIdentification, summed and last hit, and ComptonTrackIdentification
+PairEvents = [ Event(Hits) for Hits in make_hits(64, PairRanges) ]
+Hits, Offsets = flattenEventData(PairEvents)
+for Rounding, Round in [ ('truncate', int), ('floor', math.floor) ]:
+  for Reduction, DType in [ ('sum', np.float32), ('last', np.float32), ('last', np.float64) ]:
+    Grid = VoxelGrid(PairBins, PairRanges, Binning='width', OutOfRange='drop', Reduction=Reduction, DType=DType, Rounding=Rounding)
+    Reference = width_loop(PairEvents, PairBins, PairRanges, Reduction == 'sum', DType, Round)
+    Dense = Grid.dense(Hits, Offsets)
+    assert Dense.dtype == DType
+    if Reduction == 'sum':
+      assert np.allclose(Dense, Reference, rtol=1e-6), "PairIdentification grid differs for {}".format(Rounding)
+    else:
+      assert np.array_equal(Dense, Reference), "Grid with the last hit differs for {} and {}".format(np.dtype(DType).name, Rounding)
+    assert np.allclose(dense_from_coo(Grid, *Grid.coo(Hits, Offsets), len(PairEvents)), Reference, rtol=1e-6), "Sparse grid differs for {} and {}".format(Reduction, Rounding)
+
+# The hits per event replace the SomethingAdded flag of ComptonTrackIdentification.CheckPerformance,
+# the mask comes from the same binning pass as the dense voxels
+Dense, Inside = Grid.dense(Hits, Offsets, ReturnInside=True)
+assert np.array_equal(Inside, Grid.indices(Hits, Offsets)[1]) and np.array_equal(Dense, Grid.dense(Hits, Offsets))
+HitsAdded = Grid.hitsPerEvent(Offsets, Inside)
+for e, Ev in enumerate(PairEvents):
+  Added = 0
+  for h in range(len(Ev.X)):
+    Bins = [ math.floor((V - Min) / ((Max - Min) / N)) for V, (Min, Max), N in zip((Ev.X[h], Ev.Y[h], Ev.Z[h]), PairRanges, PairBins) ]
+    Added += all(0 <= b < N for b, N in zip(Bins, PairBins))
+  assert HitsAdded[e] == Added, "Hits per event differ"
+
+# The other reductions and the clip policy
+Grid = VoxelGrid(PairBins, PairRanges, Binning='width', OutOfRange='clip', Reduction='max', DType=np.float64)
+Dense = Grid.dense(Hits, Offsets)
+Counts = VoxelGrid(PairBins, PairRanges, Binning='width', OutOfRange='clip', Reduction='count').dense(Hits, Offsets)
+assert Counts.sum() == len(Hits), "Clipping lost hits"
+for e, Ev in enumerate(PairEvents[:16]):
+  for h in range(len(Ev.X)):
+    Bins = [ min(max(math.floor((V - Min) / ((Max - Min) / N)), 0), N - 1) for V, (Min, Max), N in zip((Ev.X[h], Ev.Y[h], Ev.Z[h]), PairRanges, PairBins) ]
+    assert Dense[e, Bins[0], Bins[1], Bins[2], 0] >= Ev.E[h], "Maximum is too small"
+assert np.array_equal(dense_from_coo(Grid, *Grid.coo(Hits, Offsets), len(PairEvents)), Dense), "Sparse maximum differs"
+assert np.count_nonzero(Dense) == np.count_nonzero(Counts)
+
+# Empty batches and invalid options
+Hits, Offsets = flattenHitList([ np.zeros((0, 4)), np.zeros((0, 4)) ])
+assert not Grid.dense(Hits, Offsets).any() and len(Grid.coo(Hits, Offsets)[1]) == 0
+for Options in [ { 'Binning': 'log' }, { 'OutOfRange': 'wrap' }, { 'Reduction': 'mean' }, { 'Rounding': 'nearest' } ]:
+  try:
+    VoxelGrid(PairBins, PairRanges, **Options)
+    assert False, "No error for {}".format(Options)
+  except ValueError:
+    pass
+
+# All folders use the same engine: the copies only differ in their headers
+Bodies = []
+for Folder in [ 'eventtypeidentification', 'energylossestimate', 'comptontracks', 'pairidentification' ]:
+  with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', Folder, 'voxelgrid.py')) as File:
+    Source = File.read()
+  Bodies.append(Source[Source.index("import numpy"):])
+assert all(Body == Bodies[0] for Body in Bodies), "The copies of voxelgrid.py differ"
+
+print("Equivalence checks passed")
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+NBatches = int(args.batches)
+for Name, Bins, Ranges, Binning, Reduction in [ ("EventTypeIdentification, EnergyLossEstimate", EventTypeBins, EventTypeRanges, 'scaled', 'sum'),
+                                                ("PairIdentification, ComptonTrackIdentification", PairBins, PairRanges, 'width', 'last') ]:
+  Batches = [ make_hits(BatchSize, Ranges) for b in range(NBatches) ]
+  Grid = VoxelGrid(Bins, Ranges, Binning=Binning, OutOfRange='drop', Reduction=Reduction)
+  print("\n{}: {} batches of {} events on a {}x{}x{} grid".format(Name, NBatches, BatchSize, *Bins))
+
+  Start = time.perf_counter()
+  for EventHits in Batches:
+    if Binning == 'scaled':
+      scaled_sum_loop(EventHits, Bins, Ranges)
+    else:
+      width_loop([ Event(Hits) for Hits in EventHits ], Bins, Ranges, False, np.float32)
+  LoopTime = time.perf_counter() - Start
+
+  Out = np.zeros(Grid.shape(BatchSize), dtype=np.float32)
+  Start = time.perf_counter()
+  for EventHits in Batches:
+    Hits, Offsets = flattenHitList(EventHits)
+    Grid.dense(Hits, Offsets, Out)
+  DenseTime = time.perf_counter() - Start
+
+  Start = time.perf_counter()
+  for EventHits in Batches:
+    Hits, Offsets = flattenHitList(EventHits)
+    Grid.coo(Hits, Offsets)
+  SparseTime = time.perf_counter() - Start
+
+  Start = time.perf_counter()
+  for EventHits in Batches:
+    Out.fill(0)
+  ZeroTime = time.perf_counter() - Start
+
+  print("  per-hit loop:       {:8.2f} ms/batch".format(1000*LoopTime/NBatches))
+  print("  dense, reused:      {:8.2f} ms/batch   ({:.0f}x)".format(1000*DenseTime/NBatches, LoopTime/DenseTime))
+  print("    of which zeroing: {:8.2f} ms/batch   ({:.0f} MB)".format(1000*ZeroTime/NBatches, Out.nbytes/1e6))
+  print("  sparse coordinates: {:8.2f} ms/batch   ({:.0f}x)".format(1000*SparseTime/NBatches, LoopTime/SparseTime))
+
+
+# END
+###################################################################################################
@@ -0,0 +1,164 @@
+###################################################################################################
+#
+# benchmark_voxelization.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import gc
+import time
+import argparse
+import numpy as np
+
+from voxelization import flattenHits, voxelizeBatch, BatchVoxelizer
+
+
+###################################################################################################
+
+
+"""
+Checks that the batch voxelizer used by EventTypeIdentification.get_batch gives the same voxels
+as the original hit-by-hit loop, and benchmarks the loop, the scatter into a buffer which is zeroed
+for each batch, and the scatter into a buffer of which only the previously filled voxels are reset.
+For all the command line options, try:
+
+python3 benchmark_voxelization.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the voxelization of EventTypeIdentification.get_batch.')
+parser.add_argument('-b', '--batchsizes', default='64,128,256,512,1024', help='Comma separated list of batch sizes')
+parser.add_argument('-n', '--batches', default='3', help='Number of timed batches per batch size')
+parser.add_argument('-e', '--events', default='20000', help='Number of toy events')
+
+args = parser.parse_args()
+
+# Same binning as EventTypeIdentification
+XBins, YBins, ZBins = 110, 110, 48
+XMin, XMax, YMin, YMax, ZMin, ZMax = -55, 55, -55, 55, 0, 48
+Bins = (XBins, YBins, ZBins)
+Ranges = ((XMin, XMax), (YMin, YMax), (ZMin, ZMax))
+
+Random = np.random.default_rng(0)
+
+
+def make_toy_event():
+  #A random walk of hits inside the detector, with a few empty events as in the sim files
+  NHits = int(Random.integers(0, 40))
+  Start = np.array([ Random.uniform(-50, 50), Random.uniform(-50, 50), Random.uniform(1, 47) ])
+  Pos = Start + np.cumsum(Random.normal(0, 1.0, (NHits, 3)), axis=0)
+  Pos = np.clip(Pos, [XMin, YMin, ZMin], [XMax - 0.01, YMax - 0.01, ZMax - 0.01])
+  return np.column_stack((Pos, Random.exponential(300, NHits)))
+
+
+EventHits = [ make_toy_event() for e in range(int(args.events)) ]
+
+
+def select(LastEventIndex, bs):
+  #The event selection of get_batch
+  Indices = []
+  for bi in range(bs):
+    LastEventIndex += 1
+    if LastEventIndex == len(EventHits):
+      LastEventIndex = 0
+    while len(EventHits[LastEventIndex]) == 0:
+      LastEventIndex += 1
+      if LastEventIndex == len(EventHits):
+        LastEventIndex = 0
+    Indices.append(LastEventIndex)
+  return Indices
+
+
+def get_batch_reference(Indices):
+  #The original loop of get_batch
+  voxs = np.zeros([len(Indices), XBins, YBins, ZBins, 1], dtype=np.float32)
+  for bi, Index in enumerate(Indices):
+    for i in EventHits[Index]:
+      xbin = (int) (((i[0] - XMin) / (XMax - XMin)) * XBins)
+      ybin = (int) (((i[1] - YMin) / (YMax - YMin)) * YBins)
+      zbin = (int) (((i[2] - ZMin) / (ZMax - ZMin)) * ZBins)
+      voxs[bi, xbin, ybin, zbin] += i[3]
+  return voxs
+
+
+def get_batch_vectorized(Indices, Buffer):
+  Hits, Offsets = flattenHits(EventHits, Indices)
+  return voxelizeBatch(Hits, Offsets, Bins, Ranges, Buffer)
+
+
+def get_batch_voxelizer(Indices, Voxelizer):
+  Hits, Offsets = flattenHits(EventHits, Indices)
+  return Voxelizer.voxelize(Hits, Offsets)
+
+
+###################################################################################################
+# Equivalence check
+###################################################################################################
+
+
+Voxelizer = BatchVoxelizer(Bins, Ranges)
+for Start in [ 0, 256 ]:
+  Indices = select(Start, 256)
+  Reference = get_batch_reference(Indices)
+  Vectorized = get_batch_vectorized(Indices, None)
+  # np.add.at sums in float32 in the hit order, the loop sums float64 energies into float32 voxels
+  assert np.allclose(Vectorized, Reference, rtol=1e-6), "Voxelization differs"
+  assert np.array_equal(Vectorized != 0, Reference != 0), "Occupied voxels differ"
+  # The second batch checks that the voxels of the first one are reset in the reused buffer
+  assert np.array_equal(get_batch_voxelizer(Indices, Voxelizer), Vectorized), "Reused buffer differs"
+  print("Equivalence check passed for {} events, {} occupied voxels".format(len(Indices), np.count_nonzero(Reference)))
+del Reference, Vectorized, Voxelizer
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+print("\n{:>10} {:>12} {:>14} {:>14} {:>14} {:>10}".format("batch size", "hits/batch", "loop", "scatter+fill", "scatter+reset", "speedup"))
+print("{:>10} {:>12} {:>14} {:>14} {:>14}".format("", "", "[ms/batch]", "[ms/batch]", "[ms/batch]"))
+for bs in [ int(b) for b in args.batchsizes.split(',') ]:
+  Batches = [ select(i*bs, bs) for i in range(int(args.batches)) ]
+  NHits = np.mean([ sum(len(EventHits[i]) for i in Indices) for Indices in Batches ])
+
+  Start = time.perf_counter()
+  for Indices in Batches:
+    voxs = get_batch_reference(Indices)
+    del voxs
+  LoopTime = (time.perf_counter() - Start) / len(Batches)
+  gc.collect()
+
+  # The buffers are allocated and touched before timing, as in get_batch after the first call
+  Buffer = np.zeros([bs, XBins, YBins, ZBins, 1], dtype=np.float32)
+  Buffer.fill(0)
+  Start = time.perf_counter()
+  for Indices in Batches:
+    get_batch_vectorized(Indices, Buffer)
+  FillTime = (time.perf_counter() - Start) / len(Batches)
+  del Buffer
+  gc.collect()
+
+  Voxelizer = BatchVoxelizer(Bins, Ranges)
+  get_batch_voxelizer(Batches[-1], Voxelizer).fill(0)
+  Start = time.perf_counter()
+  for Indices in Batches:
+    get_batch_voxelizer(Indices, Voxelizer)
+  ResetTime = (time.perf_counter() - Start) / len(Batches)
+  del Voxelizer
+  gc.collect()
+
+  print("{:>10} {:>12.0f} {:>14.1f} {:>14.1f} {:>14.1f} {:>9.1f}x".format(bs, NHits, 1000*LoopTime, 1000*FillTime, 1000*ResetTime, LoopTime/ResetTime))
+
+
+# END
+###################################################################################################
@@ -0,0 +1,115 @@
+###################################################################################################
+#
+# check_hitstorage.py
+#
+# Copyright (C) by Andreas Zoglauer.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import time
+import argparse
+import numpy as np
+
+from hitstorage import RaggedHits, listMemory
+from voxelization import flattenHits
+
+
+###################################################################################################
+
+
+"""
+Checks the flat hit storage used by EventTypeIdentification.loadData: the labels must stay
+aligned with the hits after the shuffle, the train and test sets must share one hit array, and
+the batch gather must agree with the list of arrays. Reports the memory of both layouts.
+For all the command line options, try:
+
+python3 check_hitstorage.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check the flat hit storage of EventTypeIdentification.')
+parser.add_argument('-e', '--events', default='200000', help='Number of toy events')
+parser.add_argument('-b', '--batchsize', default='256', help='Batch size of the gather benchmark')
+
+args = parser.parse_args()
+
+Random = np.random.default_rng(0)
+
+
+# Toy events as in loadData: a list of (N, 4) float64 arrays and a list of event types
+# The type is encoded in the energies (type * 1000 + something below 1000), to check the alignment
+EventTypes = [ int(t) for t in Random.choice([0, 1, 2, 10, 11, 12], size=int(args.events)) ]
+EventHits = []
+for Type in EventTypes:
+  NHits = int(Random.integers(0, 30))
+  Hits = np.zeros((NHits, 4))
+  Hits[:, 0:2] = Random.uniform(-55, 55, (NHits, 2))
+  Hits[:, 2] = Random.uniform(0, 48, NHits)
+  Hits[:, 3] = Type * 1000 + Random.uniform(1, 999, NHits)
+  EventHits.append(Hits)
+
+
+###################################################################################################
+# Checks
+###################################################################################################
+
+
+Events = RaggedHits.fromEventList(EventHits, EventTypes)
+assert Events.Hits.dtype == np.float32 and Events.Offsets.dtype == np.int64 and Events.Labels.dtype == np.int8
+assert len(Events) == len(EventHits)
+for i in Random.integers(0, len(EventHits), 1000):
+  assert np.array_equal(Events.event(i), EventHits[i].astype(np.float32)), "Event {} differs".format(i)
+
+Train, Test = Events.shuffledSplit(0.75, np.random.default_rng(1))
+assert len(Train) == int(np.ceil(0.75 * len(Events))) and len(Train) + len(Test) == len(Events)
+assert Train.Hits.base is not None and Train.Hits.base is Test.Hits.base, "Train and test set do not share the hit array"
+for Set in [ Train, Test ]:
+  NHits = Set.numberOfHits()
+  EventOfHit = np.repeat(np.arange(len(Set)), NHits)
+  assert np.array_equal(np.floor(Set.Hits[:, 3] / 1000).astype(np.int64), Set.Labels[EventOfHit]), "Labels are not aligned with the hits after the shuffle"
+assert sorted(np.concatenate((Train.Labels, Test.Labels))) == sorted(EventTypes), "Labels were lost in the shuffle"
+assert not np.array_equal(np.concatenate((Train.Labels, Test.Labels)), Events.Labels), "Nothing was shuffled"
+
+Indices = Random.integers(0, len(Events), int(args.batchsize))
+Hits, Offsets = Events.gather(Indices)
+ListHits, ListOffsets = flattenHits(EventHits, Indices)
+assert np.array_equal(Offsets, ListOffsets) and np.array_equal(Hits, ListHits.astype(np.float32)), "Gather differs"
+
+print("All checks passed for {} events".format(len(Events)))
+
+
+###################################################################################################
+# Memory and gather time
+###################################################################################################
+
+
+print("\nMemory of {} events with {} hits:".format(len(Events), len(Events.Hits)))
+print("  list of arrays:             {:8.1f} MB".format(listMemory(EventHits, EventTypes) / 1e6))
+print("  flat array with offsets:    {:8.1f} MB".format(Events.nbytes() / 1e6))
+
+Batches = [ Random.integers(0, len(Events), int(args.batchsize)) for b in range(200) ]
+Start = time.perf_counter()
+for Indices in Batches:
+  flattenHits(EventHits, Indices)
+ListTime = (time.perf_counter() - Start) / len(Batches)
+Start = time.perf_counter()
+for Indices in Batches:
+  Events.gather(Indices)
+GatherTime = (time.perf_counter() - Start) / len(Batches)
+
+print("\nHits of a batch of {} events:".format(args.batchsize))
+print("  concatenate list of arrays: {:8.3f} ms".format(1000*ListTime))
+print("  gather from flat array:     {:8.3f} ms".format(1000*GatherTime))
+
+
+# END
+###################################################################################################
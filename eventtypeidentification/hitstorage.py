@@ -0,0 +1,160 @@
+###################################################################################################
+#
+# hitstorage.py
+#
+# Copyright (C) by Andreas Zoglauer, Anna Shang, Amal Metha & Caitlyn Chen.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import sys
+import numpy as np
+
+
+###################################################################################################
+
+
+class RaggedHits:
+  """
+  Stores the hits of many events in CSR form: one flat float32 (total hits, 4) array of x, y, z,
+  energy, int64 offsets, such that the hits of event i are Hits[Offsets[i]:Offsets[i+1]], and
+  one int8 label (event type) per event. A typical usage would look like this:
+
+  Events = RaggedHits.fromEventList(EventHits, EventTypes)
+  Train, Test = Events.shuffledSplit(0.75)
+  Hits, Offsets = Train.gather([3, 7, 8])
+
+  """
+
+  def __init__(self, Hits, Offsets, Labels):
+    self.Hits = Hits
+    self.Offsets = Offsets
+    self.Labels = Labels
+
+
+###################################################################################################
+
+
+  @classmethod
+  def fromEventList(cls, EventHits, EventTypes):
+    """
+    Create the storage from a list of per event (N, 4) hit arrays and a list of event types
+    """
+
+    Offsets = np.zeros(len(EventHits) + 1, dtype=np.int64)
+    Offsets[1:] = np.cumsum([len(h) for h in EventHits])
+    Hits = np.zeros((Offsets[-1], 4), dtype=np.float32)
+    for i in range(0, len(EventHits)):
+      Hits[Offsets[i]:Offsets[i+1]] = EventHits[i]
+
+    return cls(Hits, Offsets, np.array(EventTypes, dtype=np.int8))
+
+
+###################################################################################################
+
+
+  def __len__(self):
+    return len(self.Labels)
+
+
+  def numberOfHits(self):
+    """
+    Number of hits of each event
+    """
+
+    return np.diff(self.Offsets)
+
+
+  def event(self, i):
+    """
+    The (N, 4) hits of event i (a view)
+    """
+
+    return self.Hits[self.Offsets[i]:self.Offsets[i+1]]
+
+
+  def nbytes(self):
+    """
+    Memory of the arrays in bytes
+    """
+
+    return self.Hits.nbytes + self.Offsets.nbytes + self.Labels.nbytes
+
+
+###################################################################################################
+
+
+  def slice(self, Start, Stop):
+    """
+    The events Start to Stop-1 as a new storage which shares the hit array
+    """
+
+    return RaggedHits(self.Hits[self.Offsets[Start]:self.Offsets[Stop]], self.Offsets[Start:Stop+1] - self.Offsets[Start], self.Labels[Start:Stop])
+
+
+  def gather(self, Indices):
+    """
+    Concatenate the hits of the selected events without a Python loop
+
+    Returns
+    -------
+    numpy.ndarray
+      All hits of the selected events as one (total hits, 4) array
+    numpy.ndarray
+      Offsets: the hits of the i-th selected event are Hits[Offsets[i]:Offsets[i+1]]
+    """
+
+    Indices = np.asarray(Indices, dtype=np.int64)
+    Lengths = self.Offsets[Indices+1] - self.Offsets[Indices]
+    Offsets = np.zeros(len(Indices) + 1, dtype=np.int64)
+    Offsets[1:] = np.cumsum(Lengths)
+    Rows = np.repeat(self.Offsets[Indices] - Offsets[:-1], Lengths) + np.arange(Offsets[-1])
+
+    return self.Hits[Rows], Offsets
+
+
+  def take(self, Indices):
+    """
+    The selected events, in the given order, as a new storage
+    """
+
+    Hits, Offsets = self.gather(Indices)
+    return RaggedHits(Hits, Offsets, self.Labels[Indices])
+
+
+  def shuffledSplit(self, Fraction, Generator=np.random):
+    """
+    Permute hits and labels with one common permutation, and split them into the first
+    ceil(Fraction * events) events and the rest. Both parts share one hit array.
+    """
+
+    Shuffled = self.take(Generator.permutation(len(self)))
+    Split = int(np.ceil(len(self) * Fraction))
+
+    return Shuffled.slice(0, Split), Shuffled.slice(Split, len(self))
+
+
+###################################################################################################
+
+
+def listMemory(EventHits, EventTypes):
+  """
+  Memory in bytes of the hits as list of per-event numpy arrays and of the types as list of ints
+  """
+
+  Bytes = sys.getsizeof(EventHits) + sys.getsizeof(EventTypes)
+  Bytes += sum(sys.getsizeof(h) for h in EventHits)
+  Bytes += sum(sys.getsizeof(t) for t in EventTypes)
+
+  return Bytes
+
+
+# END
+###################################################################################################
@@ -0,0 +1,47 @@
+import numpy as np
+
+def conv_output_shape(grid_shape, filter_size, stride):
+	"""Output grid of a 'VALID' 3D convolution"""
+	return tuple((n - filter_size) // stride + 1 for n in grid_shape)
+
+def build_rulebook(coords, batch_size, grid_shape, filter_size, stride):
+	"""
+	Rulebook of a 'VALID' 3D convolution evaluated on the active voxels only.
+	coords is the (N, 4) array of (batch, x, y, z) of the active input voxels. Every active output
+	site is one whose receptive field contains at least one active input voxel.
+
+	Returns, with one entry per (input voxel, kernel offset) pair that hits an output site:
+		in_index: index into coords
+		out_index: index into out_coords
+		kernel_index: flat index into the kernel reshaped to (filter_size**3, in, out)
+	and out_coords, the (M, 4) array of (batch, x, y, z) of the active output sites.
+	"""
+	out_shape = conv_output_shape(grid_shape, filter_size, stride)
+	offsets = np.stack(np.meshgrid(*[np.arange(filter_size)]*3, indexing='ij'), axis=-1).reshape(-1, 3)
+
+	# Input p contributes to output o with offset d if p = o * stride + d
+	rel = coords[:, None, 1:].astype(np.int32) - offsets[None, :, :].astype(np.int32)
+	valid = np.all((rel >= 0) & (rel % stride == 0) & (rel // stride < np.array(out_shape)), axis=2)
+	in_index, kernel_index = np.nonzero(valid)
+	out = rel[in_index, kernel_index] // stride
+
+	dims = (batch_size,) + out_shape
+	linear = np.ravel_multi_index((coords[in_index, 0], out[:, 0], out[:, 1], out[:, 2]), dims)
+	sites, out_index = np.unique(linear, return_inverse=True)
+	out_coords = np.stack(np.unravel_index(sites, dims), axis=1)
+
+	return in_index, out_index.reshape(-1), kernel_index, out_coords
+
+def sparse_conv3d(values, rulebook, kernel):
+	"""
+	NumPy version of the gather based convolution of VoxNet.sparse_conv3d, without the bias.
+	values is the (N, in) array of the active voxels, kernel has the shape
+	(filter_size, filter_size, filter_size, in, out). Returns the (M, out) values of the active
+	output sites of the rulebook.
+	"""
+	in_index, out_index, kernel_index, out_coords = rulebook
+	weights = kernel.reshape(-1, kernel.shape[-2], kernel.shape[-1])
+	pairs = np.einsum('ri,rio->ro', values[in_index], weights[kernel_index])
+	sites = np.zeros((len(out_coords), kernel.shape[-1]), dtype=pairs.dtype)
+	np.add.at(sites, out_index, pairs)
+	return sites
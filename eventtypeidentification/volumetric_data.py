@@ -1,13 +1,14 @@
 import numpy as np
 import os
-import cStringIO
-import tensorflow as tf
+import io
 import random
 import zipfile
 
 class ShapeNet40Vox30(object):
 
-	def __init__(self, batch_size=None):
+	grid_shape = (98, 98, 48)
+
+	def __init__(self, batch_size=None, cache_dir='volumetric_data_cache'):
 
 		class Voxels(object):
 
@@ -19,7 +20,7 @@ class ShapeNet40Vox30(object):
 
 			@property
 			def voxels(self):
-				fi = cStringIO.StringIO(self._zf.read(self._fi))
+				fi = io.BytesIO(self._zf.read(self._fi))
 				return np.load(fi)
 
 			@property 
@@ -35,7 +36,7 @@ class ShapeNet40Vox30(object):
 				return self._fi.filename.split('/')[-1]
 
 			def save(self, f=None):
-				self.filename if f is None else f
+				f = self.filename if f is None else f
 				np.save(f, self.voxels)
 
 		print('Setting up ShapeNet40Vox30 database...')
@@ -71,9 +72,68 @@ class ShapeNet40Vox30(object):
 			self._data[k] = [Voxels(self._zf, i, categories[c], c) for c,i in self._data[k]]
 			self._iters[k] = iter(get_random_iter(k))
 			
-		self.categories = categories.keys() 
+		self.categories = sorted(categories, key=categories.get)
+
+		self._cache_dir = cache_dir
+		if not self._cache_is_valid():
+			self.build_cache()
+		self._voxels = {}
+		self._labels = {}
+		for k in self._data:
+			self._voxels[k] = np.load(self._cache_file(k, 'voxels'), mmap_mode='r')
+			self._labels[k] = np.load(self._cache_file(k, 'labels'))
 		print('ShapeNet40Vox30 database setup complete!')
 
+	def _cache_file(self, mode, what):
+		return os.path.join(self._cache_dir, '{}.{}.npy'.format(mode, what))
+
+	def _cache_source(self):
+		# The cache is rebuilt if the unpacked zip file changes
+		st = os.stat('volumetric_data_.zip')
+		return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+	def _cache_is_valid(self):
+		index = os.path.join(self._cache_dir, 'index.npz')
+		if not os.path.isfile(index):
+			return False
+		with np.load(index) as f:
+			return (np.array_equal(f['source'], self._cache_source()) and
+				list(f['categories']) == self.categories and
+				all(int(f['size_' + k]) == len(self._data[k]) for k in self._data))
+
+	def build_cache(self):
+		"""
+		Decompress all voxel grids once into one contiguous uint8 array per mode, stored as .npy file
+		in the cache directory and memory mapped afterwards, with the labels in the same order.
+		The index with the categories is written last, thus an interrupted conversion is redone.
+		"""
+		print('Converting ShapeNet40Vox30 into memory mapped arrays in {}...'.format(self._cache_dir))
+		if not os.path.isdir(self._cache_dir):
+			os.makedirs(self._cache_dir)
+		index = os.path.join(self._cache_dir, 'index.npz')
+		if os.path.isfile(index):
+			os.remove(index)
+
+		sizes = {}
+		for k in self._data:
+			tmp = self._cache_file(k, 'voxels') + '.tmp'
+			voxels = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8,
+				shape=(len(self._data[k]), int(np.prod(self.grid_shape))))
+			for i, v in enumerate(self._data[k]):
+				d = v.voxels.reshape(-1)
+				voxels[i] = d
+				if not np.array_equal(voxels[i], d):
+					raise ValueError('Voxels of {} are not in the uint8 range'.format(v.filename))
+			voxels.flush()
+			del voxels
+			os.replace(tmp, self._cache_file(k, 'voxels'))
+			np.save(self._cache_file(k, 'labels'), np.array([v.label for v in self._data[k]], dtype=np.int64))
+			sizes['size_' + k] = len(self._data[k])
+
+		with open(index + '.tmp', 'wb') as f:
+			np.savez(f, source=self._cache_source(), categories=np.array(self.categories), **sizes)
+		os.replace(index + '.tmp', index)
+
 	@property
 	def num_categories(self):
 		return len(self.categories)
@@ -96,20 +156,32 @@ class ShapeNet40Vox30(object):
 		return len(self._data[self._mode])
 
 	def get_batch(self, batch_size=None):
-		rn = random.randint
 		bs = batch_size if batch_size is not None else self._batch_size
 		bs = bs if bs is not None else 25
+		next_int = self._iters[self._mode]
+		return self.get_batch_of([next(next_int) for bi in range(bs)])
+
+	def get_batch_of(self, indices):
+		"""
+		Batch of the given samples with random flips and offsets: the grids are gathered from the
+		memory mapped cache in file order with one fancy index
+		"""
+		rn = random.randint
+		bs = len(indices)
+		indices = np.asarray(indices)
+		order = np.argsort(indices, kind='stable')
+		grids = np.empty((bs, int(np.prod(self.grid_shape))), dtype=np.uint8)
+		grids[order] = self._voxels[self._mode][indices[order]]
+		grids = grids.reshape((bs,) + self.grid_shape + (1,))
+
 		voxs = np.zeros([bs, 100,100,50, 1], dtype=np.float32)
 		one_hots = np.zeros([bs, self.num_categories], dtype=np.float32)
-		data = self._data[self._mode]
-		next_int = self._iters[self._mode].next
-		for bi in xrange(bs):
-			v = data[next_int()]
-			d = v.voxels.reshape([98,98,48, 1])
+		one_hots[np.arange(bs), self._labels[self._mode][indices]] = 1
+		for bi in range(bs):
+			d = grids[bi]
 			for axis in 0,1,2: 
 				if rn(0,1): 
 					d = np.flip(d, axis)
 			ox, oy, oz = rn(0,2), rn(0,2), rn(0,2)
 			voxs[bi, ox:98+ox,oy:98+oy,oz:48+oz] = d
-			one_hots[bi][v.label] = 1
-		return voxs, one_hots
\ No newline at end of file
+		return voxs, one_hots
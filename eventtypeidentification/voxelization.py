@@ -0,0 +1,163 @@
+###################################################################################################
+#
+# voxelization.py
+#
+# Copyright (C) by Andreas Zoglauer, Anna Shang, Amal Metha & Caitlyn Chen.
+# All rights reserved.
+#
+# Please see the file License.txt in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import numpy as np
+
+from voxelgrid import VoxelGrid, flattenHitList
+
+
+###################################################################################################
+
+
+def flattenHits(EventHits, Indices):
+  """
+  Concatenate the (x, y, z, energy) hit arrays of the selected events
+
+  Returns
+  -------
+  numpy.ndarray
+    All hits of the selected events as one (total hits, 4) array
+  numpy.ndarray
+    Offsets: the hits of the i-th selected event are Hits[Offsets[i]:Offsets[i+1]]
+  """
+
+  return flattenHitList(EventHits, Indices)
+
+
+###################################################################################################
+
+
+def voxelGrid(Bins, Ranges):
+  """
+  The voxel grid of get_batch: the bins are floor(((x - XMin) / (XMax - XMin)) * XBins) in double
+  precision, hits outside the ranges are dropped, and the energies of hits in the same voxel are
+  summed
+  """
+
+  return VoxelGrid(Bins, Ranges, Binning='scaled', OutOfRange='drop', Reduction='sum', DType=np.float32)
+
+
+###################################################################################################
+
+
+def voxelIndices(Hits, Offsets, Bins, Ranges):
+  """
+  Linearized voxel index into a (events, XBins, YBins, ZBins, 1) tensor of all hits inside the
+  ranges, see voxelGrid
+
+  Returns
+  -------
+  numpy.ndarray
+    The linearized indices of the hits inside the ranges
+  numpy.ndarray
+    The boolean mask of these hits
+  """
+
+  return voxelGrid(Bins, Ranges).indices(Hits, Offsets)
+
+
+###################################################################################################
+
+
+def voxelizeBatch(Hits, Offsets, Bins, Ranges, Out=None):
+  """
+  Voxelize the flattened hits of a batch of events into a (events, XBins, YBins, ZBins, 1) float32
+  tensor, summing the energies of hits in the same voxel with one np.add.at over the linearized
+  indices.
+
+  Attributes
+  ----------
+  Hits : numpy.ndarray
+    (total hits, 4) array of x, y, z, energy
+  Offsets : numpy.ndarray
+    Hits of event i are Hits[Offsets[i]:Offsets[i+1]]
+  Bins : tuple
+    (XBins, YBins, ZBins)
+  Ranges : tuple
+    ((XMin, XMax), (YMin, YMax), (ZMin, ZMax))
+  Out : numpy.ndarray
+    Optional float32 buffer of the output shape, which is zeroed and reused
+
+  Returns
+  -------
+  numpy.ndarray
+    The voxelized batch (Out if given)
+  """
+
+  return voxelGrid(Bins, Ranges).dense(Hits, Offsets, Out)
+
+
+###################################################################################################
+
+
+def voxelizeBatchCOO(Hits, Offsets, Bins, Ranges):
+  """
+  Voxelize the flattened hits of a batch of events into a list of the occupied voxels, summing the
+  energies of hits in the same voxel. The bins are the ones of voxelizeBatch.
+
+  Returns
+  -------
+  numpy.ndarray
+    (occupied voxels, 4) int64 array of (event, x bin, y bin, z bin), sorted
+  numpy.ndarray
+    float32 energy of each occupied voxel
+  """
+
+  return voxelGrid(Bins, Ranges).coo(Hits, Offsets)
+
+
+###################################################################################################
+
+
+class BatchVoxelizer:
+  """
+  Voxelizes batches into one reused buffer. Since less than 1% of the voxels are occupied, only the
+  voxels filled by the previous batch are reset instead of zeroing the whole buffer.
+  The returned tensor is only valid until the next call.
+
+  Voxelizer = BatchVoxelizer((110, 110, 48), ((-55, 55), (-55, 55), (0, 48)))
+  voxs = Voxelizer.voxelize(Hits, Offsets)
+
+  """
+
+  def __init__(self, Bins, Ranges):
+    self.Grid = voxelGrid(Bins, Ranges)
+    self.Bins = self.Grid.Bins
+    self.Ranges = Ranges
+    self.Buffer = None
+    self.LastIndex = None
+
+
+  def voxelize(self, Hits, Offsets):
+    """
+    Voxelize the flattened hits, see voxelizeBatch
+    """
+
+    NEvents = len(Offsets) - 1
+    if self.Buffer is None or self.Buffer.shape[0] != NEvents:
+      self.Buffer = np.zeros(self.Grid.shape(NEvents), dtype=np.float32)
+    else:
+      self.Buffer.reshape(-1)[self.LastIndex] = 0
+
+    Index, Inside = self.Grid.indices(Hits, Offsets)
+    self.Grid.scatter(self.Buffer.reshape(-1), Index, Hits[Inside, 3])
+    self.LastIndex = Index
+
+    return self.Buffer
+
+
+# END
+###################################################################################################
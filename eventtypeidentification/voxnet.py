@@ -1,4 +1,5 @@
 from basenet import *
+from sparseconv import build_rulebook, conv_output_shape
 from functools import reduce
 
 class VoxNet(BaseNet):
@@ -10,6 +11,28 @@ class VoxNet(BaseNet):
 			x = tf.layers.batch_normalization(x, training=self.training)
 			return tf.maximum(x, relu_alpha * x) # leaky relu
 	
+	@BaseNet.layer
+	def sparse_conv3d(self, name, x, num_filters, filter_size, stride, relu_alpha=0.1):
+		"""
+		conv3d with 'VALID' padding evaluated on the active voxels only: x are the values of the
+		active input voxels, and the rulebook in self.sparse pairs each of them with the kernel
+		offsets and output sites it contributes to. The output sites are scattered into the dense
+		grid, and the bias is added densely, thus the result and the variables are the same as the
+		ones of conv3d on the dense input. All later layers stay dense.
+		"""
+		self.sparse_filter = (filter_size, stride)
+		with tf.variable_scope(name) as scope:
+			with tf.variable_scope('conv3d'):
+				kernel = tf.get_variable('kernel', [filter_size]*3 + [1, num_filters], initializer=tf.glorot_uniform_initializer())
+				bias = tf.get_variable('bias', [num_filters], initializer=tf.zeros_initializer())
+			weights = tf.reshape(kernel, [-1, num_filters])
+			pairs = tf.gather(x, self.sparse['rule_in']) * tf.gather(weights, self.sparse['rule_kernel'])
+			sites = tf.unsorted_segment_sum(pairs, self.sparse['rule_out'], tf.shape(self.sparse['out_coords'])[0])
+			shape = tf.concat([self.sparse['batch_size'], tf.constant(conv_output_shape(self.grid_shape, filter_size, stride) + (num_filters,), dtype=tf.int64)], 0)
+			x = tf.scatter_nd(self.sparse['out_coords'], sites, shape) + bias
+			x = tf.layers.batch_normalization(x, training=self.training)
+			return tf.maximum(x, relu_alpha * x) # leaky relu
+
 	@BaseNet.layer
 	def max_pool3d(self, name, x, size=2, stride=2, padding='VALID'):
 		return tf.layers.max_pooling3d(x, size, stride, padding)
@@ -30,14 +53,28 @@ class VoxNet(BaseNet):
 	@BaseNet.layer
 	def softmax(self, name, x): return tf.nn.softmax(x)
 
-	def __init__(self, bSize, xSize, ySize, zSize, MaxLabel, voxnet_type='all_conv'):
+	def __init__(self, bSize, xSize, ySize, zSize, MaxLabel, voxnet_type='all_conv', sparse_input=False):
 		self.training = tf.placeholder_with_default(False, shape=None)
-		super(VoxNet, self).__init__('voxnet', 
-			tf.placeholder(tf.float32, [None, xSize, ySize, zSize, 1]) )
+		self.grid_shape = (xSize, ySize, zSize)
+		self.sparse_input = sparse_input
+		if sparse_input:
+			# Active voxels with their values, and the rulebook of the first convolution, see sparse_feed_dict
+			self.sparse = {
+				'values': tf.placeholder(tf.float32, [None, 1]),
+				'rule_in': tf.placeholder(tf.int64, [None]),
+				'rule_out': tf.placeholder(tf.int64, [None]),
+				'rule_kernel': tf.placeholder(tf.int64, [None]),
+				'out_coords': tf.placeholder(tf.int64, [None, 4]),
+				'batch_size': tf.placeholder(tf.int64, [1]) }
+			super(VoxNet, self).__init__('voxnet', self.sparse['values'])
+		else:
+			super(VoxNet, self).__init__('voxnet', 
+				tf.placeholder(tf.float32, [None, xSize, ySize, zSize, 1]) )
+		conv1 = self.sparse_conv3d if sparse_input else self.conv3d
 
 
 		if voxnet_type == 'original':
-			self.conv3d('conv1', 32, 5, 2)
+			conv1('conv1', 32, 5, 2)
 			self.conv3d('conv2', 32, 3, 1)
 			self.max_pool3d('max_pool')
 			self.fc('fc1', 128)
@@ -46,13 +83,23 @@ class VoxNet(BaseNet):
 			self.softmax('softmax')
 
 		elif voxnet_type == 'all_conv':
-			self.conv3d('conv1', 64, 5, 2)
+			conv1('conv1', 64, 5, 2)
 			self.conv3d('conv2', 64, 3, 1)
 			self.conv3d('conv3', 128, 2, 2)
 			self.conv3d('conv4', 128, 2, 2)
 			self.fc('fc1', 128)
 			self.fc('fc2', MaxLabel, batch_norm=False, relu=False)
 			self.softmax('softmax')
+
+	def sparse_feed_dict(self, coords, values, batch_size):
+		"""
+		Feed dictionary of the sparse input: coords is the (N, 4) array of (batch, x, y, z) of the
+		active voxels, values the (N,) array of their values
+		"""
+		in_index, out_index, kernel_index, out_coords = build_rulebook(coords, batch_size, self.grid_shape, *self.sparse_filter)
+		return { self.sparse['values']: values.reshape(-1, 1), self.sparse['rule_in']: in_index,
+			self.sparse['rule_out']: out_index, self.sparse['rule_kernel']: kernel_index,
+			self.sparse['out_coords']: out_coords, self.sparse['batch_size']: [batch_size] }
 		
 if __name__ == '__main__':
 	voxnet = VoxNet()
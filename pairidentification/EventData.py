@@ -434,6 +434,34 @@ class EventData:
 
 
 
+###################################################################################################
+
+
+  def createFromToyEventBatch(self, Batch, Event):
+    """
+    Copy one event of a ToyEventBatch, e.g. created with ToyEventBatch.createFromToyModelRealismLevel2
+    """
+
+    self.EventID = Event
+
+    Hits = Batch.getHits(Event)
+    self.ID = Batch.ID[Hits].copy()
+    self.Origin = Batch.Origin[Hits].copy()
+    self.X = Batch.X[Hits].copy()
+    self.Y = Batch.Y[Hits].copy()
+    self.Z = Batch.Z[Hits].copy()
+    self.E = Batch.E[Hits].copy()
+    self.Type = Batch.Type[Hits].copy()
+
+    self.GammaEnergy = Batch.GammaEnergy[Event]
+    self.OriginPositionX = Batch.OriginPositionX[Event]
+    self.OriginPositionY = Batch.OriginPositionY[Event]
+    self.OriginPositionZ = Batch.OriginPositionZ[Event]
+
+    return
+
+
+
 ###################################################################################################
 
 
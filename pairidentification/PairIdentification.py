@@ -31,6 +31,8 @@ import argparse
 from datetime import datetime
 from functools import reduce
 
+from voxelization import voxelize_events, layer_labels, gamma_energies, VoxelBatchCache
+
 
 print("\nPair Identification")
 print("============================\n")
@@ -90,6 +92,7 @@ parser.add_argument('-f', '--filename', default='PairIdentification.p1.sim.gz',
 parser.add_argument('-m', '--maxevents', default='10000', help='Maximum number of events to use')
 parser.add_argument('-s', '--testingtrainigsplit', default='0.1', help='Testing-training split')
 parser.add_argument('-b', '--batchsize', default='128', help='Batch size')
+parser.add_argument('--cachebatches', default='0', help='Number of voxelized batches kept in memory across the epochs (each 128-event batch takes ~34 MB)')
 
 args = parser.parse_args()
 
@@ -303,14 +306,21 @@ print("Initializing Tensors...")
 
 class tensor_generator(tf.keras.utils.Sequence):
 
-    def __init__(self, event_data, batch_size):
+    def __init__(self, event_data, batch_size, cache_batches=0):
         self.event_data = event_data
         self.batch_size = batch_size
+        # The batches are the same in every epoch, thus they can be voxelized once
+        self.cache = VoxelBatchCache(cache_batches) if cache_batches > 0 else None
 
     def __len__(self):
         return int(len(self.event_data)/self.batch_size)
 
     def __getitem__(self, idx):
+        if self.cache is not None:
+            return self.cache.get(idx, self.make_batch)
+        return self.make_batch(idx)
+
+    def make_batch(self, idx):
         pos_tensor = make_positional_tensor(self.event_data, idx, self.batch_size)
         gamma_tensor = make_gamma_tensor(self.event_data, idx, self.batch_size)
         label_tensor = make_label_tensor(self.event_data, idx, self.batch_size)
@@ -324,46 +334,26 @@ class tensor_generator(tf.keras.utils.Sequence):
 
 
 def make_positional_tensor(event_data, idx, batch_size):
-    tensor = np.zeros(shape=(batch_size, XBins, YBins, ZBins, 1))
-    for i in range(batch_size):
-        Event = event_data[i + idx*batch_size]
-        for j in range(len(Event.X)):
-            XBin = int( (Event.X[j] - XMin) / ((XMax - XMin) / XBins) )
-            YBin = int( (Event.Y[j] - YMin) / ((YMax - YMin) / YBins) )
-            ZBin = int( (Event.Z[j] - ZMin) / ((ZMax - ZMin) / ZBins) )
-            if XBin >= 0 and YBin >= 0 and ZBin >= 0 and XBin < XBins and YBin < YBins and ZBin < ZBins:
-                tensor[i][XBin][YBin][ZBin][0] = Event.E[j]
-    return tensor
+    # All hits of the batch are binned at once, energies in the same voxel are summed
+    return voxelize_events(event_data[idx*batch_size:(idx+1)*batch_size], (XBins, YBins, ZBins), ((XMin, XMax), (YMin, YMax), (ZMin, ZMax)))
 
 
 
 
 def make_gamma_tensor(event_data, idx, batch_size):
-    tensor = np.zeros(shape=(batch_size, 1))
-    for i in range(batch_size):
-        event = event_data[i + idx*batch_size]
-        tensor[i][0] = event.GammaEnergy
-    return tensor
+    return gamma_energies(event_data[idx*batch_size:(idx+1)*batch_size])
 
 
 def make_label_tensor(event_data, idx, batch_size):
-    tensor = np.zeros(shape=(batch_size, OutputDataSpaceSize))
-    for i in range(batch_size):
-        Event = event_data[i + idx*BatchSize]
-        # Set the layer in which the event happened
-        if Event.OriginPositionZ > ZMin and Event.OriginPositionZ < ZMax:
-            LayerBin = int ((Event.OriginPositionZ - ZMin) / ((ZMax- ZMin)/ ZBins) )
-            tensor[i][LayerBin] = 1
-        else:
-            #TODO May need to reevaluate this line
-            tensor[i][OutputDataSpaceSize-1] = 1
-    return tensor
+    # Set the layer in which the event happened
+    #TODO May need to reevaluate the last layer for events outside
+    return layer_labels(event_data[idx*batch_size:(idx+1)*batch_size], ZMin, ZMax, ZBins)
 
 
 
 
-training_generator = tensor_generator(TrainingDataSets, BatchSize)
-validation_generator = tensor_generator(ValidationDataSets, BatchSize)
+training_generator = tensor_generator(TrainingDataSets, BatchSize, int(args.cachebatches))
+validation_generator = tensor_generator(ValidationDataSets, BatchSize, int(args.cachebatches))
 # testing_generator = tensor_generator(TestingDataSets, BatchSize)
 
 
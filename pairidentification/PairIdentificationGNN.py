@@ -63,7 +63,8 @@ OutputDirectory = "Results"
 
 
 parser = argparse.ArgumentParser(description='Perform training and/or testing of the pair identification machine learning tools.')
-parser.add_argument('-d', '--datatype', default='tm2', help='One of: tm1: toy modle #1, tm2: toy model #2, f: file')
+parser.add_argument('-d', '--datatype', default='tm2', help='One of: tm1: toy modle #1, tm2: toy model #2, tm2b: toy model #2 created in one NumPy batch, f: file')
+parser.add_argument('--seed', default='0', help='Random seed of the batch toy model (tm2b)')
 parser.add_argument('-f', '--filename', default='PairIdentification.p1.sim.gz', help='File name used for training/testing')
 parser.add_argument('-m', '--maxevents', default='100', help='Maximum number of events to use')
 parser.add_argument('-s', '--testingtrainigsplit', default='0.1', help='Testing-training split')
@@ -80,6 +81,12 @@ parser.add_argument('--n_iters', default='5', help='n_iters')
 # parser.add_argument('--hidden_activation', default='nn.Tanh', help='hidden_activation')
 parser.add_argument('--save', default='', help='save model to directory')
 parser.add_argument('--restore', default='', help='restore model from file path')
+parser.add_argument('--sparse', action='store_true', help='Store the incidence matrices as edge index pairs, and only create the dense matrices when an event is used')
+parser.add_argument('--bucketing', action='store_true', help='Store the events unpadded, group them into batches of similar size, and pad only to the largest event in each training batch')
+parser.add_argument('--num_workers', default='0', help='Number of data loader worker processes')
+parser.add_argument('--processes', default='1', help='Number of local CPU processes for data-parallel training (torch.distributed with gloo)')
+parser.add_argument('--threads', default='1', help='Number of intra-op threads of each data-parallel process')
+parser.add_argument('--eval_samples', default='5', help='Number of random test events kept during the evaluation for the visualization')
 
 
 args = parser.parse_args()
@@ -166,6 +173,17 @@ elif DataType == "tm2":
     if NumberOfDataSets > 0 and NumberOfDataSets % 1000 == 0:
       print("Data sets processed: {}".format(NumberOfDataSets))
 
+elif DataType == "tm2b":
+  from ToyEventBatch import ToyEventBatch
+  Batch = ToyEventBatch()
+  Batch.createFromToyModelRealismLevel2(MaxEvents, np.random.default_rng(int(args.seed)))
+  for e in range(0, MaxEvents):
+    Data = EventData()
+    Data.createFromToyEventBatch(Batch, e)
+    DataSets.append(Data)
+
+  NumberOfDataSets = MaxEvents
+
 elif DataType == "f":
   # Load geometry:
   Geometry = M.MDGeometryQuest()
@@ -199,7 +217,7 @@ elif DataType == "f":
             print("Data sets processed: {}".format(NumberOfDataSets))
 
 else:
-  print("Unknown data type \"{}\" Must be one of tm1, tm2, f".format(DataType))
+  print("Unknown data type \"{}\" Must be one of tm1, tm2, tm2b, f".format(DataType))
   quit()
 
 print("Info: Parsed {} events".format(NumberOfDataSets))
@@ -242,11 +260,24 @@ import torch.distributed as dist
 from torch.utils.data import DataLoader
 from torch.utils.data.distributed import DistributedSampler
 
-train_dataset, train_labels, train_True_Ri, train_True_Ro = generate_dataset(TrainingDataSets)
-test_dataset, test_labels, test_True_Ri, test_True_Ro = generate_dataset(TestingDataSets)
+if args.bucketing:
+  from functools import partial
+  from gnn.data import generate_graph_dataset, collate_graphs, BucketBatchSampler
+
+  train_dataset, train_labels, train_True_Ri, train_True_Ro = generate_graph_dataset(TrainingDataSets)
+  test_dataset, test_labels, test_True_Ri, test_True_Ro = generate_graph_dataset(TestingDataSets)
 
-train_data_loader = DataLoader(train_dataset, batch_size=BatchSize)
-valid_data_loader = DataLoader(test_dataset, batch_size=BatchSize)
+  train_sampler = BucketBatchSampler(train_dataset.n_hits, train_dataset.n_edges, BatchSize)
+  train_data_loader = DataLoader(train_dataset, batch_sampler=train_sampler, collate_fn=collate_graphs, num_workers=int(args.num_workers))
+  # The evaluation results and the visualization are indexed with the padded test data, thus pad to the global maximum
+  valid_collate = partial(collate_graphs, n_hits=max(test_dataset.n_hits), n_edges=test_labels.shape[1])
+  valid_data_loader = DataLoader(test_dataset, batch_size=BatchSize, collate_fn=valid_collate, num_workers=int(args.num_workers))
+else:
+  train_dataset, train_labels, train_True_Ri, train_True_Ro = generate_dataset(TrainingDataSets, args.sparse)
+  test_dataset, test_labels, test_True_Ri, test_True_Ro = generate_dataset(TestingDataSets, args.sparse)
+
+  train_data_loader = DataLoader(train_dataset, batch_size=BatchSize, num_workers=int(args.num_workers))
+  valid_data_loader = DataLoader(test_dataset, batch_size=BatchSize, num_workers=int(args.num_workers))
 
 ###################################################################################################
 # Step 5: Setting up the neural network
@@ -257,8 +288,6 @@ valid_data_loader = DataLoader(test_dataset, batch_size=BatchSize)
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 print("Using", "cuda:0" if torch.cuda.is_available() else "cpu", "for training.")
 
-trainer = get_trainer(device=device)
-
 # Build the model
 # trainer.build_model(**model_config)
 
@@ -280,36 +309,61 @@ input_dim = int(args.input_dim)
 hidden_dim = int(args.hidden_dim)
 n_iters = int(args.n_iters)
 
-trainer.build_model(model_type=model_type, optimizer=optimizer, learning_rate=learning_rate, loss_func=loss_func, 
-  input_dim=3, hidden_dim=hidden_dim, n_iters=n_iters)
 
-#Restore model parameters
-restore_model_path = str(args.restore)
-if restore_model_path:
-  print('Restoring Saved Model')
-  trainer.restore_model(model_path=restore_model_path)
-  summary = trainer.evaluate(valid_data_loader)
-  print('Loaded Model Final Valid Acc:', summary['valid_loss'][-1])
+def train_network(rank, world_size):
+  #Build, restore, train and save the network. With several processes, each trains on its shard of the training data
+  global train_data_loader
+  if world_size > 1:
+    from gnn.distributed import distributed_data_loader
+    collate = collate_graphs if args.bucketing else None
+    # Shuffle like the single-process loader: the bucketing sampler shuffles, the plain loader does not
+    train_data_loader = distributed_data_loader(train_dataset, BatchSize, shuffle=args.bucketing, collate_fn=collate, num_workers=int(args.num_workers))
+
+  trainer = get_trainer(device=device, n_eval_samples=int(args.eval_samples))
+  trainer.build_model(model_type=model_type, optimizer=optimizer, learning_rate=learning_rate, loss_func=loss_func, 
+    input_dim=3, hidden_dim=hidden_dim, n_iters=n_iters)
+
+  #Restore model parameters
+  restore_model_path = str(args.restore)
+  if restore_model_path:
+    print('Restoring Saved Model')
+    trainer.restore_model(model_path=restore_model_path)
+    summary = trainer.evaluate(valid_data_loader)
+    print('Loaded Model Final Valid Acc:', summary['valid_acc'])
+
+  print("Started Training Iteration")
+  summary = trainer.train(train_data_loader=train_data_loader,
+                          valid_data_loader=valid_data_loader, n_epochs=n_iters)
+  print("Finished Training")
+
+  # Save model parameters
+  save_model_path = str(args.save)
+  if save_model_path and rank == 0:
+    print('Model Save Path:', save_model_path)
+    trainer.save_model(model_path=save_model_path)
+
+  return summary
 
 ###################################################################################################
 # Step 6: Training and saving the network
 ###################################################################################################
-print("Started Training Iteration")
-summary = trainer.train(train_data_loader=train_data_loader,
-                        valid_data_loader=valid_data_loader, n_epochs=n_iters)
-print("Finished Training")
+
+Processes = int(args.processes)
+if Processes > 1:
+  from gnn.distributed import launch
+  print("Training with {} processes with {} threads each".format(Processes, int(args.threads)))
+  summary = launch(train_network, Processes, threads=int(args.threads))
+else:
+  summary = train_network(0, 1)
 
 print('Train Loss Log: ', summary['train_loss'])
+print('Train Step Time Log: ', summary['train_step_time'])
+if 'train_padding_waste' in summary:
+  print('Train Padding Waste Log: ', summary['train_padding_waste'])
 print('Final Test Accuracy: ', summary['valid_acc'][-1])
 print('Max Test Accuracy: ', max(summary['valid_acc']))
 
-trainer.write_summaries("Results/result", summary)
-
-# Save model parameters
-save_model_path = str(args.save)
-if save_model_path:
-  print('Model Save Path:', save_model_path)
-  trainer.save_model(model_path=save_model_path)
+np.save("Results/result", summary)
 
 ###################################################################################################
 # Step 7: Evaluating and Visualizing the network
@@ -318,9 +372,8 @@ if save_model_path:
 #Locals
 from visualization import GraphVisualizer
 
+# The evaluation only keeps a random sample of the test events
 viz = GraphVisualizer(summary, test_labels, test_True_Ri, test_True_Ro, OutputDirectory)
-viz.plot_sample(random.randint(0, test_labels.shape[0]-1))
-viz.plot_sample(random.randint(0, test_labels.shape[0]-1))
-viz.plot_sample(random.randint(0, test_labels.shape[0]-1))
-viz.plot_sample(random.randint(0, test_labels.shape[0]-1))
-viz.plot_sample(random.randint(0, test_labels.shape[0]-1))
\ No newline at end of file
+for sample_idx in range(viz.n_samples()):
+  viz.plot_sample(sample_idx)
+viz.close()
@@ -0,0 +1,321 @@
+###################################################################################################
+#
+# ToyEventBatch.py
+#
+# Copyright (C) by Andreas Zoglauer & Harrison Costatino.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+
+###################################################################################################
+
+
+import numpy as np
+
+
+###################################################################################################
+
+
+def rotateReferenceFrame(V, U):
+  """
+  Vectorized MVector::RotateReferenceFrame: the rows of V are given in a frame with the z-axis U
+  and are rotated into the global frame. V and U are (N, 3), the rows of U have unit length.
+  """
+
+  u1, u2, u3 = U[:, 0], U[:, 1], U[:, 2]
+  up = np.sqrt(u1*u1 + u2*u2)
+  Safe = np.where(up > 0, up, 1.0)
+  px, py, pz = V[:, 0], V[:, 1], V[:, 2]
+
+  R = np.empty_like(V)
+  R[:, 0] = (u1*u3*px - u2*py + u1*up*pz) / Safe
+  R[:, 1] = (u2*u3*px + u1*py + u2*up*pz) / Safe
+  R[:, 2] = (u3*u3*px - px + u3*up*pz) / Safe
+
+  # U along the z-axis
+  Parallel = up == 0
+  R[Parallel] = V[Parallel] * np.where(u3[Parallel, None] < 0, [-1.0, 1.0, -1.0], [1.0, 1.0, 1.0])
+
+  return R
+
+
+###################################################################################################
+
+
+def directionFromAngles(Theta, Phi):
+  """
+  Unit vectors (N, 3) from the polar and azimuthal angles, like MVector::SetMagThetaPhi(1.0, Theta, Phi)
+  """
+
+  return np.stack((np.sin(Theta)*np.cos(Phi), np.sin(Theta)*np.sin(Phi), np.cos(Theta)), axis=1)
+
+
+###################################################################################################
+
+
+class ToyEventBatch:
+  """
+  This class stores many toy model pair events in columnar form:
+  the hits of all events are concatenated, the hits of event i are Offsets[i]:Offsets[i+1]
+  """
+
+
+###################################################################################################
+
+
+  def __init__(self):
+    """
+    The default constructor for class ToyEventBatch
+    """
+
+    self.Offsets = np.zeros(shape=(1), dtype=int)
+
+    self.ID     = np.zeros(shape=(0), dtype=int)
+    self.Origin = np.zeros(shape=(0), dtype=int)
+    self.X      = np.zeros(shape=(0), dtype=float)
+    self.Y      = np.zeros(shape=(0), dtype=float)
+    self.Z      = np.zeros(shape=(0), dtype=float)
+    self.E      = np.zeros(shape=(0), dtype=float)
+    self.Type   = np.zeros(shape=(0), dtype=str)
+
+    self.GammaEnergy = np.zeros(shape=(0), dtype=float)
+    self.OriginPositionX = np.zeros(shape=(0), dtype=float)
+    self.OriginPositionY = np.zeros(shape=(0), dtype=float)
+    self.OriginPositionZ = np.zeros(shape=(0), dtype=float)
+
+
+###################################################################################################
+
+
+  def __len__(self):
+    return len(self.Offsets) - 1
+
+
+###################################################################################################
+
+
+  def createFromToyModelRealismLevel2(self, NumberOfEvents, Generator, Bremsstrahlung=True, Holes=True):
+    """
+    Creates NumberOfEvents events of EventData.createFromToyModelRealismLevel2 at once.
+    All tracks of a generation (electrons and positrons, then the Bremsstrahlung tracks they emitted, etc.)
+    are stepped together, and the hits are numbered in the order of the original loop.
+    Generator is a numpy.random.Generator.
+    The limit of EventData.MaxHits hits per event is not applied.
+    """
+
+    N = NumberOfEvents
+    G = Generator
+
+    # Initial energy
+    Ei = 10000.0
+    MaxBremsstrahlungEnergy = 2000
+
+    # Random initial direction
+    Di = directionFromAngles(np.arccos(1 - 2*G.random(N)), 2.0 * np.pi * G.random(N))
+
+    # Start position (randomly within a certain volume)
+    Start = np.empty(shape=(N, 3))
+    Start[:, 0] = 40.0 * (G.random(N) - 0.5)
+    Start[:, 1] = 40.0 * (G.random(N) - 0.5)
+    Start[:, 2] = np.trunc(40.0 * (G.random(N) - 0.5))
+
+    self.OriginPositionX = Start[:, 0].copy()
+    self.OriginPositionY = Start[:, 1].copy()
+    self.OriginPositionZ = Start[:, 2].copy()
+
+    # Random energy split
+    Ee = (0.2 + G.random(N) * 0.6) * Ei
+    Ep = Ei - Ee
+
+    # Random opening angle
+    OpeningAngle = 0.1 + 0.6*G.random(N)
+
+    # Initial direction of the electron: the gamma direction rotated as in the original,
+    # the positron keeps the gamma direction
+    Pe = 2*np.pi * G.random(N)
+    Te = np.pi - Ee/Ei * OpeningAngle
+    Die = rotateReferenceFrame(Di, directionFromAngles(Te, Pe))
+
+    InitialDepth = G.random(N)
+
+    # All tracks: event, kind (0: electron, 1: positron, 2: Bremsstrahlung), position in the
+    # track list of the event, parent track and step in which they have been emitted
+    TrackEvent = np.concatenate((np.arange(N), np.arange(N)))
+    TrackKind = np.concatenate((np.zeros(N, dtype=int), np.ones(N, dtype=int)))
+    TrackRank = TrackKind.copy()
+    TrackParent = np.full(2*N, -1)
+    TrackBirth = np.zeros(2*N, dtype=int)
+    TracksPerEvent = np.full(N, 2)
+
+    # Tracks of the current generation
+    Tracks = np.arange(2*N)
+    Energy = np.concatenate((Ee, Ep))
+    Position = np.vstack((Start, Start))
+    Direction = np.vstack((Die, Di))
+
+    # Every step of every track
+    StepTrack, StepNumber, StepPosition, StepEnergy = [], [], [], []
+
+    while len(Tracks) > 0:
+      NewParent, NewBirth, NewEnergy, NewPosition, NewDirection = [], [], [], [], []
+      Step = 0
+      while len(Tracks) > 0:
+        n = len(Tracks)
+
+        dE = np.maximum(G.normal(250, 20, n), G.normal(10*np.sqrt(Ei - Energy), 0.1*np.sqrt(Energy)))
+        Redo = np.nonzero(dE <= 0)[0]
+        while len(Redo) > 0:
+          dE[Redo] = np.maximum(G.normal(250, 20, len(Redo)), G.normal(10*np.sqrt(Ei - Energy[Redo]), 0.1*np.sqrt(Energy[Redo])))
+          Redo = Redo[dE[Redo] <= 0]
+
+        if Step == 0:
+          First = TrackKind[Tracks] < 2
+          dE[First] *= InitialDepth[TrackEvent[Tracks[First]]]
+
+        dE = np.minimum(dE, Energy)
+
+        StepTrack.append(Tracks)
+        StepNumber.append(np.full(n, Step))
+        StepPosition.append(Position)
+        StepEnergy.append(dE)
+
+        Energy = Energy - dE
+
+        # Add random Bremsstrahlung hit
+        if Bremsstrahlung == True:
+          Emit = np.nonzero((G.random(n) < 0.1) & (Energy > MaxBremsstrahlungEnergy))[0]
+          if len(Emit) > 0:
+            BremsstrahlungEnergy = G.random(len(Emit))*MaxBremsstrahlungEnergy*0.5
+            Energy[Emit] -= BremsstrahlungEnergy
+            NewParent.append(Tracks[Emit])
+            NewBirth.append(np.full(len(Emit), Step))
+            NewEnergy.append(BremsstrahlungEnergy)
+            NewPosition.append(Position[Emit])
+            NewDirection.append(rotateReferenceFrame(Direction[Emit], directionFromAngles(0.4*np.pi*G.random(len(Emit)), 2.0*np.pi*G.random(len(Emit)))))
+
+        # Calculate new direction and position
+        dAngle = (Ei - Energy) * 0.4*np.pi / Ei
+        Direction = rotateReferenceFrame(Direction, directionFromAngles(dAngle, 2.0 * np.pi * G.random(n)))
+        Lambda = np.where(Direction[:, 2] > 0, 1.0, -1.0) / Direction[:, 2]
+        Position = Position + Lambda[:, None] * Direction
+
+        Alive = Energy > 0
+        Tracks, Energy, Position, Direction = Tracks[Alive], Energy[Alive], Position[Alive], Direction[Alive]
+        Step += 1
+
+      if len(NewParent) == 0:
+        break
+
+      # The next generation: the emitted tracks are appended to the track list of their event,
+      # in the order of their parent track and of the emission step
+      Parent, Birth = np.concatenate(NewParent), np.concatenate(NewBirth)
+      Order = np.lexsort((Birth, TrackRank[Parent], TrackEvent[Parent]))
+      Parent, Birth = Parent[Order], Birth[Order]
+      Event = TrackEvent[Parent]
+      Rank = TracksPerEvent[Event] + np.arange(len(Event)) - np.searchsorted(Event, Event)
+      TracksPerEvent += np.bincount(Event, minlength=N)
+
+      Tracks = np.arange(len(TrackEvent), len(TrackEvent) + len(Parent))
+      TrackEvent = np.concatenate((TrackEvent, Event))
+      TrackKind = np.concatenate((TrackKind, np.full(len(Parent), 2)))
+      TrackRank = np.concatenate((TrackRank, Rank))
+      TrackParent = np.concatenate((TrackParent, Parent))
+      TrackBirth = np.concatenate((TrackBirth, Birth))
+
+      Energy = np.concatenate(NewEnergy)[Order]
+      Position = np.vstack(NewPosition)[Order]
+      Direction = np.vstack(NewDirection)[Order]
+
+    # Order the steps as in the original loop: by event, track, and step
+    StepTrack = np.concatenate(StepTrack)
+    StepNumber = np.concatenate(StepNumber)
+    StepPosition = np.vstack(StepPosition)
+    StepEnergy = np.concatenate(StepEnergy)
+    StepEvent = TrackEvent[StepTrack]
+    Order = np.lexsort((StepNumber, TrackRank[StepTrack], StepEvent))
+    StepTrack, StepNumber, StepPosition, StepEnergy, StepEvent = StepTrack[Order], StepNumber[Order], StepPosition[Order], StepEnergy[Order], StepEvent[Order]
+
+    # The first positron step deposits its energy in the first hit, all other steps create a hit
+    IsPositronStart = (TrackKind[StepTrack] == 1) & (StepNumber == 0)
+    CreatesHit = ~IsPositronStart
+
+    # The ID counter of the original loop at each step
+    Count = np.cumsum(CreatesHit)
+    HitsBefore = np.concatenate(([0], Count))[np.searchsorted(StepEvent, np.arange(N))]
+    StepID = Count - HitsBefore[StepEvent]
+    # The positron track continues from the first hit
+    ChainID = np.where(IsPositronStart, 1, StepID)
+
+    # Origins: the previous hit of the track, or the hit of the parent track in the emission step
+    StepOrigin = np.zeros(len(StepTrack), dtype=int)
+    Continued = np.nonzero(StepNumber > 0)[0]
+    StepOrigin[Continued] = ChainID[Continued - 1]
+    FirstStep = np.zeros(len(TrackEvent), dtype=int)
+    FirstStep[StepTrack[StepNumber == 0]] = np.nonzero(StepNumber == 0)[0]
+    BremsstrahlungStart = np.nonzero((StepNumber == 0) & (TrackKind[StepTrack] == 2))[0]
+    Emitter = StepTrack[BremsstrahlungStart]
+    StepOrigin[BremsstrahlungStart] = StepID[FirstStep[TrackParent[Emitter]] + TrackBirth[Emitter]]
+
+    HitEvent = StepEvent[CreatesHit]
+    ID = StepID[CreatesHit]
+    Origin = StepOrigin[CreatesHit]
+    Position = StepPosition[CreatesHit]
+    E = StepEnergy[CreatesHit]
+    E[HitsBefore[StepEvent[IsPositronStart]]] += StepEnergy[IsPositronStart]
+    # The first hit is of type "e": the "ep" of the original does not fit into its one-character type array
+    Type = np.array([ "e", "p", "b" ])[TrackKind[StepTrack[CreatesHit]]]
+
+    self.GammaEnergy = np.bincount(StepEvent, weights=StepEnergy, minlength=N)
+
+    # Eliminate the hits which are within 0.2 mm of x,y = n*4cm
+    if Holes == True:
+      Removed = (np.abs(Position[:, 0] - 4.0*np.round(Position[:, 0]/4.0)) <= 0.2) | (np.abs(Position[:, 1] - 4.0*np.round(Position[:, 1]/4.0)) <= 0.2)
+
+      # Hits originating from an eliminated hit originate from its first not eliminated ancestor
+      HitOffsets = np.concatenate(([0], np.cumsum(np.bincount(HitEvent, minlength=N))))
+      Parent = np.where(Origin > 0, HitOffsets[HitEvent] + Origin - 1, -1)
+      while True:
+        Redirect = np.nonzero(Parent >= 0)[0]
+        Redirect = Redirect[Removed[Parent[Redirect]]]
+        if len(Redirect) == 0:
+          break
+        Parent[Redirect] = Parent[Parent[Redirect]]
+
+      # Make sure the indices are still running from 1 to max
+      Keep = ~Removed
+      KeptBefore = np.concatenate(([0], np.cumsum(np.bincount(HitEvent[Keep], minlength=N))))
+      NewID = np.cumsum(Keep) - KeptBefore[HitEvent]
+      Origin = np.where(Parent >= 0, NewID[np.maximum(Parent, 0)], 0)
+      ID = NewID
+
+      HitEvent, ID, Origin, Position, E, Type = HitEvent[Keep], ID[Keep], Origin[Keep], Position[Keep], E[Keep], Type[Keep]
+
+    self.Offsets = np.concatenate(([0], np.cumsum(np.bincount(HitEvent, minlength=N))))
+    self.ID = ID
+    self.Origin = Origin
+    self.X = Position[:, 0].copy()
+    self.Y = Position[:, 1].copy()
+    self.Z = Position[:, 2].copy()
+    self.E = E
+    self.Type = Type
+
+    return
+
+
+###################################################################################################
+
+
+  def getHits(self, Event):
+    """
+    Return the slice of the hits of one event
+    """
+
+    return slice(self.Offsets[Event], self.Offsets[Event+1])
+
+
+# END
+###################################################################################################
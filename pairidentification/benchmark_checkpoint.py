@@ -0,0 +1,103 @@
+###################################################################################################
+#
+# benchmark_checkpoint.py
+#
+# Copyright (C) by Andreas Zoglauer & Harrison Costatino.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+import torch
+from torch.utils.data import DataLoader
+
+from preprocess import connect_pos_edges
+from gnn import get_trainer
+from gnn.data import GraphDataset, collate_graphs
+
+
+###################################################################################################
+
+
+"""
+Measures the epoch time of the GNN training with synchronous and with asynchronous checkpoint
+writing, on small synthetic graphs with a large hidden dimension, thus a large checkpoint.
+For all the command line options, try:
+
+python3 benchmark_checkpoint.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Benchmark the checkpoint writing of the GNN trainer.')
+parser.add_argument('-m', '--maxevents', default='256', help='Number of synthetic events')
+parser.add_argument('-b', '--batchsize', default='16', help='Batch size')
+parser.add_argument('-e', '--epochs', default='6', help='Number of epochs')
+parser.add_argument('-k', '--keep', default='2', help='Number of last checkpoints to keep')
+parser.add_argument('--hidden_dim', default='1024', help='hidden_dim')
+
+args = parser.parse_args()
+
+Random = np.random.default_rng(0)
+torch.manual_seed(0)
+
+
+def make_graph(n_hits):
+  #Random hits in integer z layers, connected like preprocess.connect_pos, with random labels
+  pos = np.empty((n_hits, 3), dtype=np.float32)
+  pos[:, 0:2] = 40.0 * (Random.random((n_hits, 2)) - 0.5)
+  pos[:, 2] = Random.integers(0, max(2, n_hits // 2), n_hits)
+  edges = connect_pos_edges(pos).astype(np.int32)
+  labels = (Random.random(len(edges)) < 0.1).astype(np.float32)
+  return pos, edges[:, 0].copy(), edges[:, 1].copy(), labels
+
+
+Graphs = [ make_graph(n) for n in Random.integers(5, 20, int(args.maxevents)) ]
+Dataset = GraphDataset(*[ list(c) for c in zip(*Graphs) ])
+TrainLoader = DataLoader(Dataset, batch_size=int(args.batchsize), collate_fn=collate_graphs)
+ValidLoader = DataLoader(Dataset, batch_size=int(args.batchsize), collate_fn=collate_graphs)
+
+
+def train(async_checkpoints):
+  output_dir = tempfile.mkdtemp()
+  trainer = get_trainer(output_dir=output_dir, device='cpu', async_checkpoints=async_checkpoints, keep_checkpoints=int(args.keep))
+  trainer.build_model(input_dim=3, hidden_dim=int(args.hidden_dim), n_iters=2)
+  start = time.time()
+  summary = trainer.train(TrainLoader, int(args.epochs), valid_data_loader=ValidLoader)
+  total = time.time() - start
+  files = sorted(os.listdir(os.path.join(output_dir, 'checkpoints')))
+  size = os.path.getsize(os.path.join(output_dir, 'checkpoints', files[0]))
+  best = int(np.argmin(summary['valid_loss']))
+  shutil.rmtree(output_dir)
+  return total / int(args.epochs), np.mean(summary['checkpoint_time']), size, files, best
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+Results = [ ("synchronous", train(False)), ("asynchronous", train(True)) ]
+
+print("\n{:<14} {:>16} {:>22} {:>16}".format("Checkpoints", "epoch time [s]", "blocked by save [s]", "checkpoint [MB]"))
+for Name, (EpochTime, CheckpointTime, Size, Files, Best) in Results:
+  print("{:<14} {:>16.2f} {:>22.3f} {:>16.1f}".format(Name, EpochTime, CheckpointTime, Size / 1e6))
+
+for Name, (EpochTime, CheckpointTime, Size, Files, Best) in Results:
+  print("Kept by the {} writer (best epoch {}): {}".format(Name, Best, ", ".join(Files)))
+
+
+# END
+###################################################################################################
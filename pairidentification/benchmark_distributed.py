@@ -0,0 +1,158 @@
+###################################################################################################
+#
+# benchmark_distributed.py
+#
+# Copyright (C) by Andreas Zoglauer & Harrison Costatino.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import os
+import argparse
+import tempfile
+import numpy as np
+
+import torch
+
+from preprocess import connect_pos_edges
+from gnn import get_trainer
+from gnn.data import GraphDataset, collate_graphs
+from gnn.distributed import launch, distributed_data_loader
+
+
+###################################################################################################
+
+
+"""
+Checks that models and checkpoints saved with several processes can be restored by a single
+process and vice versa, and measures the scaling of the CPU data-parallel GNN training
+(torch.distributed with the gloo backend) with the number of local processes, on a fixed set of
+synthetic graphs.
+For all the command line options, try:
+
+python3 benchmark_distributed.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Benchmark the CPU data-parallel GNN training.')
+parser.add_argument('-m', '--maxevents', default='1024', help='Number of synthetic events')
+parser.add_argument('-b', '--batchsize', default='16', help='Batch size per process')
+parser.add_argument('-p', '--processes', default='1,2,4,8', help='Comma separated list of the number of processes')
+parser.add_argument('-t', '--threads', default='1', help='Number of intra-op threads per process')
+parser.add_argument('--hidden_dim', default='64', help='hidden_dim')
+
+args = parser.parse_args()
+
+Random = np.random.default_rng(0)
+
+
+def make_graph(n_hits):
+  #Random hits in integer z layers, connected like preprocess.connect_pos, with random labels
+  pos = np.empty((n_hits, 3), dtype=np.float32)
+  pos[:, 0:2] = 40.0 * (Random.random((n_hits, 2)) - 0.5)
+  pos[:, 2] = Random.integers(0, max(2, n_hits // 2), n_hits)
+  edges = connect_pos_edges(pos).astype(np.int32)
+  labels = (Random.random(len(edges)) < 0.1).astype(np.float32)
+  return pos, edges[:, 0].copy(), edges[:, 1].copy(), labels
+
+
+Graphs = [ make_graph(n) for n in np.clip(Random.lognormal(3.3, 0.5, int(args.maxevents)).astype(int), 3, 100) ]
+Dataset = GraphDataset(*[ list(c) for c in zip(*Graphs) ])
+
+
+def train(rank, world_size):
+  torch.manual_seed(0)
+  loader = distributed_data_loader(Dataset, int(args.batchsize), collate_fn=collate_graphs)
+  trainer = get_trainer(device='cpu')
+  trainer.build_model(input_dim=3, hidden_dim=int(args.hidden_dim), n_iters=4)
+  summary = trainer.train(loader, n_epochs=2)
+  # The first epoch is the warm up
+  return summary['train_time'][-1], summary['train_loss'][-1]
+
+
+def make_trainer(seed, output_dir=None):
+  torch.manual_seed(seed)
+  trainer = get_trainer(device='cpu', output_dir=output_dir, async_checkpoints=False)
+  trainer.build_model(input_dim=3, hidden_dim=8, n_iters=1)
+  return trainer
+
+
+def same_parameters(trainer, state):
+  return all(np.array_equal(v.numpy(), np.asarray(state[k])) for k, v in trainer.unwrapped_model().state_dict().items())
+
+
+def save_distributed(rank, world_size, directory):
+  #Save the model and a checkpoint of a model wrapped in DistributedDataParallel
+  trainer = make_trainer(1, directory)
+  if rank == 0:
+    trainer.save_model(os.path.join(directory, 'model.pt'))
+    trainer.write_checkpoint(0)
+    trainer.close_checkpoints()
+  # As numpy arrays, tensors are returned via shared memory of the exited process
+  return { k: v.numpy().copy() for k, v in trainer.unwrapped_model().state_dict().items() }
+
+
+def restore_distributed(rank, world_size, path, state):
+  trainer = make_trainer(2)
+  trainer.restore_model(path)
+  return same_parameters(trainer, state)
+
+
+###################################################################################################
+# Save / restore check
+###################################################################################################
+
+
+with tempfile.TemporaryDirectory() as Directory:
+  # Saved with 2 processes, restored by a single process
+  State = launch(save_distributed, 2, train_args=(Directory,))
+  Trainer = make_trainer(2)
+  Trainer.restore_model(os.path.join(Directory, 'model.pt'))
+  assert same_parameters(Trainer, State), "The model saved with 2 processes is not restored by one process"
+  Checkpoint = torch.load(os.path.join(Directory, 'checkpoints', 'model_checkpoint_000.pth.tar'))
+  assert not any(k.startswith('module.') for k in Checkpoint['model']), "The checkpoint has prefixed keys"
+  Trainer = make_trainer(2)
+  Trainer.unwrapped_model().load_state_dict(Checkpoint['model'])
+  assert same_parameters(Trainer, State)
+
+  # Saved by a single process, restored with 2 processes
+  Trainer = make_trainer(3)
+  Trainer.save_model(os.path.join(Directory, 'single.pt'))
+  State = { k: v.numpy().copy() for k, v in Trainer.unwrapped_model().state_dict().items() }
+  assert launch(restore_distributed, 2, train_args=(os.path.join(Directory, 'single.pt'), State)), "The single process model is not restored by 2 processes"
+
+  # Models saved with the "module." prefix before are still restored
+  torch.save({ 'module.' + k: torch.from_numpy(v) for k, v in State.items() }, os.path.join(Directory, 'prefixed.pt'))
+  Trainer = make_trainer(4)
+  Trainer.restore_model(os.path.join(Directory, 'prefixed.pt'))
+  assert same_parameters(Trainer, State)
+
+print("Save / restore check passed")
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+Results = []
+for Processes in [ int(p) for p in args.processes.split(",") ]:
+  Results.append((Processes, launch(train, Processes, threads=int(args.threads))))
+
+print("\nCPU cores available: {}, threads per process: {}".format(len(os.sched_getaffinity(0)), args.threads))
+print("{:>10} {:>16} {:>14} {:>10} {:>12}".format("processes", "epoch time [s]", "events/s", "speedup", "efficiency"))
+#Speedup and efficiency relative to the first entry of the list
+BaseProcesses, (BaseTime, _) = Results[0]
+for Processes, (EpochTime, Loss) in Results:
+  print("{:>10} {:>16.2f} {:>14.0f} {:>10.2f} {:>12.2f}".format(Processes, EpochTime, len(Dataset) / EpochTime, BaseTime / EpochTime, BaseTime / EpochTime * BaseProcesses / Processes))
+
+
+# END
+###################################################################################################
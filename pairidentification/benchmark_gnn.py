@@ -0,0 +1,139 @@
+###################################################################################################
+#
+# benchmark_gnn.py
+#
+# Copyright (C) by Andreas Zoglauer & Harrison Costatino.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import time
+import argparse
+import numpy as np
+from functools import partial
+
+import torch
+from torch.utils.data import DataLoader
+
+from preprocess import connect_pos_edges
+from gnn import get_trainer
+from gnn.data import GraphDataset, BucketBatchSampler, collate_graphs, padding_waste
+
+
+###################################################################################################
+
+
+"""
+Benchmarks the training of the GNNSegmentClassifier on synthetic layered graphs.
+For all the command line options, try:
+
+python3 benchmark_gnn.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Benchmark the GNN training on synthetic graphs.')
+parser.add_argument('-m', '--maxevents', default='2000', help='Number of synthetic events')
+parser.add_argument('-b', '--batchsize', default='16', help='Batch size')
+parser.add_argument('--hidden_dim', default='64', help='hidden_dim')
+parser.add_argument('--n_iters', default='4', help='n_iters')
+parser.add_argument('--num_workers', default='0', help='Number of data loader worker processes')
+
+args = parser.parse_args()
+
+Random = np.random.default_rng(0)
+torch.manual_seed(0)
+BatchSize = int(args.batchsize)
+
+
+def make_graph(n_hits):
+  #Random hits in integer z layers, connected like preprocess.connect_pos, with random labels
+  pos = np.empty((n_hits, 3), dtype=np.float32)
+  pos[:, 0:2] = 40.0 * (Random.random((n_hits, 2)) - 0.5)
+  pos[:, 2] = Random.integers(0, max(2, n_hits // 2), n_hits)
+  edges = connect_pos_edges(pos).astype(np.int32)
+  labels = (Random.random(len(edges)) < 0.1).astype(np.float32)
+  return pos, edges[:, 0].copy(), edges[:, 1].copy(), labels
+
+
+# Pair events have a long tail in the number of hits
+Sizes = np.clip(Random.lognormal(3.3, 0.5, int(args.maxevents)).astype(int), 3, 300)
+Graphs = [ make_graph(n) for n in Sizes ]
+Dataset = GraphDataset(*[ list(c) for c in zip(*Graphs) ])
+
+MaxHits, MaxEdges = int(max(Dataset.n_hits)), int(max(Dataset.n_edges))
+print("Events: {}, max hits: {}, max edges: {}".format(len(Dataset), MaxHits, MaxEdges))
+
+
+def train_one_epoch(data_loader):
+  trainer = get_trainer(device='cpu')
+  trainer.build_model(input_dim=3, hidden_dim=int(args.hidden_dim), n_iters=int(args.n_iters))
+  return trainer.train_epoch(data_loader)
+
+
+###################################################################################################
+# Global padding, as in preprocess.generate_dataset
+###################################################################################################
+
+
+Batches = [ list(range(b, min(b + BatchSize, len(Dataset)))) for b in range(0, len(Dataset), BatchSize) ]
+GlobalWaste = 1.0 - np.sum(Dataset.n_hits * Dataset.n_edges) / (len(Dataset) * MaxHits * MaxEdges)
+
+loader = DataLoader(Dataset, batch_size=BatchSize, collate_fn=partial(collate_graphs, n_hits=MaxHits, n_edges=MaxEdges), num_workers=int(args.num_workers))
+Global = train_one_epoch(loader)
+
+
+###################################################################################################
+# Per-batch padding, sequential and size-bucketed batches
+###################################################################################################
+
+
+loader = DataLoader(Dataset, batch_size=BatchSize, collate_fn=collate_graphs, num_workers=int(args.num_workers))
+PerBatch = train_one_epoch(loader)
+PerBatchWaste = padding_waste(Batches, Dataset.n_hits, Dataset.n_edges)
+
+Sampler = BucketBatchSampler(Dataset.n_hits, Dataset.n_edges, BatchSize)
+loader = DataLoader(Dataset, batch_sampler=Sampler, collate_fn=collate_graphs, num_workers=int(args.num_workers))
+Bucketed = train_one_epoch(loader)
+
+
+print("\n{:<28} {:>14} {:>16} {:>14}".format("Batching", "padding waste", "step time [ms]", "epoch [s]"))
+for Name, Waste, Summary in [ ("global maximum", GlobalWaste, Global), ("per-batch maximum", PerBatchWaste, PerBatch), ("per-batch maximum, buckets", Bucketed['train_padding_waste'], Bucketed) ]:
+  print("{:<28} {:>14.3f} {:>16.1f} {:>14.1f}".format(Name, Waste, 1000*Summary['train_step_time'], Summary['train_time']))
+
+
+###################################################################################################
+# Streaming evaluation metrics
+###################################################################################################
+
+
+trainer = get_trainer(device='cpu', n_eval_samples=5)
+trainer.build_model(input_dim=3, hidden_dim=int(args.hidden_dim), n_iters=int(args.n_iters))
+loader = DataLoader(Dataset, batch_size=BatchSize, collate_fn=collate_graphs)
+Summary = trainer.evaluate(loader)
+
+#Reference: collect all outputs of the real edges and compute the metrics at once
+with torch.no_grad():
+  trainer.model.eval()
+  Outputs = torch.cat([ trainer.model(i)[i[1].sum(dim=1) > 0] for i, t in loader ])
+  Targets = torch.cat([ t[i[1].sum(dim=1) > 0] for i, t in loader ]) > 0.5
+for t, Threshold in enumerate(Summary['valid_thresholds']):
+  Predicted = Outputs > float(Threshold)
+  assert int((Predicted & Targets).sum()) == round(Summary['valid_recall'][t] * int(Targets.sum())), "Recall differs at threshold {}".format(Threshold)
+assert len(Summary['X']) == 5 and all(Summary['X'][s].shape[1] == 3 for s in range(5)), "Unexpected evaluation sample"
+print("\nStreaming metrics agree with the metrics over all {} edges".format(len(Targets)))
+
+print("{:>10} {:>10} {:>10}".format("threshold", "precision", "recall"))
+for Threshold, Precision, Recall in zip(Summary['valid_thresholds'], Summary['valid_precision'], Summary['valid_recall']):
+  print("{:>10.1f} {:>10.3f} {:>10.3f}".format(Threshold, Precision, Recall))
+print("Confusion at 0.5: {}, sampled events: {}".format(Summary['valid_confusion'], Summary['Sample_Index']))
+
+
+# END
+###################################################################################################
@@ -0,0 +1,185 @@
+###################################################################################################
+#
+# benchmark_preprocess.py
+#
+# Copyright (C) by Andreas Zoglauer & Harrison Costatino.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import time
+import argparse
+import numpy as np
+from types import SimpleNamespace
+
+from preprocess import connect_pos, connect_pos_edges, generate_dataset, generate_incidence, label_edges
+
+
+###################################################################################################
+
+
+"""
+Checks that the vectorized graph preprocessing gives the same results as the original
+Python loops, and benchmarks both. The events are layered toy events: hits in integer
+z layers, like the ones created by EventData.createFromToyModelRealismLevel1/2.
+For all the command line options, try:
+
+python3 benchmark_preprocess.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the graph preprocessing.')
+parser.add_argument('-e', '--events', default='100', help='Number of toy events for the equivalence check')
+parser.add_argument('-r', '--repetitions', default='5', help='Repetitions per timing')
+parser.add_argument('-m', '--memoryevents', default='10000', help='Number of toy events for the data set memory report')
+
+args = parser.parse_args()
+
+Random = np.random.default_rng(0)
+
+
+def make_toy_hits(n_hits):
+  #Random hits in the layers of a 40 cm high tracker, a few hits per layer
+  n_layers = max(2, n_hits // 3)
+  pos = np.empty((n_hits, 3))
+  pos[:, 0] = 40.0 * (Random.random(n_hits) - 0.5)
+  pos[:, 1] = 40.0 * (Random.random(n_hits) - 0.5)
+  pos[:, 2] = Random.integers(-n_layers // 2, n_layers // 2 + 1, n_hits)
+  return pos
+
+
+def make_toy_event():
+  #A toy pair event: electron and positron track starting at a common first hit, one hit per layer
+  n_e, n_p = Random.integers(5, 30, 2)
+  n_hits = 1 + n_e + n_p
+  X = np.empty(n_hits)
+  Y = np.empty(n_hits)
+  Z = np.empty(n_hits)
+  Origin = np.zeros(n_hits, dtype=int)
+  Type = np.empty(n_hits, dtype=str)
+  X[0], Y[0], Z[0], Type[0] = 40.0 * (Random.random() - 0.5), 40.0 * (Random.random() - 0.5), int(40.0 * (Random.random() - 0.5)), 'm'
+  ID = 1
+  for t, n in [ ('e', n_e), ('p', n_p) ]:
+    Previous = 0
+    for h in range(n):
+      X[ID] = X[Previous] + Random.normal(0, 0.5)
+      Y[ID] = Y[Previous] + Random.normal(0, 0.5)
+      Z[ID] = Z[Previous] - 1
+      Origin[ID] = Previous + 1
+      Type[ID] = t
+      Previous = ID
+      ID += 1
+  return SimpleNamespace(X=X, Y=Y, Z=Z, Origin=Origin, Type=Type, E=Random.random(n_hits), GammaEnergy=10000.0)
+
+
+def connect_pos_reference(pos_data):
+  #The original double loop of preprocess.connect_pos
+  edges = []
+  for i in range(len(pos_data)):
+    z_A = pos_data[i][2]
+    for j in range(len(pos_data)):
+      z_B = pos_data[j][2]
+      if z_B == z_A + 1:
+        edges.append((i, j))
+        edges.append((j, i))
+  return edges
+
+
+def true_edges(event):
+  #The true edges as built in preprocess.vectorize_data
+  return [ (event.Origin[i]-1, i) for i in range(len(event.Origin)) ]
+
+
+def label_edges_reference(p_Ri, p_Ro, true_edges):
+  #The original edge labelling of preprocess.vectorize_data: search the incidence matrices for every candidate edge
+  e_label = np.zeros(p_Ri.shape[1])
+  for i in range(p_Ri.shape[1]):
+    out = np.where(p_Ro[:,i] == 1)[0][0]
+    inn = np.where(p_Ri[:,i] == 1)[0][0]
+    e_label[i] = 1*((out, inn) in true_edges)
+  return e_label
+
+
+def timeit(function, *arguments):
+  best = float("inf")
+  for r in range(int(args.repetitions)):
+    start = time.perf_counter()
+    function(*arguments)
+    best = min(best, time.perf_counter() - start)
+  return best
+
+
+###################################################################################################
+# Equivalence checks
+###################################################################################################
+
+
+for e in range(int(args.events)):
+  pos = make_toy_hits(int(Random.integers(1, 200)))
+  reference = connect_pos_reference(pos)
+  edges = connect_pos_edges(pos)
+  assert [tuple(edge) for edge in edges.tolist()] == reference, "connect_pos_edges differs for event {}".format(e)
+
+events = [ make_toy_event() for e in range(int(args.events)) ]
+for e, event in enumerate(events):
+  pos = np.vstack((event.X, event.Y, event.Z)).T
+  candidates = connect_pos_edges(pos)
+  assert np.array_equal(label_edges(candidates, true_edges(event), len(pos)), label_edges_reference(*connect_pos(pos), true_edges(event))), "label_edges differs for event {}".format(e)
+
+dense, dense_labels, _, _ = generate_dataset(events)
+sparse, sparse_labels, _, _ = generate_dataset(events, sparse=True)
+assert np.array_equal(dense_labels, sparse_labels), "Edge labels differ between the dense and sparse data set"
+for e in range(len(events)):
+  for d, s in zip(dense[e][0], sparse[e][0]):
+    assert np.array_equal(d, s), "Densified incidence matrices differ for event {}".format(e)
+
+print("Equivalence checks passed for {} toy events".format(args.events))
+
+
+###################################################################################################
+# Benchmarks
+###################################################################################################
+
+
+print("\nconnect_pos edge generation")
+print("{:>6} {:>8} {:>14} {:>14} {:>10}".format("hits", "edges", "loop [ms]", "numpy [ms]", "speedup"))
+for n_hits in [ 10, 50, 100, 200, 500 ]:
+  pos = make_toy_hits(n_hits)
+  loop_time = timeit(connect_pos_reference, pos)
+  numpy_time = timeit(connect_pos_edges, pos)
+  print("{:>6} {:>8} {:>14.3f} {:>14.3f} {:>9.0f}x".format(n_hits, len(connect_pos_edges(pos)), 1000*loop_time, 1000*numpy_time, loop_time/numpy_time))
+
+
+print("\nEdge labelling")
+print("{:>6} {:>8} {:>14} {:>14} {:>10}".format("hits", "edges", "search [ms]", "isin [ms]", "speedup"))
+for n_tracks in [ 1, 2, 5, 10, 20 ]:
+  #Merge several toy events into one, to get larger graphs
+  merged = [ make_toy_event() for t in range(n_tracks) ]
+  offsets = np.cumsum([0] + [ len(m.X) for m in merged ])
+  pos = np.vstack([ np.vstack((m.X, m.Y, m.Z)).T for m in merged ])
+  truth = [ (o + offsets[m] if o >= 0 else -1, t + offsets[m]) for m in range(n_tracks) for (o, t) in true_edges(merged[m]) ]
+  candidates = connect_pos_edges(pos)
+  search_time = timeit(label_edges_reference, *connect_pos(pos), truth)
+  isin_time = timeit(label_edges, candidates, truth, len(pos))
+  print("{:>6} {:>8} {:>14.3f} {:>14.3f} {:>9.0f}x".format(len(pos), len(candidates), 1000*search_time, 1000*isin_time, search_time/isin_time))
+
+
+print("\nData set memory for {} toy events".format(args.memoryevents))
+events = [ make_toy_event() for e in range(int(args.memoryevents)) ]
+sparse, labels, _, _ = generate_dataset(events, sparse=True)
+max_hits, max_edges = sparse.XYZ.shape[1], labels.shape[1]
+dense_bytes = sparse.XYZ.nbytes + labels.nbytes + 2 * len(events) * max_hits * max_edges * np.dtype(np.float32).itemsize
+print("Max hits: {}, max edges: {}".format(max_hits, max_edges))
+print("Dense data set (Ri/Ro float32, padded):      {:10.1f} MB".format(dense_bytes / 1e6))
+print("Sparse data set (senders/receivers int32): {:10.1f} MB".format(sparse.nbytes() / 1e6))
+
+
+# END
+###################################################################################################
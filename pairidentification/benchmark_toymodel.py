@@ -0,0 +1,238 @@
+###################################################################################################
+#
+# benchmark_toymodel.py
+#
+# Copyright (C) by Andreas Zoglauer & Harrison Costatino.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import time
+import math
+import random
+import argparse
+import numpy as np
+
+from ToyEventBatch import ToyEventBatch, rotateReferenceFrame, directionFromAngles
+
+
+###################################################################################################
+
+
+"""
+Compares the distributions of the events of ToyEventBatch.createFromToyModelRealismLevel2 with
+the ones of the event-by-event loop of EventData.createFromToyModelRealismLevel2, and benchmarks
+both. The loop is transcribed below with the MVector math replaced by the same rotation as in
+ToyEventBatch, thus it runs without MEGAlib. For all the command line options, try:
+
+python3 benchmark_toymodel.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the batch toy model of the pair events.')
+parser.add_argument('-e', '--events', default='5000', help='Number of events per generator')
+parser.add_argument('-s', '--seed', default='0', help='Random seed')
+
+args = parser.parse_args()
+
+NumberOfEvents = int(args.events)
+random.seed(int(args.seed))
+
+
+def vector(Theta, Phi):
+  return directionFromAngles(np.array([Theta]), np.array([Phi]))
+
+
+def createFromToyModelRealismLevel2Reference():
+  #The loop of EventData.createFromToyModelRealismLevel2 (without the print outs)
+  Ei = 10000.0
+  Die = vector(np.arccos(1 - 2*random.random()), 2.0 * np.pi * random.random())
+  Dip = Die.copy()
+
+  xi = 40.0 * (random.random() - 0.5)
+  yi = 40.0 * (random.random() - 0.5)
+  zi = int(40.0 * (random.random() - 0.5))
+
+  Ee = (0.2 + random.random() * 0.6) * Ei
+  Ep = Ei - Ee
+  OpeningAngle = 0.1 + 0.6*random.random()
+  Pe = 2*math.pi * random.random()
+  Te = math.pi - Ee/Ei * OpeningAngle
+  Die = rotateReferenceFrame(Die, vector(Te, Pe))
+
+  CurrentTrack = 0
+  TrackOrigins = [ 0, 0 ]
+  TrackDirections = [ Die, Dip ]
+  TrackName = [ 'e', 'p' ]
+  TrackPositions = [ np.array([xi, yi, zi], dtype=float), np.array([xi, yi, zi], dtype=float) ]
+  TrackEnergies = [ Ee, Ep ]
+
+  ID = 1
+  InitialDepth = random.random()
+  Origins, IDs, Positions, Energies, Types = [ 0 ], [ 1 ], [ None ], [ 0.0 ], [ 'e' ]
+  GammaEnergy = 0
+
+  while CurrentTrack < len(TrackOrigins):
+    while TrackEnergies[CurrentTrack] > 0:
+      dE = 0
+      while dE <= 0:
+        dE = max(random.gauss(250, 20), random.gauss(10*math.sqrt(Ei-TrackEnergies[CurrentTrack]), 0.1*math.sqrt(TrackEnergies[CurrentTrack])))
+      if TrackOrigins[CurrentTrack] == 0:
+        dE *= InitialDepth
+      if dE > TrackEnergies[CurrentTrack]:
+        dE = TrackEnergies[CurrentTrack]
+
+      if TrackOrigins[CurrentTrack] == 0:
+        Positions[0] = TrackPositions[CurrentTrack].copy()
+        Energies[0] += dE
+        if CurrentTrack == 1:
+          ID -= 1
+        TrackOrigins[CurrentTrack] = 1
+      else:
+        Origins.append(TrackOrigins[CurrentTrack])
+        IDs.append(ID)
+        Positions.append(TrackPositions[CurrentTrack].copy())
+        Energies.append(dE)
+        Types.append(TrackName[CurrentTrack])
+        TrackOrigins[CurrentTrack] = ID
+
+      TrackEnergies[CurrentTrack] -= dE
+      GammaEnergy += dE
+
+      MaxBremsstrahlungEnergy = 2000
+      if random.random() < 0.1 and TrackEnergies[CurrentTrack] > MaxBremsstrahlungEnergy:
+        TrackOrigins.append(ID)
+        TrackName.append('b')
+        TrackPositions.append(TrackPositions[CurrentTrack].copy())
+        Energy = random.random()*MaxBremsstrahlungEnergy*0.5
+        TrackEnergies.append(Energy)
+        TrackEnergies[CurrentTrack] -= Energy
+        TrackDirections.append(rotateReferenceFrame(TrackDirections[CurrentTrack], vector(0.4*math.pi*random.random(), 2.0*np.pi*random.random())))
+
+      dAngle = (Ei - TrackEnergies[CurrentTrack]) * 0.4*math.pi / Ei
+      TrackDirections[CurrentTrack] = rotateReferenceFrame(TrackDirections[CurrentTrack], vector(dAngle, 2.0 * np.pi * random.random()))
+      Direction = TrackDirections[CurrentTrack][0]
+      Lambda = (1 if Direction[2] > 0 else -1) / Direction[2]
+      TrackPositions[CurrentTrack] = TrackPositions[CurrentTrack] + Lambda * Direction
+
+      ID += 1
+    CurrentTrack += 1
+
+  Origin, HitID, Pos, E, Type = np.array(Origins), np.array(IDs), np.array(Positions), np.array(Energies), np.array(Types)
+
+  ToDelete = []
+  for i in range(0, len(Origin)):
+    x = Pos[i, 0]
+    while x > 0.2:
+      x -= 4.0
+    while x < -0.2:
+      x += 4.0
+    y = Pos[i, 1]
+    while y > 0.2:
+      y -= 4.0
+    while y < -0.2:
+      y += 4.0
+    if math.fabs(x) <= 0.2 or math.fabs(y) <= 0.2:
+      for j in range(0, len(Origin)):
+        if Origin[j] == HitID[i]:
+          Origin[j] = Origin[i]
+      ToDelete.append(i)
+
+  Origin, HitID, Pos, E, Type = np.delete(Origin, ToDelete), np.delete(HitID, ToDelete), np.delete(Pos, ToDelete, axis=0), np.delete(E, ToDelete), np.delete(Type, ToDelete)
+  for i in range(0, len(Origin)):
+    if HitID[i] != int(i+1):
+      for j in range(0, len(Origin)):
+        if Origin[j] == HitID[i]:
+          Origin[j] = i+1
+      HitID[i] = int(i+1)
+
+  return HitID, Origin, Pos, E, Type, GammaEnergy
+
+
+def observables(Events):
+  #Per event and per hit distributions, and the structure of the origins
+  Hits, Bremsstrahlung, ZExtent, HitEnergy, Roots, GammaEnergy = [], [], [], [], [], []
+  for (HitID, Origin, Pos, E, Type, Gamma) in Events:
+    assert np.array_equal(HitID, np.arange(1, len(HitID)+1)), "IDs are not running from 1 to max"
+    assert np.all(Origin < HitID), "Hits originate from later hits"
+    Hits.append(len(HitID))
+    Bremsstrahlung.append(np.sum(Type == 'b'))
+    ZExtent.append(np.ptp(Pos[:, 2]) if len(Pos) > 0 else 0)
+    Roots.append(np.sum(Origin == 0))
+    HitEnergy += list(E)
+    GammaEnergy.append(Gamma)
+  return { "hits per event": np.array(Hits), "Bremsstrahlung hits per event": np.array(Bremsstrahlung), "z extent": np.array(ZExtent),
+           "hits without origin": np.array(Roots), "hit energy": np.array(HitEnergy), "gamma energy": np.array(GammaEnergy) }
+
+
+def ks_statistic(A, B):
+  #Two-sample Kolmogorov-Smirnov statistic
+  Values = np.concatenate((A, B))
+  CDFA = np.searchsorted(np.sort(A), Values, side='right') / len(A)
+  CDFB = np.searchsorted(np.sort(B), Values, side='right') / len(B)
+  return np.max(np.abs(CDFA - CDFB))
+
+
+###################################################################################################
+# Generate
+###################################################################################################
+
+
+Start = time.perf_counter()
+Reference = [ createFromToyModelRealismLevel2Reference() for e in range(NumberOfEvents) ]
+LoopTime = time.perf_counter() - Start
+
+Start = time.perf_counter()
+Batch = ToyEventBatch()
+Batch.createFromToyModelRealismLevel2(NumberOfEvents, np.random.default_rng(int(args.seed)))
+BatchTime = time.perf_counter() - Start
+
+Vectorized = []
+for e in range(len(Batch)):
+  Hits = Batch.getHits(e)
+  Vectorized.append((Batch.ID[Hits], Batch.Origin[Hits], np.stack((Batch.X[Hits], Batch.Y[Hits], Batch.Z[Hits]), axis=1), Batch.E[Hits], Batch.Type[Hits], Batch.GammaEnergy[e]))
+
+
+###################################################################################################
+# Distribution checks
+###################################################################################################
+
+
+ReferenceObservables = observables(Reference)
+VectorizedObservables = observables(Vectorized)
+
+print("{:<32} {:>12} {:>12} {:>10}".format("Observable", "loop mean", "batch mean", "KS"))
+Failed = []
+for Name in ReferenceObservables:
+  A, B = ReferenceObservables[Name], VectorizedObservables[Name]
+  D = ks_statistic(A, B)
+  # Critical value of the two-sample KS test at a significance of 0.001
+  CriticalValue = 1.949 * math.sqrt((len(A) + len(B)) / (len(A) * len(B)))
+  print("{:<32} {:>12.2f} {:>12.2f} {:>10.4f}".format(Name, np.mean(A), np.mean(B), D))
+  if D > CriticalValue and np.ptp(np.concatenate((A, B))) > 1e-6:
+    Failed.append(Name)
+
+assert len(Failed) == 0, "Distributions differ: {}".format(", ".join(Failed))
+print("Distribution checks passed for {} events".format(NumberOfEvents))
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+print("\n{:<20} {:>14} {:>14}".format("Generator", "time [s]", "events/s"))
+print("{:<20} {:>14.2f} {:>14.0f}".format("event loop", LoopTime, NumberOfEvents/LoopTime))
+print("{:<20} {:>14.2f} {:>14.0f}".format("NumPy batch", BatchTime, NumberOfEvents/BatchTime))
+print("Speedup: {:.0f}x".format(LoopTime/BatchTime))
+
+
+# END
+###################################################################################################
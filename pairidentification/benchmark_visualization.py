@@ -0,0 +1,210 @@
+###################################################################################################
+#
+# benchmark_visualization.py
+#
+# Copyright (C) by Andreas Zoglauer & Harrison Costatino.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from types import SimpleNamespace
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgba
+
+from ToyEventBatch import ToyEventBatch
+from preprocess import generate_dataset
+from visualization import GraphVisualizer, edge_endpoints, edge_classes, edge_color, compare_True_Manual_edges, filter_position, draw_3d_arrows
+
+
+###################################################################################################
+
+
+"""
+Checks the vectorized edge classification of the GraphVisualizer against the original loops,
+and measures the time per sample of plot_sample with the original per-edge drawing, with one
+collection per color, and with the views rendered in a process pool.
+For all the command line options, try:
+
+python3 benchmark_visualization.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the GraphVisualizer.')
+parser.add_argument('-e', '--events', default='60', help='Number of (merged) toy events')
+parser.add_argument('-s', '--samples', default='5', help='Number of plotted samples')
+parser.add_argument('-p', '--processes', default='4', help='Number of rendering processes')
+parser.add_argument('-m', '--merge', default='10', help='Number of toy events merged into one event, to get larger graphs')
+
+args = parser.parse_args()
+
+
+#Toy model events, as in PairIdentificationGNN.py with -d tm2b, several merged into one event
+Merge = int(args.merge)
+Batch = ToyEventBatch()
+Batch.createFromToyModelRealismLevel2(int(args.events) * Merge, np.random.default_rng(0))
+Events = []
+for e in range(int(args.events)):
+  Hits = slice(Batch.Offsets[e*Merge], Batch.Offsets[(e+1)*Merge])
+  Shift = np.repeat(Batch.Offsets[e*Merge:(e+1)*Merge] - Batch.Offsets[e*Merge], np.diff(Batch.Offsets[e*Merge:(e+1)*Merge+1]))
+  Origin = np.where(Batch.Origin[Hits] > 0, Batch.Origin[Hits] + Shift, 0)
+  Events.append(SimpleNamespace(X=Batch.X[Hits], Y=Batch.Y[Hits], Z=Batch.Z[Hits], E=Batch.E[Hits], Origin=Origin, Type=Batch.Type[Hits], GammaEnergy=Batch.GammaEnergy[e]))
+
+Dataset, Labels, True_Ri, True_Ro = generate_dataset(Events)
+
+#A summary like the one of GNNTrainer.evaluate, with random predictions
+Random = np.random.default_rng(1)
+Samples = list(range(int(args.samples)))
+Summary = { 'X': [[ Dataset[i][0][0] for i in Samples ]], 'Ri': [[ Dataset[i][0][1] for i in Samples ]], 'Ro': [[ Dataset[i][0][2] for i in Samples ]],
+            'Edge_Labels': [[ Random.random(Labels.shape[1]) < 0.3 for i in Samples ]], 'Sample_Index': [ Samples ] }
+
+
+def edges_reference(Rin, Rout, predicted_edges, generated_edges):
+  #The per-edge loop of the original draw_2d/draw_3d
+  Result = []
+  for edge_idx in range(Rin.shape[1]):
+    if sum(Rin[:, edge_idx]) != 0:
+      ptA_idx = np.nonzero(Rout[:, edge_idx])[0][0]
+      ptB_idx = np.nonzero(Rin[:, edge_idx])[0][0]
+      color = edge_color(edge_idx, predicted_edges, generated_edges)
+      if color is not None:
+        Result.append((color, ptA_idx, ptB_idx))
+  return sorted(Result)
+
+
+def compare_reference(Man_Ri, Man_Ro, True_Ri, True_Ro):
+  #The nested loop of the original compare_True_Manual_edges
+  pt_indices = []
+  for true_edge_idx in range(True_Ri.shape[1]):
+    ptA_idx = np.nonzero(True_Ro[:, true_edge_idx])[0][0]
+    ptB_idx = np.nonzero(True_Ri[:, true_edge_idx])[0][0]
+    edge_found = False
+    A_row = Man_Ro[ptA_idx]
+    for e_idx in range(len(A_row)):
+      if A_row[e_idx] == 1:
+        if Man_Ri[ptB_idx][e_idx] == 1:
+          edge_found = True
+          break
+    if not edge_found:
+      pt_indices.append([ptA_idx, ptB_idx])
+  return pt_indices
+
+
+def filter_position_reference(pos):
+  new_pos = []
+  for i in range(len(pos)):
+    row = pos[i]
+    if not np.any(row):
+      if i == len(pos) - 1:
+        break
+      elif not np.any(pos[i+1]):
+        break
+    new_pos.append(row)
+  return np.array(new_pos)
+
+
+def plot_sample_reference(Visualizer, sample_idx):
+  #The original plot_sample: one matplotlib artist per edge
+  pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro = Visualizer.sample_data(sample_idx, 0)
+  for view in [ (0, 1), (0, 2), (1, 2), None ]:
+    fig = plt.figure(figsize=Visualizer.figure_size)
+    if view is None:
+      ax = fig.add_subplot(111, projection='3d')
+    new_pos = filter_position_reference(pos)
+    if view is None:
+      ax.scatter(new_pos[:, 0], new_pos[:, 1], new_pos[:, 2])
+    else:
+      plt.scatter(new_pos[:, view[0]], new_pos[:, view[1]])
+    Pairs = edges_reference(Rin, Rout, predicted_edges, generated_edges) + [ ("orange", a, b) for a, b in compare_reference(Rin, Rout, True_Ri, True_Ro) ]
+    for color, a, b in Pairs:
+      if view is None:
+        plt.plot([pos[a][0], pos[b][0]], [pos[a][1], pos[b][1]], [pos[a][2], pos[b][2]], color)
+      else:
+        plt.quiver(pos[a][view[0]], pos[a][view[1]], pos[b][view[0]] - pos[a][view[0]], pos[b][view[1]] - pos[a][view[1]], scale=1, angles='xy', scale_units='xy', color=color)
+    fig.savefig(os.path.join(Visualizer.OutputDir, "reference_{}_{}".format(sample_idx, view)))
+    plt.close(fig)
+
+
+###################################################################################################
+# Equivalence checks
+###################################################################################################
+
+
+for i in range(len(Dataset)):
+  (pos, Rin, Rout), _ = Dataset[i]
+  predicted = Random.random(Labels.shape[1]) < 0.3
+  senders, receivers, edges = edge_endpoints(Rin, Rout)
+  Vectorized = sorted((color, a, b) for color, mask in edge_classes(edges, predicted, Labels[i]) for a, b in zip(senders[mask], receivers[mask]))
+  assert Vectorized == edges_reference(Rin, Rout, predicted, Labels[i]), "Edge classes differ for event {}".format(i)
+  assert compare_True_Manual_edges(Rin, Rout, True_Ri[i], True_Ro[i]).tolist() == compare_reference(Rin, Rout, True_Ri[i], True_Ro[i]), "Script errors differ for event {}".format(i)
+  assert np.array_equal(filter_position(pos), filter_position_reference(pos)), "filter_position differs for event {}".format(i)
+
+# As the original draw_3d_arrows, the script errors are plain lines, i.e. one segment per edge
+# instead of the three of a 3D quiver arrow
+for i in range(len(Dataset)):
+  (pos, Rin, Rout), _ = Dataset[i]
+  Errors = compare_True_Manual_edges(Rin, Rout, True_Ri[i], True_Ro[i])
+  if len(Errors) > 0:
+    draw_3d_arrows(pos, Rin, Rout, np.ones(Labels.shape[1], dtype=bool), Labels[i], True_Ri[i], True_Ro[i])
+    plt.gcf().canvas.draw()
+    Orange = [ c for c in plt.gca().collections if hasattr(c, 'get_segments') and np.allclose(c.get_edgecolor()[0], to_rgba("orange")) ]
+    assert sum(len(c.get_segments()) for c in Orange) == len(Errors), "Script errors are not drawn as lines"
+    plt.close('all')
+    break
+
+print("Equivalence checks passed for {} toy events".format(len(Dataset)))
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+
+OutputDir = tempfile.mkdtemp()
+Results = []
+
+Visualizer = GraphVisualizer(Summary, Labels, True_Ri, True_Ro, OutputDir, processes=1)
+Start = time.perf_counter()
+for s in Samples:
+  plot_sample_reference(Visualizer, s)
+Results.append(("per-edge artists", time.perf_counter() - Start))
+
+Start = time.perf_counter()
+for s in Samples:
+  Visualizer.plot_sample(s)
+  plt.close('all')
+Results.append(("collections", time.perf_counter() - Start))
+
+Visualizer = GraphVisualizer(Summary, Labels, True_Ri, True_Ro, OutputDir, processes=int(args.processes))
+Visualizer.plot_sample(Samples[0])
+Start = time.perf_counter()
+for s in Samples:
+  Visualizer.plot_sample(s)
+Results.append(("collections, {} processes".format(args.processes), time.perf_counter() - Start))
+Visualizer.close()
+
+shutil.rmtree(OutputDir)
+
+print("\nMean edges per sample: {:.0f}, CPU cores: {}".format(np.mean([ np.sum(np.sum(Summary['Ri'][0][s], axis=0) != 0) for s in Samples ]), len(os.sched_getaffinity(0))))
+print("{:<28} {:>18}".format("plot_sample", "per sample [s]"))
+for Name, Time in Results:
+  print("{:<28} {:>18.3f}".format(Name, Time / len(Samples)))
+
+
+# END
+###################################################################################################
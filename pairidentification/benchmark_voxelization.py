@@ -0,0 +1,145 @@
+###################################################################################################
+#
+# benchmark_voxelization.py
+#
+# Copyright (C) by Andreas Zoglauer & Harrison Costatino.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import math
+import time
+import argparse
+import numpy as np
+from types import SimpleNamespace
+
+from voxelization import voxelize_events, layer_labels, gamma_energies, VoxelBatchCache
+
+
+###################################################################################################
+
+
+"""
+Checks that the vectorized voxelization gives the same tensors as the original loops of the
+tensor_generator in PairIdentification.py, and benchmarks both.
+For all the command line options, try:
+
+python3 benchmark_voxelization.py --help
+
+"""
+
+
+parser = argparse.ArgumentParser(description='Check and benchmark the voxelization of PairIdentification.py.')
+parser.add_argument('-b', '--batchsize', default='128', help='Batch size')
+parser.add_argument('-n', '--batches', default='10', help='Number of batches')
+
+args = parser.parse_args()
+
+# Same binning as PairIdentification.py
+XBins, YBins, ZBins = 32, 32, 64
+XMin, XMax, YMin, YMax, ZMin, ZMax = -43, 43, -43, 43, 13, 45
+OutputDataSpaceSize = ZBins
+Bins = (XBins, YBins, ZBins)
+Ranges = ((XMin, XMax), (YMin, YMax), (ZMin, ZMax))
+
+BatchSize = int(args.batchsize)
+Random = np.random.default_rng(0)
+
+
+def make_toy_event():
+  #Two straight tracks from a common origin, with a few hits outside the volume
+  n_hits = int(Random.integers(10, 80))
+  origin = np.array([ Random.uniform(-40, 40), Random.uniform(-40, 40), Random.uniform(12, 46) ])
+  steps = np.cumsum(Random.normal(0, 1.0, (n_hits, 3)), axis=0)
+  pos = origin + steps
+  return SimpleNamespace(X=pos[:, 0], Y=pos[:, 1], Z=pos[:, 2], E=Random.exponential(100, n_hits), GammaEnergy=Random.uniform(5000, 15000), OriginPositionZ=origin[2])
+
+
+def make_positional_tensor_reference(event_data, idx, batch_size, accumulate):
+  #The original loop of PairIdentification.py, optionally summing the energies in a voxel.
+  #The bins are floored: int() truncated hits up to one bin below the minimum into bin 0
+  tensor = np.zeros(shape=(batch_size, XBins, YBins, ZBins, 1))
+  for i in range(batch_size):
+    Event = event_data[i + idx*batch_size]
+    for j in range(len(Event.X)):
+      XBin = math.floor( (Event.X[j] - XMin) / ((XMax - XMin) / XBins) )
+      YBin = math.floor( (Event.Y[j] - YMin) / ((YMax - YMin) / YBins) )
+      ZBin = math.floor( (Event.Z[j] - ZMin) / ((ZMax - ZMin) / ZBins) )
+      if XBin >= 0 and YBin >= 0 and ZBin >= 0 and XBin < XBins and YBin < YBins and ZBin < ZBins:
+        if accumulate:
+          tensor[i][XBin][YBin][ZBin][0] += Event.E[j]
+        else:
+          tensor[i][XBin][YBin][ZBin][0] = Event.E[j]
+  return tensor
+
+
+def make_label_tensor_reference(event_data, idx, batch_size):
+  tensor = np.zeros(shape=(batch_size, OutputDataSpaceSize))
+  for i in range(batch_size):
+    Event = event_data[i + idx*batch_size]
+    if Event.OriginPositionZ > ZMin and Event.OriginPositionZ < ZMax:
+      LayerBin = int ((Event.OriginPositionZ - ZMin) / ((ZMax- ZMin)/ ZBins) )
+      tensor[i][LayerBin] = 1
+    else:
+      tensor[i][OutputDataSpaceSize-1] = 1
+  return tensor
+
+
+def make_batch(idx):
+  events = Events[idx*BatchSize:(idx+1)*BatchSize]
+  return ([voxelize_events(events, Bins, Ranges), gamma_energies(events)], layer_labels(events, ZMin, ZMax, ZBins))
+
+
+Events = [ make_toy_event() for e in range(BatchSize * int(args.batches)) ]
+
+
+###################################################################################################
+# Equivalence checks
+###################################################################################################
+
+
+Collisions = 0
+for idx in range(int(args.batches)):
+  events = Events[idx*BatchSize:(idx+1)*BatchSize]
+  last = make_positional_tensor_reference(Events, idx, BatchSize, False)
+  summed = make_positional_tensor_reference(Events, idx, BatchSize, True)
+  assert np.array_equal(voxelize_events(events, Bins, Ranges, accumulate=False), last.astype(np.float32)), "Last-hit voxelization differs for batch {}".format(idx)
+  assert np.allclose(voxelize_events(events, Bins, Ranges), summed, rtol=1e-6), "Summed voxelization differs for batch {}".format(idx)
+  assert np.array_equal(layer_labels(events, ZMin, ZMax, ZBins), make_label_tensor_reference(Events, idx, BatchSize)), "Labels differ for batch {}".format(idx)
+  Collisions += np.sum(last != summed)
+
+print("Equivalence checks passed for {} batches, {} voxels with more than one hit".format(args.batches, Collisions))
+
+
+###################################################################################################
+# Benchmarks
+###################################################################################################
+
+
+def timeit(function):
+  start = time.perf_counter()
+  for idx in range(int(args.batches)):
+    function(idx)
+  return (time.perf_counter() - start) / int(args.batches)
+
+
+LoopTime = timeit(lambda idx: (make_positional_tensor_reference(Events, idx, BatchSize, False), make_label_tensor_reference(Events, idx, BatchSize)))
+VectorTime = timeit(make_batch)
+Cache = VoxelBatchCache(int(args.batches))
+timeit(lambda idx: Cache.get(idx, make_batch))
+CachedTime = timeit(lambda idx: Cache.get(idx, make_batch))
+
+print("\n{:<30} {:>16} {:>10}".format("Batch creation", "per batch [ms]", "speedup"))
+for Name, Time in [ ("loops", LoopTime), ("vectorized", VectorTime), ("vectorized, cached epoch", CachedTime) ]:
+  print("{:<30} {:>16.2f} {:>9.0f}x".format(Name, 1000*Time, LoopTime/Time))
+print("Cache memory for {} batches of {} events: {:.1f} MB".format(args.batches, BatchSize, Cache.nbytes() / 1e6))
+
+
+# END
+###################################################################################################
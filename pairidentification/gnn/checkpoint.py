@@ -0,0 +1,100 @@
+"""
+This module implements the checkpoint writing of the trainers: the model and
+optimizer states are copied to CPU memory and written atomically, optionally in
+a background thread, and old checkpoints are removed.
+"""
+
+# System
+import os
+import queue
+import threading
+
+# Externals
+import torch
+
+def snapshot_state(state):
+    """
+    Copy all tensors of a (nested) state_dict to CPU memory, so that the training
+    can continue to modify the parameters while the snapshot is written
+    """
+    if torch.is_tensor(state):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return type(state)((k, snapshot_state(v)) for k, v in state.items())
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot_state(v) for v in state)
+    return state
+
+class CheckpointWriter(object):
+    """
+    Writes checkpoints as checkpoint_dir/model_checkpoint_<id>.pth.tar via a temporary
+    file and a rename, thus a checkpoint file is always complete.
+    Only the last keep_last checkpoints and the one with the lowest metric are kept.
+    With asynchronous=True the files are written by a background thread, and at most
+    max_pending snapshots wait in memory; further submits block until one is written.
+    """
+    def __init__(self, checkpoint_dir, keep_last=3, keep_best=True,
+                 asynchronous=True, max_pending=1):
+        self.checkpoint_dir = checkpoint_dir
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.asynchronous = asynchronous
+        self.written = []
+        self.best_id = None
+        self.best_metric = None
+        self.error = None
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        if asynchronous:
+            self.queue = queue.Queue(maxsize=max_pending)
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def checkpoint_file(self, checkpoint_id):
+        return os.path.join(self.checkpoint_dir, 'model_checkpoint_%03i.pth.tar' % checkpoint_id)
+
+    def submit(self, checkpoint_id, state, metric=None):
+        """Write the state, which must already be a CPU snapshot"""
+        if self.error is not None:
+            raise self.error
+        if self.asynchronous:
+            self.queue.put((checkpoint_id, state, metric))
+        else:
+            self._write(checkpoint_id, state, metric)
+
+    def close(self):
+        """Wait until all submitted checkpoints are written"""
+        if self.asynchronous and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.error = e
+
+    def _write(self, checkpoint_id, state, metric):
+        file_name = self.checkpoint_file(checkpoint_id)
+        temp_name = file_name + '.tmp'
+        torch.save(state, temp_name)
+        os.replace(temp_name, file_name)
+        if checkpoint_id not in self.written:
+            self.written.append(checkpoint_id)
+        if metric is not None and (self.best_metric is None or metric < self.best_metric):
+            self.best_id, self.best_metric = checkpoint_id, metric
+        self._cleanup()
+
+    def _cleanup(self):
+        keep = set(self.written[-self.keep_last:]) if self.keep_last > 0 else set()
+        if self.keep_best and self.best_id is not None:
+            keep.add(self.best_id)
+        for checkpoint_id in [c for c in self.written if c not in keep]:
+            self.written.remove(checkpoint_id)
+            if os.path.exists(self.checkpoint_file(checkpoint_id)):
+                os.remove(self.checkpoint_file(checkpoint_id))
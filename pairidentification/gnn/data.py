@@ -0,0 +1,113 @@
+"""
+This module implements the PyTorch data handling for the graph neural networks:
+events are stored unpadded and only padded to the largest event of each batch.
+"""
+
+# System
+import random
+
+# Externals
+import numpy as np
+import torch
+from torch.utils.data import Dataset, Sampler
+
+# Locals
+from preprocess import vectorize_data
+
+class GraphDataset(Dataset):
+    """
+    Dataset of unpadded graphs. Each event consists of the hit positions (n_hits, 3),
+    the sender and receiver hit of each edge (n_edges,) and the edge labels (n_edges,).
+    """
+    def __init__(self, XYZ, Senders, Receivers, Edge_Labels):
+        super(GraphDataset, self).__init__()
+        self.XYZ = XYZ
+        self.Senders = Senders
+        self.Receivers = Receivers
+        self.Edge_Labels = Edge_Labels
+        self.n_hits = np.array([len(x) for x in XYZ], dtype=np.int64)
+        self.n_edges = np.array([len(s) for s in Senders], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.XYZ)
+
+    def __getitem__(self, i):
+        return self.XYZ[i], self.Senders[i], self.Receivers[i], self.Edge_Labels[i]
+
+def generate_graph_dataset(eventArr):
+    """
+    Unpadded counterpart of preprocess.generate_dataset.
+    Returns the GraphDataset, the padded edge labels, and the true incidence matrices.
+    """
+    Edge_Labels, Receivers, Senders, XYZ, _, _, _, True_Ri, True_Ro = vectorize_data(eventArr, sparse=True)
+    n_hits = [Ri.shape[0] for Ri in True_Ri]
+    dataset = GraphDataset([XYZ[i, :n_hits[i]].copy() for i in range(len(n_hits))], Senders, Receivers,
+                           [Edge_Labels[i, :len(Senders[i])] for i in range(len(n_hits))])
+    return dataset, Edge_Labels, True_Ri, True_Ro
+
+def collate_graphs(batch, n_hits=None, n_edges=None):
+    """
+    Pad a list of GraphDataset events to the largest event in the batch (or to n_hits/n_edges
+    if given) and build the dense incidence matrices used by GNNSegmentClassifier.
+    Returns ([X, Ri, Ro], Edge_Labels) like the padded datasets of preprocess.generate_dataset.
+    """
+    if n_hits is None:
+        n_hits = max(len(x) for x, _, _, _ in batch)
+    if n_edges is None:
+        n_edges = max(len(s) for _, s, _, _ in batch)
+    X = torch.zeros(len(batch), n_hits, 3)
+    Ri = torch.zeros(len(batch), n_hits, n_edges)
+    Ro = torch.zeros(len(batch), n_hits, n_edges)
+    labels = torch.zeros(len(batch), n_edges)
+    for b, (x, senders, receivers, edge_labels) in enumerate(batch):
+        edges = torch.arange(len(senders))
+        X[b, :len(x)] = torch.as_tensor(x, dtype=torch.float32)
+        Ro[b, torch.as_tensor(senders, dtype=torch.long), edges] = 1
+        Ri[b, torch.as_tensor(receivers, dtype=torch.long), edges] = 1
+        labels[b, :len(edge_labels)] = torch.as_tensor(edge_labels, dtype=torch.float32)
+    return [X, Ri, Ro], labels
+
+def padding_waste(batches, n_hits, n_edges):
+    """
+    Fraction of the incidence matrix entries of the batches which are padding
+    """
+    used, padded = 0, 0
+    for batch in batches:
+        used += np.sum(n_hits[batch] * n_edges[batch])
+        padded += len(batch) * np.max(n_hits[batch]) * np.max(n_edges[batch])
+    return 1.0 - used / max(padded, 1)
+
+class BucketBatchSampler(Sampler):
+    """
+    Batch sampler which groups events of similar size. The events are shuffled, split into
+    buckets of bucket_batches batches, and sorted by size within each bucket. The order of the
+    resulting batches is shuffled again.
+    """
+    def __init__(self, n_hits, n_edges, batch_size, shuffle=True, bucket_batches=50):
+        self.n_hits = np.asarray(n_hits)
+        self.n_edges = np.asarray(n_edges)
+        self.sizes = self.n_hits * self.n_edges
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_batches = bucket_batches
+        self.batches = []
+
+    def __iter__(self):
+        indices = list(range(len(self.sizes)))
+        if self.shuffle:
+            random.shuffle(indices)
+        bucket_size = self.batch_size * self.bucket_batches
+        self.batches = []
+        for start in range(0, len(indices), bucket_size):
+            bucket = sorted(indices[start:start + bucket_size], key=lambda i: self.sizes[i])
+            self.batches += [bucket[b:b + self.batch_size] for b in range(0, len(bucket), self.batch_size)]
+        if self.shuffle:
+            random.shuffle(self.batches)
+        return iter(self.batches)
+
+    def __len__(self):
+        return (len(self.sizes) + self.batch_size - 1) // self.batch_size
+
+    def padding_waste(self):
+        """Padding fraction of the batches of the last epoch"""
+        return padding_waste(self.batches, self.n_hits, self.n_edges)
@@ -0,0 +1,65 @@
+"""
+This module implements the launcher for the data-parallel training on CPUs:
+N local worker processes, connected via the gloo backend of torch.distributed,
+each training on its own shard of the data with a fixed number of threads.
+"""
+
+# System
+import os
+import multiprocessing as mp
+
+# Externals
+import torch
+import torch.distributed as dist
+from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
+
+def distributed_data_loader(dataset, batch_size, shuffle=True, **loader_args):
+    """
+    DataLoader over the shard of the dataset of this process.
+    If shuffle is True, GNNTrainer.train calls set_epoch on the sampler to reshuffle every epoch.
+    Note that a plain single-process DataLoader does not shuffle, thus pass shuffle=False to
+    train on the same event order as without distribution.
+    """
+    sampler = DistributedSampler(dataset, shuffle=shuffle)
+    return DataLoader(dataset, batch_size=batch_size, sampler=sampler, **loader_args)
+
+def pin_threads(rank, threads):
+    """
+    Use threads intra-op threads, and pin the process to its own cores if there are enough
+    """
+    torch.set_num_threads(threads)
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    if len(cores) >= (rank + 1) * threads:
+        os.sched_setaffinity(0, cores[rank * threads:(rank + 1) * threads])
+
+def _worker(rank, world_size, threads, port, results, train_fn, train_args):
+    pin_threads(rank, threads)
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    try:
+        result = train_fn(rank, world_size, *train_args)
+        if rank == 0:
+            results.put(result)
+    finally:
+        dist.destroy_process_group()
+
+def launch(train_fn, world_size, threads=1, train_args=(), port=29500):
+    """
+    Run train_fn(rank, world_size, *train_args) in world_size local processes and return the
+    result of rank 0. The processes are forked, thus the data sets already loaded by the calling
+    script are shared and the script is not imported again.
+    Within train_fn, GNNTrainer wraps its model in DistributedDataParallel.
+    """
+    results = mp.get_context('fork').SimpleQueue()
+    context = torch.multiprocessing.start_processes(_worker, args=(world_size, threads, port, results, train_fn, train_args),
+                                                    nprocs=world_size, start_method='fork', join=False)
+    # Read the result while waiting, rank 0 cannot exit before a large result is read
+    result = None
+    while not context.join(timeout=1):
+        if result is None and not results.empty():
+            result = results.get()
+    if result is None:
+        result = results.get()
+    return result
@@ -0,0 +1,94 @@
+"""
+This module implements streaming accumulators for the evaluation of the
+edge classification, so that the evaluation memory does not grow with the test set.
+"""
+
+# System
+import random
+
+# Externals
+import numpy as np
+import torch
+
+class EdgeMetrics(object):
+    """
+    Accumulates loss, accuracy, and the confusion counts at several
+    thresholds batch by batch. Padded edges can be excluded from the
+    confusion counts with a mask.
+    """
+    def __init__(self, thresholds=np.linspace(0.1, 0.9, 9)):
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        self.sum_loss = 0.0
+        self.n_batches = 0
+        self.sum_correct = 0
+        self.sum_total = 0
+        self.tp = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.fp = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.fn = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.tn = np.zeros(len(self.thresholds), dtype=np.int64)
+
+    def update(self, output, target, loss, mask=None):
+        """Add one batch: model output and target of shape (batch, edges)"""
+        self.sum_loss += loss
+        self.n_batches += 1
+        # Accuracy at 0.5 over all entries, as in the original evaluation
+        matches = ((output > 0.5) == (target > 0.5))
+        self.sum_correct += matches.sum().item()
+        self.sum_total += matches.numel()
+        # Confusion counts at all thresholds over the real edges
+        if mask is None:
+            mask = torch.ones_like(target, dtype=torch.bool)
+        output = output[mask]
+        truth = target[mask] > 0.5
+        thresholds = torch.as_tensor(self.thresholds, device=output.device)
+        predicted = output[None, :] > thresholds[:, None]
+        self.tp += (predicted & truth).sum(dim=1).cpu().numpy()
+        self.fp += (predicted & ~truth).sum(dim=1).cpu().numpy()
+        self.fn += (~predicted & truth).sum(dim=1).cpu().numpy()
+        self.tn += (~predicted & ~truth).sum(dim=1).cpu().numpy()
+
+    def summary(self, prefix='valid_'):
+        """Return the metrics as summary dictionary"""
+        summary = dict()
+        summary[prefix + 'loss'] = self.sum_loss / max(self.n_batches, 1)
+        summary[prefix + 'acc'] = self.sum_correct / (self.sum_total + 1e-10)
+        summary[prefix + 'thresholds'] = self.thresholds
+        summary[prefix + 'precision'] = self.tp / np.maximum(self.tp + self.fp, 1)
+        summary[prefix + 'recall'] = self.tp / np.maximum(self.tp + self.fn, 1)
+        i = int(np.argmin(np.abs(self.thresholds - 0.5)))
+        summary[prefix + 'confusion'] = dict(tp=int(self.tp[i]), fp=int(self.fp[i]),
+                                             fn=int(self.fn[i]), tn=int(self.tn[i]))
+        return summary
+
+class ReservoirSample(object):
+    """
+    Uniform random sample of at most size items out of a stream of
+    unknown length (reservoir sampling, algorithm R).
+    """
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.random = random.Random(seed)
+        self.n_seen = 0
+        self.indices = []
+        self.items = []
+
+    def add(self, item_fn):
+        """
+        Offer the next item of the stream. item_fn is only called when the
+        item is kept, thus expensive copies are only made for sampled items.
+        """
+        index = self.n_seen
+        self.n_seen += 1
+        if len(self.items) < self.size:
+            self.indices.append(index)
+            self.items.append(item_fn())
+        else:
+            slot = self.random.randint(0, index)
+            if slot < self.size:
+                self.indices[slot] = index
+                self.items[slot] = item_fn()
+
+    def sorted(self):
+        """Return the stream indices and the items, ordered by index"""
+        order = np.argsort(self.indices)
+        return [self.indices[i] for i in order], [self.items[i] for i in order]
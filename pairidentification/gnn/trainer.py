@@ -10,17 +10,21 @@ import time
 # Externals
 import numpy as np
 import torch
+import torch.distributed as dist
 from torch import nn
 
 # Internals
 from gnn.model import GNNSegmentClassifier
+from gnn.metrics import EdgeMetrics, ReservoirSample
+from gnn.checkpoint import CheckpointWriter, snapshot_state
 
 class GNNTrainer(object):
     """
     Trainer code for edge classification problems.
     """
 
-    def __init__(self, output_dir=None, device='cpu'):
+    def __init__(self, output_dir=None, device='cpu', n_eval_samples=16,
+                 async_checkpoints=True, keep_checkpoints=3):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.output_dir = (os.path.expandvars(output_dir)
                            if output_dir is not None else None)
@@ -29,6 +33,14 @@ class GNNTrainer(object):
             self.distributed = torch.cuda.device_count() > 1
         else:
             self.distributed = False
+        # Rank within the CPU data-parallel processes started by gnn.distributed.launch
+        self.rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        # Number of evaluated events kept with their inputs and predictions for the visualization
+        self.n_eval_samples = n_eval_samples
+        # Checkpoints are written in a background thread, only the last and the best are kept
+        self.async_checkpoints = async_checkpoints
+        self.keep_checkpoints = keep_checkpoints
+        self.checkpoint_writer = None
         
         self.summaries = {}
 
@@ -50,14 +62,22 @@ class GNNTrainer(object):
         np.save(output_dir, summary)
 
 
-    def write_checkpoint(self, checkpoint_id):
-        """Write a checkpoint for the model"""
+    def write_checkpoint(self, checkpoint_id, metric=None):
+        """Write a checkpoint for the model and the optimizer"""
         assert self.output_dir is not None
-        checkpoint_dir = os.path.join(self.output_dir, 'checkpoints')
-        checkpoint_file = 'model_checkpoint_%03i.pth.tar' % checkpoint_id
-        os.makedirs(checkpoint_dir, exist_ok=True)
-        torch.save(dict(model=self.model.state_dict()),
-                   os.path.join(checkpoint_dir, checkpoint_file))
+        if self.checkpoint_writer is None:
+            self.checkpoint_writer = CheckpointWriter(os.path.join(self.output_dir, 'checkpoints'),
+                                                      keep_last=self.keep_checkpoints,
+                                                      asynchronous=self.async_checkpoints)
+        state = snapshot_state(dict(model=self.unwrapped_model().state_dict(),
+                                    optimizer=self.optimizer.state_dict()))
+        self.checkpoint_writer.submit(checkpoint_id, state, metric)
+
+    def close_checkpoints(self):
+        """Wait for the checkpoints still being written"""
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
+            self.checkpoint_writer = None
 
     def build_model(self, model_type='gnn_segment_classifier',
                     optimizer='Adam', learning_rate=0.001,
@@ -70,17 +90,34 @@ class GNNTrainer(object):
             self.model = nn.DataParallel(self.model)
             print("Parallelized Data")
         self.model.to(self.device)
+        if dist.is_available() and dist.is_initialized():
+            # CPU data parallel: the gradients are averaged over all processes
+            self.model = nn.parallel.DistributedDataParallel(self.model)
+            print("Distributed Model over", dist.get_world_size(), "processes")
         print("Ported Model to Device")
         self.optimizer = getattr(torch.optim, optimizer)(self.model.parameters(), lr=learning_rate)
         self.loss_func = getattr(torch.nn, loss_func)()
         print("Finished Building Model")
     
+    def unwrapped_model(self):
+        """
+        The model without the DataParallel / DistributedDataParallel wrappers, whose state_dict
+        keys do not depend on the number of GPUs or processes
+        """
+        model = self.model
+        while isinstance(model, (nn.DataParallel, nn.parallel.DistributedDataParallel)):
+            model = model.module
+        return model
+
     #Each model consists of three networks, so might have to restore them one by one
     def save_model(self, model_path='saved_model_state.pt'):
-        torch.save(self.model.state_dict(), model_path)
+        torch.save(self.unwrapped_model().state_dict(), model_path)
     
     def restore_model(self, model_path='saved_model_state.pt'):
-        self.model.load_state_dict(torch.load(model_path))
+        state = torch.load(model_path)
+        # Models saved from a wrapped model before have "module."-prefixed keys
+        nn.modules.utils.consume_prefix_in_state_dict_if_present(state, 'module.')
+        self.unwrapped_model().load_state_dict(state)
         self.model.eval()
 
     def train_epoch(self, data_loader):
@@ -104,7 +141,12 @@ class GNNTrainer(object):
             sum_loss += batch_loss.item()
             i_final = i
         summary['train_time'] = time.time() - start_time
+        summary['train_step_time'] = summary['train_time'] / (i_final + 1)
         summary['train_loss'] = sum_loss / (i_final + 1)
+        # Fraction of the batches' incidence matrices which is padding, for size-bucketed batches
+        if hasattr(data_loader.batch_sampler, 'padding_waste'):
+            summary['train_padding_waste'] = data_loader.batch_sampler.padding_waste()
+            self.logger.info('  Padding waste: %.3f' % summary['train_padding_waste'])
         self.logger.debug(' Processed %i batches' % (i_final + 1))
         self.logger.info('  Training loss: %.3f' % summary['train_loss'])
         return summary
@@ -114,47 +156,41 @@ class GNNTrainer(object):
         """"Evaluate the model"""
         self.model.eval()
         summary = dict()
-        sum_loss = 0
-        sum_correct = 0
-        sum_total = 0
+        metrics = EdgeMetrics()
+        samples = ReservoirSample(self.n_eval_samples)
         start_time = time.time()
         # Loop over batches
         i_final = 0 
-        X, Ri, Ro, Edge_Labels = [], [], [], None
         for i, (batch_input, batch_target) in enumerate(data_loader):
             self.logger.debug(' batch %i', i)
-            X += (batch_input[0])
-            Ri += (batch_input[1])
-            Ro += (batch_input[2])
             batch_input = [a.to(self.device) for a in batch_input]
             batch_target = batch_target.to(self.device)
             batch_output = self.model(batch_input)
 
-            edge_l = (batch_output > 0.5).data.cpu().numpy()
-            if Edge_Labels is None:
-                Edge_Labels = edge_l
-            else:
-                Edge_Labels = np.vstack((Edge_Labels, edge_l))
-
-            sum_loss += self.loss_func(batch_output, batch_target).item()
-            # Count number of correct predictions
-            matches = ((batch_output > 0.5) == (batch_target > 0.5))
-            sum_correct += matches.sum().item()
-            sum_total += matches.numel()
+            # Padded edges have no receiving hit
+            edge_mask = batch_input[1].sum(dim=1) > 0
+            metrics.update(batch_output, batch_target, self.loss_func(batch_output, batch_target).item(), edge_mask)
+
+            # Only keep a bounded random sample of the events for the visualization
+            for b in range(batch_target.shape[0]):
+                samples.add(lambda: (batch_input[0][b].cpu().numpy(), batch_input[1][b].cpu().numpy(),
+                                     batch_input[2][b].cpu().numpy(), (batch_output[b] > 0.5).cpu().numpy()))
             i_final = i
 
         summary['valid_time'] = time.time() - start_time
-        summary['valid_loss'] = sum_loss / (i_final + 1)
-        summary['valid_acc'] = sum_correct / (sum_total + 1e-10)
-        summary['X'] = X
-        summary['Ri'] = Ri
-        summary['Ro'] = Ro
-        summary['Edge_Labels'] = Edge_Labels
+        summary.update(metrics.summary())
+        # Index of the sampled events in the evaluated data set
+        summary['Sample_Index'], sampled = samples.sorted()
+        summary['X'] = [s[0] for s in sampled]
+        summary['Ri'] = [s[1] for s in sampled]
+        summary['Ro'] = [s[2] for s in sampled]
+        summary['Edge_Labels'] = [s[3] for s in sampled]
 
         self.logger.debug(' Processed %i samples in %i batches',
                           len(data_loader.sampler), i_final + 1)
         self.logger.info('  Validation loss: %.3f acc: %.3f' %
                          (summary['valid_loss'], summary['valid_acc']))
+        self.logger.info('  Validation confusion at 0.5: %s' % summary['valid_confusion'])
         return summary
 
     def train(self, train_data_loader, n_epochs, valid_data_loader=None):
@@ -164,14 +200,21 @@ class GNNTrainer(object):
         for i in range(n_epochs):
             self.logger.info('Epoch %i' % i)
             summary = dict(epoch=i)
+            # Reshuffle the shards of a DistributedSampler
+            if hasattr(train_data_loader.sampler, 'set_epoch'):
+                train_data_loader.sampler.set_epoch(i)
             # Train on this epoch
             summary.update(self.train_epoch(train_data_loader))
             # Evaluate on this epoch
             if valid_data_loader is not None:
                 summary.update(self.evaluate(valid_data_loader))
-            # Save summary, checkpoint
+            # Save checkpoint, summary
+            if self.output_dir is not None and self.rank == 0:
+                start_time = time.time()
+                self.write_checkpoint(checkpoint_id=i, metric=summary.get('valid_loss'))
+                # Time the training loop is blocked by the checkpoint
+                summary['checkpoint_time'] = time.time() - start_time
             self.save_summary(summary)
-            if self.output_dir is not None:
-                self.write_checkpoint(checkpoint_id=i)
+        self.close_checkpoints()
 
         return self.summaries
\ No newline at end of file
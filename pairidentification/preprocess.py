@@ -6,30 +6,42 @@ def generate_incidence(edges, pos_data):
     Ri = np.zeros((n_hits, n_edges), dtype=np.uint8)
     Ro = np.zeros((n_hits, n_edges), dtype=np.uint8)
     
-    for i in range(len(edges)):
-        point = edges[i]
-        from_pt = point[0]
-        to_pt = point[1]
-        Ro[from_pt][i] = 1
-        Ri[to_pt][i] = 1
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    Ro[edges[:, 0], np.arange(n_edges)] = 1
+    Ri[edges[:, 1], np.arange(n_edges)] = 1
     
     return Ri, Ro
 
+def connect_pos_edges(pos_data):
+    #Edge list of the manually connected graph: both directions for all hit pairs in adjacent z layers
+    #Same edges in the same order as the pairwise comparison (i, j) with z_j == z_i + 1
+    z = np.asarray(pos_data, dtype=float).reshape(-1, 3)[:, 2]
+    
+    #Sort the hits by layer - stable, thus hits within a layer stay in index order
+    order = np.argsort(z, kind='stable')
+    z_sorted = z[order]
+    
+    #For every hit A the range of hits B in the layer above
+    lo = np.searchsorted(z_sorted, z + 1, side='left')
+    hi = np.searchsorted(z_sorted, z + 1, side='right')
+    counts = hi - lo
+    
+    #Expand the ranges into (A, B) pairs
+    from_pt = np.repeat(np.arange(len(z)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    to_pt = order[np.repeat(lo, counts) + offsets]
+    
+    #Interleave (A, B) and (B, A)
+    edges = np.empty((2*len(from_pt), 2), dtype=np.int64)
+    edges[0::2, 0] = from_pt
+    edges[0::2, 1] = to_pt
+    edges[1::2, 0] = to_pt
+    edges[1::2, 1] = from_pt
+    return edges
+
 def connect_pos(pos_data):
     #Manually Connect Graph based on Positions
-    edges = []
-    for i in range(len(pos_data)):
-        point_A = pos_data[i]
-        z_A = point_A[2]
-
-        for j in range(len(pos_data)):
-            point_B = pos_data[j]
-            z_B = point_B[2]
-
-            if z_B == z_A + 1:
-                edges.append((i, j))
-                edges.append((j, i))
-    return generate_incidence(edges, pos_data)
+    return generate_incidence(connect_pos_edges(pos_data), pos_data)
 
 def pad(arr, shape):
     #Padd arr to Shape
@@ -40,8 +52,55 @@ def pad(arr, shape):
         padded_arr[:arr.shape[0],:arr.shape[1]] = arr
     return padded_arr
 
-def vectorize_data(eventArr):
+def label_edges(candidate_edges, true_edges, n_hits):
+    #Label the candidate edges: 1 if the (origin, target) pair is one of the true edges, 0 otherwise
+    #Each pair is encoded as one int64, thus all edges are labelled with a single np.isin
+    #Origins start at -1 (the true edges of the first hit), hence the shift by one
+    candidate_edges = np.asarray(candidate_edges, dtype=np.int64).reshape(-1, 2)
+    true_edges = np.asarray(true_edges, dtype=np.int64).reshape(-1, 2)
+    candidate_codes = (candidate_edges[:, 0] + 1) * (n_hits + 1) + candidate_edges[:, 1]
+    true_codes = (true_edges[:, 0] + 1) * (n_hits + 1) + true_edges[:, 1]
+    return np.isin(candidate_codes, true_codes).astype(np.float64)
+
+def generate_edge_index(edges):
+    #Index pair representation of the incidence matrices: Ro[senders[i], i] = Ri[receivers[i], i] = 1
+    edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+    return edges[:, 0].copy(), edges[:, 1].copy()
+
+def densify_incidence(senders, receivers, n_hits, n_edges, dtype=np.float32):
+    #Dense (padded) incidence matrices Ri, Ro from the index pair representation
+    Ri = np.zeros((n_hits, n_edges), dtype=dtype)
+    Ro = np.zeros((n_hits, n_edges), dtype=dtype)
+    Ro[senders, np.arange(len(senders))] = 1
+    Ri[receivers, np.arange(len(receivers))] = 1
+    return Ri, Ro
+
+class SparseGraphDataset(object):
+    """
+    Events with the manually connected graphs stored as edge index pairs (senders, receivers).
+    The padded dense incidence matrices used by GNNSegmentClassifier are only created when an
+    event is accessed, e.g. by the torch DataLoader.
+    """
+    def __init__(self, XYZ, Senders, Receivers, Edge_Labels):
+        self.XYZ = XYZ
+        self.Senders = Senders
+        self.Receivers = Receivers
+        self.Edge_Labels = Edge_Labels
+    
+    def __len__(self):
+        return len(self.Senders)
+    
+    def __getitem__(self, i):
+        Ri, Ro = densify_incidence(self.Senders[i], self.Receivers[i], self.XYZ.shape[1], self.Edge_Labels.shape[1])
+        return [[self.XYZ[i], Ri, Ro], self.Edge_Labels[i]]
+    
+    def nbytes(self):
+        #Memory used by the stored arrays
+        return self.XYZ.nbytes + self.Edge_Labels.nbytes + sum(s.nbytes + r.nbytes for s, r in zip(self.Senders, self.Receivers))
+
+def vectorize_data(eventArr, sparse=False):
     # Edge Validity Labels, Manually Connected Rin, Mannually Connected Rout, XYZ, Type, Energy, Gamma Energy
+    # With sparse == True, Man_Ri and Man_Ro are lists of the unpadded receiver and sender indices of each event
     Edge_Labels, True_Ri, True_Ro, Man_Ri, Man_Ro, XYZ, Type, Energy, GammaEnergy = [], [], [], [], [], [], [], [], []
     max_hits, max_edges = 0, 0
     
@@ -57,25 +116,27 @@ def vectorize_data(eventArr):
             edges.append((event.Origin[i-1]-1,i-1))
         e_Ri, e_Ro = generate_incidence(edges,pos)
         
-        #Generate Proposed Incidence Matrices based on Positions
-        p_Ri, p_Ro = connect_pos(pos)
+        #Generate Proposed Edges based on Positions
+        p_edges = connect_pos_edges(pos)
         
         #Generate Edge Labels (0 - fake edge; 1 - true edge)
-        e_label = np.zeros(p_Ri.shape[1])
-        for i in range(p_Ri.shape[1]):
-            out = np.where(p_Ro[:,i] == 1)[0][0]
-            inn = np.where(p_Ri[:,i] == 1)[0][0]
-            e_label[i] = 1*((out, inn) in edges)
+        e_label = label_edges(p_edges, edges, len(pos))
             
         #Keep track of max edges for Padding
-        max_edges = max(max_edges, p_Ri.shape[1])
+        max_edges = max(max_edges, len(p_edges))
         
         #Add all of the event data to lists
         Edge_Labels.append(e_label)
         True_Ri.append(e_Ri)
         True_Ro.append(e_Ro)
-        Man_Ri.append(p_Ri)
-        Man_Ro.append(p_Ro)
+        if sparse:
+            p_senders, p_receivers = generate_edge_index(p_edges)
+            Man_Ri.append(p_receivers)
+            Man_Ro.append(p_senders)
+        else:
+            p_Ri, p_Ro = generate_incidence(p_edges, pos)
+            Man_Ri.append(p_Ri)
+            Man_Ro.append(p_Ro)
         XYZ.append(np.vstack((event.X, event.Y, event.Z)).T)
         Type.append(2*(event.Type=='m')+(event.Type=='p'))
         Energy.append(event.E)
@@ -84,17 +145,25 @@ def vectorize_data(eventArr):
     #Padding based on Max Hits and Max Edges
     for i in range(len(Edge_Labels)):
         Edge_Labels[i] = pad(Edge_Labels[i],(max_edges,))
-        Man_Ri[i] = pad(Man_Ri[i],(max_hits,max_edges))
-        Man_Ro[i] = pad(Man_Ro[i],(max_hits,max_edges))
+        if not sparse:
+            Man_Ri[i] = pad(Man_Ri[i],(max_hits,max_edges))
+            Man_Ro[i] = pad(Man_Ro[i],(max_hits,max_edges))
         XYZ[i] = pad(XYZ[i],(max_hits,3))
         Type[i] = pad(Type[i],(max_hits,))
         Energy[i] = pad(Energy[i],(max_hits,))
     
-    return np.array(Edge_Labels, dtype=np.float32), np.array(Man_Ri, dtype=np.float32), np.array(Man_Ro, dtype=np.float32), np.array(XYZ, dtype=np.float32), np.array(Type, dtype=np.float32), np.array(Energy, dtype=np.float32), np.array(GammaEnergy, dtype=np.float32), True_Ri, True_Ro
+    if not sparse:
+        Man_Ri = np.array(Man_Ri, dtype=np.float32)
+        Man_Ro = np.array(Man_Ro, dtype=np.float32)
+    
+    return np.array(Edge_Labels, dtype=np.float32), Man_Ri, Man_Ro, np.array(XYZ, dtype=np.float32), np.array(Type, dtype=np.float32), np.array(Energy, dtype=np.float32), np.array(GammaEnergy, dtype=np.float32), True_Ri, True_Ro
 
-def generate_dataset(TrainingDataSets):
-    Edge_Labels, Man_Ri, Man_Ro, XYZ, Type, Energy, GammaEnergy, True_Ri, True_Ro = vectorize_data(TrainingDataSets)
-    features = [[XYZ[i], Man_Ri[i], Man_Ro[i]] for i in range(XYZ.shape[0])]
+def generate_dataset(TrainingDataSets, sparse=False):
+    Edge_Labels, Man_Ri, Man_Ro, XYZ, Type, Energy, GammaEnergy, True_Ri, True_Ro = vectorize_data(TrainingDataSets, sparse)
     labels = Edge_Labels
-    dataset = [[features[i],labels[i]] for i in range(XYZ.shape[0])]
-    return dataset, Edge_Labels, True_Ri, True_Ro
\ No newline at end of file
+    if sparse:
+        dataset = SparseGraphDataset(XYZ, Man_Ro, Man_Ri, labels)
+    else:
+        features = [[XYZ[i], Man_Ri[i], Man_Ro[i]] for i in range(XYZ.shape[0])]
+        dataset = [[features[i],labels[i]] for i in range(XYZ.shape[0])]
+    return dataset, Edge_Labels, True_Ri, True_Ro
@@ -1,4 +1,8 @@
+import multiprocessing as mp
+
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 import numpy as np
 
 def add_arrow(line, position=None, direction='right', size=15, color=None):
@@ -73,19 +77,104 @@ def filter_position(pos):
     Filters out padded rows
     """
     pos = np.array(pos)
-    new_pos = []
-    for i in range(len(pos)):
-        row = pos[i]
-        print
-        if not np.any(row):
-            if i == len(pos) - 1: # last point
-                break
-            elif not np.any(pos[i+1]): # next point is also zero
-                break
-        new_pos.append(row)
-    
-    new_pos = np.array(new_pos)
-    return new_pos
+    # The padding starts at the first zero row which is the last row or followed by another zero row
+    zero = ~np.any(pos, axis=1)
+    end = zero & np.append(zero[1:], True)
+    if np.any(end):
+        pos = pos[:np.argmax(end)]
+    return pos
+
+
+def edge_endpoints(Rin, Rout):
+    """
+    Sender and receiver hit of all edges which are not padding, and the indices of these edges
+    """
+    Rin = np.asarray(Rin)
+    Rout = np.asarray(Rout)
+    edges = np.nonzero(Rin.sum(axis=0) != 0)[0]
+    return np.argmax(Rout[:, edges], axis=0), np.argmax(Rin[:, edges], axis=0), edges
+
+
+def edge_classes(edges, predicted_edges, generated_edges):
+    """
+    The edges of each color of edge_color as (color, edge mask) pairs
+    """
+    predicted = np.asarray(predicted_edges)[edges] == True
+    generated = np.asarray(generated_edges)[edges] == True
+    return [('green', predicted & generated), ('red', predicted & ~generated), ('purple', ~predicted & generated)]
+
+
+def draw_edges_2d(ax, pos, senders, receivers, color, axis=(0, 1), arrow=True):
+    """
+    Draw all edges of one color as one artist: arrows (quiver) or a LineCollection
+    """
+    if len(senders) == 0:
+        return
+    ptA = pos[senders][:, list(axis)]
+    ptB = pos[receivers][:, list(axis)]
+    if arrow:
+        ax.quiver(ptA[:, 0], ptA[:, 1], ptB[:, 0] - ptA[:, 0], ptB[:, 1] - ptA[:, 1],
+                  scale=1, angles='xy', scale_units='xy', color=color)
+    else:
+        ax.add_collection(LineCollection(np.stack((ptA, ptB), axis=1), colors=color))
+
+
+def draw_edges_3d(ax, pos, senders, receivers, color, arrow=False):
+    """
+    Draw all edges of one color as one artist: arrows (quiver) or a Line3DCollection
+    """
+    if len(senders) == 0:
+        return
+    ptA = pos[senders]
+    ptB = pos[receivers]
+    if arrow:
+        ax.quiver(ptA[:, 0], ptA[:, 1], ptA[:, 2], ptB[:, 0] - ptA[:, 0], ptB[:, 1] - ptA[:, 1], ptB[:, 2] - ptA[:, 2],
+                  color=color, arrow_length_ratio=0.05)
+    else:
+        ax.add_collection3d(Line3DCollection(np.stack((ptA, ptB), axis=1), colors=color))
+
+
+def draw_graph_2d(ax, pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro, axis=(0, 1), arrow=True):
+    """
+    Hits, classified edges and script errors of one event in the projection on axis
+    """
+    pos = np.asarray(pos)
+    new_pos = filter_position(pos)
+    ax.scatter(new_pos[:, axis[0]], new_pos[:, axis[1]])
+
+    senders, receivers, edges = edge_endpoints(Rin, Rout)
+    for color, mask in edge_classes(edges, predicted_edges, generated_edges):
+        draw_edges_2d(ax, pos, senders[mask], receivers[mask], color, axis, arrow)
+
+    # Script error
+    pt_indices = compare_True_Manual_edges(Rin, Rout, True_Ri, True_Ro)
+    draw_edges_2d(ax, pos, pt_indices[:, 0], pt_indices[:, 1], "orange", axis, arrow)
+
+    x_label = GraphVisualizer.axis_dictionary[axis[0]]
+    y_label = GraphVisualizer.axis_dictionary[axis[1]]
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.set_title(x_label+y_label+" plot")
+    # Collections do not update the data limits
+    ax.autoscale_view()
+
+
+def draw_graph_3d(ax, pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro, arrow=False, error_arrow=None):
+    """
+    Hits, classified edges and script errors of one event in 3D.
+    The script errors are drawn with arrows if error_arrow is True, by default like the other edges.
+    """
+    pos = np.asarray(pos)
+    new_pos = filter_position(pos)
+    ax.scatter(new_pos[:, 0], new_pos[:, 1], new_pos[:, 2])
+
+    senders, receivers, edges = edge_endpoints(Rin, Rout)
+    for color, mask in edge_classes(edges, predicted_edges, generated_edges):
+        draw_edges_3d(ax, pos, senders[mask], receivers[mask], color, arrow)
+
+    # Script error
+    pt_indices = compare_True_Manual_edges(Rin, Rout, True_Ri, True_Ro)
+    draw_edges_3d(ax, pos, pt_indices[:, 0], pt_indices[:, 1], "orange", arrow if error_arrow is None else error_arrow)
 
 
 """
@@ -96,41 +185,7 @@ axis is tuple of the 2 axis to plot
 """
 def draw_2d_plot(pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro, axis=(0, 1)):
     fig = plt.figure(figsize=(9, 9))
-    new_pos = filter_position(pos)
-    plt.scatter(new_pos[:, axis[0]], new_pos[:, axis[1]])
-    
-    num_edges = Rin.shape[1]
-    for edge_idx in range(num_edges):
-        
-        # checking if edge or padding
-        if sum(Rin[:, edge_idx]) != 0:
-            ptA_idx = np.nonzero(Rout[:, edge_idx])[0][0]
-            ptB_idx = np.nonzero(Rin[:, edge_idx])[0][0]
-            
-            ptA = np.array([pos[ptA_idx][axis[0]], pos[ptA_idx][axis[1]]])
-            ptB = np.array([pos[ptB_idx][axis[0]], pos[ptB_idx][axis[1]]])
-            
-            color = edge_color(edge_idx, predicted_edges, generated_edges)
-            if color is not None:
-#                 draw_edge_xy(ptA, ptB, color)
-                draw_vector_2d(ptA, ptB, color)
-    
-    # Script error
-    pt_indices = compare_True_Manual_edges(Rin, Rout, True_Ri, True_Ro)
-    for pair in pt_indices:
-        ptA = pos[pair[0]]
-        pointA = [ptA[axis[0]], ptA[axis[1]]]
-        ptB = pos[pair[1]]
-        pointB = [ptB[axis[0]], ptB[axis[1]]]
-#         draw_edge_xy(pointA, pointB, "orange")
-        draw_vector_2d(pointA, pointB, "orange")
-    
-    axis_dictionary = {0:'x', 1:'y', 2:'z'}
-    x_label = axis_dictionary[axis[0]]
-    y_label = axis_dictionary[axis[1]]
-    plt.xlabel(x_label)
-    plt.ylabel(y_label)
-    plt.title(x_label+y_label+" plot")
+    draw_graph_2d(fig.gca(), pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro, axis)
 
 #     plt.savefig(OutputDirectory +'/test.png')
 
@@ -142,59 +197,14 @@ predicted_edges, generated_edges is (1, max_edges), True if actually present
 def draw_3d_plot(pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro):
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
-    
-    new_pos = filter_position(pos)
-    ax.scatter(new_pos[:, 0], new_pos[:, 1], new_pos[:, 2])
-    num_edges = Rin.shape[1]
-    for edge_idx in range(num_edges):
-        
-        # checking if edge or padding
-        if sum(Rin[:, edge_idx]) != 0:
-            ptA_idx = np.nonzero(Rout[:, edge_idx])[0][0]
-            ptB_idx = np.nonzero(Rin[:, edge_idx])[0][0]
-            
-            ptA = pos[ptA_idx]
-            ptB = pos[ptB_idx]
-
-            color = edge_color(edge_idx, predicted_edges, generated_edges)
-            if color is not None:
-                draw_edge_xyz(ptA, ptB, color)
-    
-    # Script error
-    pt_indices = compare_True_Manual_edges(Rin, Rout, True_Ri, True_Ro)
-    for pair in pt_indices:
-        ptA = pos[pair[0]]
-        ptB = pos[pair[1]]
-        draw_edge_xyz(ptA, ptB, "orange")
+    draw_graph_3d(ax, pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro)
 
 
 def draw_3d_arrows(pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro):
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
-    ax.scatter(pos[:, 0], pos[:, 1], pos[:, 2])
-    num_edges = Rin.shape[1]
-    for edge_idx in range(num_edges):
-        
-        # checking if edge or padding
-        if sum(Rin[:, edge_idx]) != 0:
-            ptA_idx = np.nonzero(Rout[:, edge_idx])[0][0]
-            ptB_idx = np.nonzero(Rin[:, edge_idx])[0][0]
-            
-            ptA = pos[ptA_idx]
-            ptB = pos[ptB_idx]
-
-            color = edge_color(edge_idx, predicted_edges, generated_edges)
-            if color is not None:
-                draw_vector_3d(ptA, ptB, color)
-#                 ax.annotate("", xy=ptB, xytext=ptB-ptA, arrowprops=dict(arrowstyle="->"))
-
-    
-    # Script error
-    pt_indices = compare_True_Manual_edges(Rin, Rout, True_Ri, True_Ro)
-    for pair in pt_indices:
-        ptA = pos[pair[0]]
-        ptB = pos[pair[1]]
-        draw_edge_xyz(ptA, ptB, "orange")
+    # The script errors are plain lines here
+    draw_graph_3d(ax, pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro, arrow=True, error_arrow=False)
 
 
 '''
@@ -228,163 +238,126 @@ def edge_color(edge_idx, predicted_edges, generated_edges):
 
 
 def compare_True_Manual_edges(Man_Ri, Man_Ro, True_Ri, True_Ro):
-    pt_indices = []
-    for true_edge_idx in range(True_Ri.shape[1]):
-        ptA_idx = np.nonzero(True_Ro[:, true_edge_idx])[0][0]
-        ptB_idx = np.nonzero(True_Ri[:, true_edge_idx])[0][0]
-        
-        edge_found = False
-        
-        A_row = Man_Ro[ptA_idx]
-        for e_idx in range(len(A_row)):
-            if A_row[e_idx] == 1:
-                if Man_Ri[ptB_idx][e_idx] == 1:
-                    edge_found = True
-                    break
-        
-        if not edge_found:
-            pt_indices.append([ptA_idx, ptB_idx])
-    
-    return pt_indices
+    """
+    Returns the (sender, receiver) pairs, shape (n, 2), of the true edges which are not manually connected
+    """
+    true_out = np.argmax(np.asarray(True_Ro), axis=0)
+    true_in = np.argmax(np.asarray(True_Ri), axis=0)
+    man_out, man_in, _ = edge_endpoints(Man_Ri, Man_Ro)
+    n_hits = max(np.shape(Man_Ri)[0], np.shape(True_Ri)[0])
+    found = np.isin(true_out * n_hits + true_in, man_out * n_hits + man_in)
+    return np.stack((true_out[~found], true_in[~found]), axis=1)
+
+
+def render_view(view):
+    """
+    Draw and save one view of plot_sample, executed in the process pool
+    """
+    plt.switch_backend('Agg')
+    kind, data, option, figure_size, path = view
+    fig = plt.figure(figsize=figure_size)
+    if kind == '2d':
+        draw_graph_2d(fig.gca(), *data, axis=option)
+    else:
+        draw_graph_3d(fig.add_subplot(111, projection='3d'), *data, arrow=option)
+    fig.savefig(path)
+    plt.close(fig)
+    return path
 
 
 class GraphVisualizer(object):
     axis_dictionary = {0:'x', 1:'y', 2:'z'}
     
-    def __init__(self, summary, labels, True_Ri, True_Ro, OutputDir, figure_size=(9, 9)):
+    def __init__(self, summary, labels, True_Ri, True_Ro, OutputDir, figure_size=(9, 9), processes=4):
         self.summary = summary
         self.labels = labels
         self.True_Ri = True_Ri
         self.True_Ro = True_Ro
         self.OutputDir = OutputDir
         self.figure_size = figure_size
+        # The views of plot_sample are rendered in a pool of processes with the Agg backend
+        self.processes = processes
+        self.pool = None
         
         # default batch index
         self.batch_idx = len(summary['X']) - 1
 
-
-    def draw_2d(self, sample_idx, batch_idx=None, axis=(0,1), filename=None, save=True):
+    def n_samples(self, batch_idx=None):
+        """Number of events kept by GNNTrainer.evaluate"""
+        if batch_idx == None:
+            batch_idx = self.batch_idx
+        return len(self.summary['X'][batch_idx])
+
+    def event_index(self, sample_idx, batch_idx):
+        """Index in the test data set of a sample kept by GNNTrainer.evaluate"""
+        if 'Sample_Index' not in self.summary:
+            return sample_idx
+        return self.summary['Sample_Index'][batch_idx][sample_idx]
+
+    def sample_data(self, sample_idx, batch_idx):
+        """pos, Rin, Rout, predicted_edges, generated_edges, True_Ri, True_Ro of one sample"""
+        event_idx = self.event_index(sample_idx, batch_idx)
+        return (np.array(self.summary['X'][batch_idx][sample_idx]),
+                np.asarray(self.summary['Ri'][batch_idx][sample_idx]),
+                np.asarray(self.summary['Ro'][batch_idx][sample_idx]),
+                np.asarray(self.summary['Edge_Labels'][batch_idx][sample_idx]),
+                np.asarray(self.labels[event_idx]),
+                np.asarray(self.True_Ri[event_idx]),
+                np.asarray(self.True_Ro[event_idx]))
+
+    def draw_2d(self, sample_idx, batch_idx=None, axis=(0,1), filename=None, save=True, arrow=True):
         if batch_idx == None:
             batch_idx = self.batch_idx
-        pos = np.array(self.summary['X'][batch_idx][sample_idx]) 
-        
-        # Might want to convert everything to numpy?
-        Rin = self.summary['Ri'][batch_idx][sample_idx]
-        Rout = self.summary['Ro'][batch_idx][sample_idx]
-        predicted_edges = self.summary['Edge_Labels'][batch_idx][sample_idx]
-        generated_edges = self.labels[sample_idx]
-        True_Ri = self.True_Ri[sample_idx]
-        True_Ro = self.True_Ro[sample_idx]
-      
         fig = plt.figure(figsize=self.figure_size)
-        
-        # Filtering out padded rows, plotting points
-        new_pos = filter_position(pos)
-        plt.scatter(new_pos[:, axis[0]], new_pos[:, axis[1]])
-
-        num_edges = Rin.shape[1]
-        for edge_idx in range(num_edges):
-
-            # checking if edge or padding
-            if sum(Rin[:, edge_idx]) != 0:
-                ptA_idx = np.nonzero(Rout[:, edge_idx])[0][0]
-                ptB_idx = np.nonzero(Rin[:, edge_idx])[0][0]
-
-                ptA = np.array([pos[ptA_idx][axis[0]], pos[ptA_idx][axis[1]]])
-                ptB = np.array([pos[ptB_idx][axis[0]], pos[ptB_idx][axis[1]]])
-
-                color = edge_color(edge_idx, predicted_edges, generated_edges)
-                if color is not None:
-                    # draw_edge_xy(ptA, ptB, color)
-                    draw_vector_2d(ptA, ptB, color)
-
-        # Script error
-        pt_indices = compare_True_Manual_edges(Rin, Rout, True_Ri, True_Ro)
-        for pair in pt_indices:
-            ptA = pos[pair[0]]
-            pointA = [ptA[axis[0]], ptA[axis[1]]]
-            ptB = pos[pair[1]]
-            pointB = [ptB[axis[0]], ptB[axis[1]]]
-            # draw_edge_xy(pointA, pointB, "orange")
-            draw_vector_2d(pointA, pointB, "orange")
-
-        
-        x_label = GraphVisualizer.axis_dictionary[axis[0]]
-        y_label = GraphVisualizer.axis_dictionary[axis[1]]
-        plt.xlabel(x_label)
-        plt.ylabel(y_label)
-        plt.title(x_label+y_label+" plot")
+        draw_graph_2d(fig.gca(), *self.sample_data(sample_idx, batch_idx), axis=axis, arrow=arrow)
         
         # Saving plot
         if save:
-            if filename == None:
-                filename = "{}{}_plot_{}_{}".format(x_label, y_label, batch_idx, sample_idx)
-            plt.savefig(self.OutputDir +'/' + filename)
-    
+            fig.savefig(self.OutputDir +'/' + self.filename_2d(sample_idx, batch_idx, axis, filename))
     
     def draw_3d(self, sample_idx, batch_idx=None, filename=None, save=True, arrow=False):
         if batch_idx == None:
             batch_idx = self.batch_idx
-        pos = np.array(self.summary['X'][batch_idx][sample_idx]) 
-        
-        # Might want to convert everything to numpy?
-        Rin = self.summary['Ri'][batch_idx][sample_idx]
-        Rout = self.summary['Ro'][batch_idx][sample_idx]
-        predicted_edges = self.summary['Edge_Labels'][batch_idx][sample_idx]
-        generated_edges = self.labels[sample_idx]
-        True_Ri = self.True_Ri[sample_idx]
-        True_Ro = self.True_Ro[sample_idx]
-      
         fig = plt.figure(figsize=self.figure_size)
-        ax = fig.add_subplot(111, projection='3d')
-        
-        new_pos = filter_position(pos)
-        ax.scatter(new_pos[:, 0], new_pos[:, 1], new_pos[:, 2])
-        
-        num_edges = Rin.shape[1]
-        for edge_idx in range(num_edges):
-
-            # checking if edge or padding
-            if sum(Rin[:, edge_idx]) != 0:
-                ptA_idx = np.nonzero(Rout[:, edge_idx])[0][0]
-                ptB_idx = np.nonzero(Rin[:, edge_idx])[0][0]
-
-                ptA = pos[ptA_idx]
-                ptB = pos[ptB_idx]
-
-                color = edge_color(edge_idx, predicted_edges, generated_edges)
-                if color is not None:
-                    if arrow:
-                        draw_vector_3d(ptA, ptB, color)
-                        # ax.annotate("", xy=ptB, xytext=ptB-ptA, arrowprops=dict(arrowstyle="->"))
-                    else:
-                        draw_edge_xyz(ptA, ptB, color)
-
-
-        # Script error
-        pt_indices = compare_True_Manual_edges(Rin, Rout, True_Ri, True_Ro)
-        for pair in pt_indices:
-            ptA = pos[pair[0]]
-            ptB = pos[pair[1]]
-            if arrow:
-                draw_vector_3d(ptA, ptB, "orange")
-            else:
-                draw_edge_xyz(ptA, ptB, "orange")
+        draw_graph_3d(fig.add_subplot(111, projection='3d'), *self.sample_data(sample_idx, batch_idx), arrow=arrow)
             
         # Saving plot
         if save:
-            if filename == None:
-                filename = "3d_plot_{}_{}".format(batch_idx, sample_idx)
-            plt.savefig(self.OutputDir +'/' + filename)
+            fig.savefig(self.OutputDir +'/' + self.filename_3d(sample_idx, batch_idx, filename))
+
+    def filename_2d(self, sample_idx, batch_idx, axis, filename=None):
+        if filename == None:
+            filename = "{}{}_plot_{}_{}".format(GraphVisualizer.axis_dictionary[axis[0]], GraphVisualizer.axis_dictionary[axis[1]], batch_idx, sample_idx)
+        return filename
 
+    def filename_3d(self, sample_idx, batch_idx, filename=None):
+        if filename == None:
+            filename = "3d_plot_{}_{}".format(batch_idx, sample_idx)
+        return filename
 
     def plot_sample(self, sample_idx, batch_idx=None, save=True):
         if batch_idx == None:
             batch_idx = self.batch_idx
-        self.draw_2d(sample_idx, batch_idx=batch_idx, axis=(0, 1), save=save)
-        self.draw_2d(sample_idx, batch_idx=batch_idx, axis=(0, 2), save=save)
-        self.draw_2d(sample_idx, batch_idx=batch_idx, axis=(1, 2), save=save)
+        if not save or self.processes <= 1:
+            self.draw_2d(sample_idx, batch_idx=batch_idx, axis=(0, 1), save=save)
+            self.draw_2d(sample_idx, batch_idx=batch_idx, axis=(0, 2), save=save)
+            self.draw_2d(sample_idx, batch_idx=batch_idx, axis=(1, 2), save=save)
+            self.draw_3d(sample_idx, batch_idx=batch_idx, save=save)
+            return
         
-        self.draw_3d(sample_idx, batch_idx=batch_idx, save=save)
+        data = self.sample_data(sample_idx, batch_idx)
+        views = [('2d', data, axis, self.figure_size, self.OutputDir + '/' + self.filename_2d(sample_idx, batch_idx, axis))
+                 for axis in [(0, 1), (0, 2), (1, 2)]]
+        views.append(('3d', data, False, self.figure_size, self.OutputDir + '/' + self.filename_3d(sample_idx, batch_idx)))
+        if self.pool is None:
+            # Forked, thus the calling script is not imported again
+            self.pool = mp.get_context('fork').Pool(self.processes)
+        self.pool.map(render_view, views)
+
+    def close(self):
+        """Stop the rendering processes"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
     
-    
\ No newline at end of file
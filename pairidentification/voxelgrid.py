@@ -0,0 +1,287 @@
+###################################################################################################
+#
+# voxelgrid.py
+#
+# Copyright (C) by Andreas Zoglauer & Harrison Costatino.
+#
+# Please see the file LICENSE in the main repository for the copyright-notice.
+#
+###################################################################################################
+
+
+
+###################################################################################################
+
+
+import numpy as np
+
+
+###################################################################################################
+
+
+def flattenHitList(EventHits, Indices=None):
+  """
+  Concatenate the (x, y, z, energy) hit arrays of the selected events (all if Indices is None)
+
+  Returns
+  -------
+  numpy.ndarray
+    All hits of the selected events as one (total hits, 4) array
+  numpy.ndarray
+    Offsets: the hits of the i-th selected event are Hits[Offsets[i]:Offsets[i+1]]
+  """
+
+  if Indices is None:
+    Indices = range(len(EventHits))
+  Offsets = np.zeros(len(Indices) + 1, dtype=np.int64)
+  Offsets[1:] = np.cumsum([len(EventHits[i]) for i in Indices])
+  if Offsets[-1] == 0:
+    return np.zeros((0, 4)), Offsets
+
+  return np.concatenate([np.asarray(EventHits[i]).reshape(-1, 4) for i in Indices]), Offsets
+
+
+###################################################################################################
+
+
+def flattenEventData(Events):
+  """
+  Concatenate the hits of a list of EventData objects, i.e. of objects with X, Y, Z and E arrays
+
+  Returns
+  -------
+  numpy.ndarray
+    All hits as one (total hits, 4) array of x, y, z, energy
+  numpy.ndarray
+    Offsets: the hits of the i-th event are Hits[Offsets[i]:Offsets[i+1]]
+  """
+
+  Offsets = np.zeros(len(Events) + 1, dtype=np.int64)
+  Offsets[1:] = np.cumsum([len(e.X) for e in Events])
+  if Offsets[-1] == 0:
+    return np.zeros((0, 4)), Offsets
+
+  Hits = np.empty((Offsets[-1], 4), dtype=np.float64)
+  for a, Name in enumerate(('X', 'Y', 'Z', 'E')):
+    Hits[:, a] = np.concatenate([getattr(e, Name) for e in Events])
+
+  return Hits, Offsets
+
+
+###################################################################################################
+
+
+class VoxelGrid:
+  """
+  Bins the hits of a batch of events into a regular (XBins, YBins, ZBins) grid. All hits of the
+  batch are binned at once, from the flattened hits and their event offsets.
+
+  Attributes
+  ----------
+  Bins : tuple
+    (XBins, YBins, ZBins)
+  Ranges : tuple
+    ((XMin, XMax), (YMin, YMax), (ZMin, ZMax))
+  Binning : string
+    How the bin is computed:
+    'scaled': floor(((x - XMin) / (XMax - XMin)) * XBins)
+    'width': floor((x - XMin) / ((XMax - XMin) / XBins))
+    Both are the same bins up to rounding on the bin edges.
+  Rounding : string
+    'floor' the bin position, i.e. every hit outside [Min, Max) is outside the grid, or 'truncate'
+    it towards zero as int() in the original loops (legacy: hits up to one bin below Min end up in
+    bin 0, even with 'drop')
+  OutOfRange : string
+    'drop' hits outside the grid, or 'clip' them into the first or last bin
+  Reduction : string
+    Value of a voxel with several hits: 'sum' of the energies, their 'max', the 'count' of hits,
+    or the energy of the 'last' hit
+  DType : numpy.dtype
+    Type of the dense voxels
+
+  A typical usage would look like this:
+
+  Grid = VoxelGrid((110, 110, 48), ((-55, 55), (-55, 55), (0, 48)))
+  voxs = Grid.dense(Hits, Offsets)
+  Coordinates, Values = Grid.coo(Hits, Offsets)
+
+  """
+
+  Binnings = ('scaled', 'width')
+  Roundings = ('floor', 'truncate')
+  OutOfRangePolicies = ('drop', 'clip')
+  Reductions = ('sum', 'max', 'count', 'last')
+
+  def __init__(self, Bins, Ranges, Binning='scaled', OutOfRange='drop', Reduction='sum', DType=np.float32, Rounding='floor'):
+    if len(Bins) != 3 or len(Ranges) != 3:
+      raise ValueError("VoxelGrid: three bins and ranges required, not {} and {}".format(len(Bins), len(Ranges)))
+    if Binning not in self.Binnings:
+      raise ValueError("VoxelGrid: unknown binning {}, use one of {}".format(Binning, self.Binnings))
+    if Rounding not in self.Roundings:
+      raise ValueError("VoxelGrid: unknown rounding {}, use one of {}".format(Rounding, self.Roundings))
+    if OutOfRange not in self.OutOfRangePolicies:
+      raise ValueError("VoxelGrid: unknown out-of-range policy {}, use one of {}".format(OutOfRange, self.OutOfRangePolicies))
+    if Reduction not in self.Reductions:
+      raise ValueError("VoxelGrid: unknown reduction {}, use one of {}".format(Reduction, self.Reductions))
+
+    self.Bins = tuple(int(b) for b in Bins)
+    self.Ranges = tuple((float(r[0]), float(r[1])) for r in Ranges)
+    self.Binning = Binning
+    self.Rounding = Rounding
+    self.OutOfRange = OutOfRange
+    self.Reduction = Reduction
+    self.DType = np.dtype(DType)
+
+
+  def shape(self, NEvents):
+    """
+    Shape of the dense voxels of NEvents events: (NEvents, XBins, YBins, ZBins, 1)
+    """
+
+    return (NEvents,) + self.Bins + (1,)
+
+
+  def bins(self, Values, Axis):
+    """
+    Bin of each value along the axis (0, 1, 2), computed in double precision, before the
+    out-of-range policy is applied
+    """
+
+    Min, Max = self.Ranges[Axis]
+    Values = np.asarray(Values, dtype=np.float64)
+    if self.Binning == 'scaled':
+      Position = ((Values - Min) / (Max - Min)) * self.Bins[Axis]
+    else:
+      Position = (Values - Min) / ((Max - Min) / self.Bins[Axis])
+    if self.Rounding == 'floor':
+      Position = np.floor(Position)
+    return Position.astype(np.int64)
+
+
+  def indices(self, Hits, Offsets):
+    """
+    Linearized voxel index of the hits into the dense (events, XBins, YBins, ZBins, 1) voxels
+
+    Returns
+    -------
+    numpy.ndarray
+      The linearized indices of the kept hits
+    numpy.ndarray
+      The boolean mask of the kept hits
+    """
+
+    NEvents = len(Offsets) - 1
+    Index = np.repeat(np.arange(NEvents, dtype=np.int64), np.diff(Offsets))
+    Inside = np.ones(len(Index), dtype=bool)
+    for a in range(0, 3):
+      Bin = self.bins(Hits[:, a], a)
+      if self.OutOfRange == 'clip':
+        Bin = np.clip(Bin, 0, self.Bins[a] - 1)
+      else:
+        Inside &= (Bin >= 0) & (Bin < self.Bins[a])
+      Index = Index * self.Bins[a] + Bin
+
+    return Index[Inside], Inside
+
+
+  def scatter(self, Flat, Index, Values):
+    """
+    Reduce the values into the flat voxels at the given indices. The voxels at these indices have
+    to be zero.
+    """
+
+    if self.Reduction == 'sum':
+      np.add.at(Flat, Index, Values)
+    elif self.Reduction == 'count':
+      np.add.at(Flat, Index, 1)
+    elif self.Reduction == 'max':
+      Flat[Index] = -np.inf if np.issubdtype(Flat.dtype, np.floating) else np.iinfo(Flat.dtype).min
+      np.maximum.at(Flat, Index, Values)
+    else:
+      # The last hit per voxel: the first occurrence in the reversed order
+      Unique, First = np.unique(Index[::-1], return_index=True)
+      Flat[Unique] = Values[::-1][First]
+
+
+  def dense(self, Hits, Offsets, Out=None, ReturnInside=False):
+    """
+    Voxelize the flattened hits into a dense (events, XBins, YBins, ZBins, 1) tensor
+
+    Attributes
+    ----------
+    Hits : numpy.ndarray
+      (total hits, 4) array of x, y, z, energy
+    Offsets : numpy.ndarray
+      Hits of event i are Hits[Offsets[i]:Offsets[i+1]]
+    Out : numpy.ndarray
+      Optional buffer of the output shape, which is zeroed and reused
+    ReturnInside : bool
+      Also return the mask of the kept hits of the same binning pass, e.g. for hitsPerEvent
+
+    Returns
+    -------
+    numpy.ndarray
+      The voxels (Out if given)
+    numpy.ndarray
+      The boolean mask of the kept hits, only if ReturnInside is True
+    """
+
+    if Out is None:
+      Out = np.zeros(self.shape(len(Offsets) - 1), dtype=self.DType)
+    else:
+      Out.fill(0)
+
+    Index, Inside = self.indices(Hits, Offsets)
+    self.scatter(Out.reshape(-1), Index, Hits[Inside, 3])
+
+    if ReturnInside == True:
+      return Out, Inside
+    return Out
+
+
+  def coo(self, Hits, Offsets):
+    """
+    Voxelize the flattened hits into the list of the occupied voxels
+
+    Returns
+    -------
+    numpy.ndarray
+      (occupied voxels, 4) int64 array of (event, x bin, y bin, z bin), sorted
+    numpy.ndarray
+      The value of each occupied voxel
+    """
+
+    Index, Inside = self.indices(Hits, Offsets)
+    Energies = Hits[Inside, 3]
+    Voxels, Inverse = np.unique(Index, return_inverse=True)
+    Inverse = Inverse.reshape(-1)
+
+    if self.Reduction == 'sum':
+      Values = np.bincount(Inverse, weights=Energies, minlength=len(Voxels))
+    elif self.Reduction == 'count':
+      Values = np.bincount(Inverse, minlength=len(Voxels))
+    elif self.Reduction == 'max':
+      Values = np.full(len(Voxels), -np.inf)
+      np.maximum.at(Values, Inverse, Energies)
+    else:
+      # The unique indices of the reversed order are the occupied voxels again
+      First = np.unique(Index[::-1], return_index=True)[1]
+      Values = Energies[::-1][First]
+
+    Coordinates = np.stack(np.unravel_index(Voxels, (len(Offsets) - 1,) + self.Bins), axis=1)
+
+    return Coordinates, Values.astype(self.DType)
+
+
+  def hitsPerEvent(self, Offsets, Inside):
+    """
+    Number of kept hits of each event, from the mask returned by indices
+    """
+
+    Kept = np.zeros(len(Inside) + 1, dtype=np.int64)
+    np.cumsum(Inside, out=Kept[1:])
+    return Kept[Offsets[1:]] - Kept[Offsets[:-1]]
+
+
+# END
+###################################################################################################
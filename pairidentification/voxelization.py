@@ -0,0 +1,72 @@
+"""
+This module implements the vectorized voxelization of the pair events for the 3D CNN in
+PairIdentification.py: all hits of a batch are binned at once instead of hit by hit.
+"""
+
+# Externals
+import numpy as np
+
+from voxelgrid import VoxelGrid, flattenEventData
+
+def voxel_index(values, v_min, v_max, n_bins):
+    """
+    Bin of each value, computed like int((value - v_min) / ((v_max - v_min) / n_bins)),
+    i.e. truncated towards zero as in the original loops
+    """
+    return ((values - v_min) / ((v_max - v_min) / n_bins)).astype(np.int64)
+
+def voxelize_events(events, bins, ranges, out=None, accumulate=True):
+    """
+    Voxelize the hit energies of a list of events into a tensor of shape
+    (len(events), XBins, YBins, ZBins, 1). Hits outside the ranges are dropped.
+    bins is (XBins, YBins, ZBins), ranges is ((XMin, XMax), (YMin, YMax), (ZMin, ZMax)).
+    With accumulate the energies of hits in the same voxel are summed (np.add.at),
+    otherwise the last hit in the voxel is kept, as in the original loops.
+    If out is given, it is zeroed and filled instead of allocating a new tensor.
+    """
+    grid = VoxelGrid(bins, ranges, Binning='width', OutOfRange='drop',
+                     Reduction='sum' if accumulate else 'last', DType=np.float32)
+    hits, offsets = flattenEventData(events)
+    return grid.dense(hits, offsets, out)
+
+def layer_labels(events, z_min, z_max, z_bins):
+    """
+    One-hot layer of the pair origin of each event, the last bin if it is outside (z_min, z_max)
+    """
+    z = np.array([e.OriginPositionZ for e in events], dtype=np.float64)
+    labels = np.zeros(shape=(len(events), z_bins))
+    inside = (z > z_min) & (z < z_max)
+    layer = np.full(len(events), z_bins - 1, dtype=np.int64)
+    layer[inside] = voxel_index(z[inside], z_min, z_max, z_bins)
+    labels[np.arange(len(events)), layer] = 1
+    return labels
+
+def gamma_energies(events):
+    """
+    Gamma energy of each event as (len(events), 1) tensor
+    """
+    return np.array([e.GammaEnergy for e in events], dtype=np.float64).reshape(-1, 1)
+
+class VoxelBatchCache(object):
+    """
+    Keeps the voxelized batches of a Keras Sequence in memory, so that they are only computed
+    in the first epoch. At most max_batches batches are kept, later batches are recomputed.
+    """
+    def __init__(self, max_batches):
+        self.max_batches = max_batches
+        self.batches = {}
+
+    def get(self, idx, make_batch):
+        if idx in self.batches:
+            return self.batches[idx]
+        batch = make_batch(idx)
+        if len(self.batches) < self.max_batches:
+            self.batches[idx] = batch
+        return batch
+
+    def nbytes(self):
+        """Memory of the cached tensors"""
+        total = 0
+        for (inputs, labels) in self.batches.values():
+            total += sum(a.nbytes for a in inputs) + labels.nbytes
+        return total